@@ -1,22 +1,31 @@
 """Main entry point for the Collectify application."""
 from config import create_app
 from models import db
-from utils.database import ensure_db_initialized
+from utils.database import ensure_db_initialized, configure_sqlite_engine
 from routes.frontend import register_frontend_routes
 from routes.categories import register_category_routes
 from routes.items import register_item_routes
+from routes.export import register_export_routes
+from routes.uploads import register_upload_routes
 from flask_cli import register_commands
+from utils.render_cache import configure_render_cache
+from utils.upload_gc import configure_upload_gc
 
 # Create the Flask application
 app = create_app()
 
 # Initialize the database with our app
 db.init_app(app)
+configure_sqlite_engine(app)
+configure_render_cache(app)
+configure_upload_gc(app)
 
 # Register all routes
 register_frontend_routes(app)
 register_category_routes(app)
 register_item_routes(app)
+register_export_routes(app)
+register_upload_routes(app)
 
 # Using Flask's event system instead of before_first_request (which is removed in Flask 3.x)
 # This will run when the first request is received
@@ -0,0 +1,121 @@
+"""Compare query plans and timings before and after the index migrations.
+
+Builds a database with the pre-migration schema (no indexes on foreign keys
+or item names), fills it with synthetic rows, then prints EXPLAIN QUERY PLAN
+output and the median runtime of the hot queries before and after running
+the versioned migrations in utils.migrations.
+
+Usage:
+    python benchmarks/bench_query_plans.py [--items 50000] [--runs 20]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.migrations import upgrade_database_file  # noqa: E402
+
+LEGACY_SCHEMA = """
+CREATE TABLE categories (
+    id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, specifications_schema TEXT, created_at DATETIME
+);
+CREATE TABLE category_specifications (
+    id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL REFERENCES categories (id), key VARCHAR NOT NULL,
+    label VARCHAR, type VARCHAR, placeholder VARCHAR, display_order INTEGER, options TEXT,
+    min_value FLOAT, max_value FLOAT, step_value FLOAT
+);
+CREATE TABLE items (
+    id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL REFERENCES categories (id), name VARCHAR NOT NULL,
+    brand VARCHAR NOT NULL, serial_number VARCHAR, form_factor VARCHAR, description TEXT,
+    specification_values TEXT
+);
+CREATE TABLE item_photos (
+    id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL REFERENCES items (id), file_path VARCHAR NOT NULL,
+    filename VARCHAR, is_primary BOOLEAN
+);
+CREATE TABLE item_urls (
+    id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL REFERENCES items (id), url VARCHAR NOT NULL
+);
+"""
+
+QUERIES = [
+    ('Items of a category, ordered by name',
+     "SELECT id, name FROM items WHERE category_id = 3 ORDER BY name COLLATE NOCASE, id LIMIT 50"),
+    ('First page of all items',
+     "SELECT id, name FROM items ORDER BY name COLLATE NOCASE, id LIMIT 50"),
+    ('Keyset page after a cursor',
+     "SELECT id, name FROM items WHERE name COLLATE NOCASE >= 'item 5' AND (name COLLATE NOCASE, id) > ('item 5', 0) "
+     "ORDER BY name COLLATE NOCASE, id LIMIT 50"),
+    ('Photos of a page of items (selectinload)',
+     "SELECT id, item_id, file_path FROM item_photos WHERE item_id IN (10, 20, 30, 40, 50)"),
+    ('URLs of a page of items (selectinload)',
+     "SELECT id, item_id, url FROM item_urls WHERE item_id IN (10, 20, 30, 40, 50)"),
+    ('Specifications of a category',
+     "SELECT id, key FROM category_specifications WHERE category_id = 3 ORDER BY display_order"),
+]
+
+
+def seed(conn, item_count, category_count=20):
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO categories (id, name) VALUES (?, ?)",
+                     [(c, f'Category {c}') for c in range(1, category_count + 1)])
+    conn.executemany(
+        "INSERT INTO category_specifications (category_id, key, label, type, display_order) VALUES (?, ?, ?, ?, ?)",
+        [(c, f'spec{s}', f'Spec {s}', 'number', s) for c in range(1, category_count + 1) for s in range(5)])
+    conn.executemany(
+        "INSERT INTO items (id, category_id, name, brand, specification_values) VALUES (?, ?, ?, ?, ?)",
+        [(i, i % category_count + 1, f'Item {i * 7919 % item_count}', 'Brand', '{"spec0": "1"}')
+         for i in range(1, item_count + 1)])
+    conn.executemany("INSERT INTO item_photos (item_id, file_path) VALUES (?, ?)",
+                     [(i, f'item_{i}_{p}.jpg') for i in range(1, item_count + 1) for p in range(3)])
+    conn.executemany("INSERT INTO item_urls (item_id, url) VALUES (?, ?)",
+                     [(i, f'https://example.com/{i}') for i in range(1, item_count + 1)])
+    conn.commit()
+
+
+def measure(conn, runs):
+    for title, sql in QUERIES:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            conn.execute(sql).fetchall()
+            timings.append(time.perf_counter() - start)
+        print(f"  {title}: {statistics.median(timings) * 1000:.3f} ms")
+        for step in plan:
+            print(f"      {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=50000, help='Number of items to generate')
+    parser.add_argument('--runs', type=int, default=20, help='Runs per query (the median is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(db_path)
+        print(f"Seeding {args.items} items...")
+        seed(conn, args.items)
+
+        print("\nBefore migrations:")
+        measure(conn, args.runs)
+        conn.close()
+
+        applied = upgrade_database_file(db_path)
+        print(f"\nApplied migrations: {', '.join(str(version) for version, _ in applied)}")
+
+        conn = sqlite3.connect(db_path)
+        print("\nAfter migrations:")
+        measure(conn, args.runs)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Compare ORM and column-projection serialization of item lists.
+
+Seeds a temporary database, then times serializing every item with
+``Item.to_dict()`` on eagerly loaded ORM instances (the previous list path)
+against utils.serialization.serialize_items(), and checks that both produce
+the same output.
+
+Usage:
+    python benchmarks/bench_serialization.py [--items 10000 100000] [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import create_app  # noqa: E402
+from models import db, Item, Category, CategorySpecification, ItemPhoto, ItemUrl  # noqa: E402
+from utils.helpers import item_list_options  # noqa: E402
+from utils.pagination import item_sort_columns  # noqa: E402
+from utils.serialization import serialize_items  # noqa: E402
+
+
+def seed(item_count, category_count=20):
+    categories = [{'id': c, 'name': f'Category {c}'} for c in range(1, category_count + 1)]
+    db.session.execute(Category.__table__.insert(), categories)
+    db.session.execute(CategorySpecification.__table__.insert(), [
+        {'category_id': c, 'key': f'spec{s}', 'label': f'Spec {s}', 'type': 'text', 'display_order': s}
+        for c in range(1, category_count + 1) for s in range(5)
+    ])
+    specs = json.dumps({f'spec{s}': f'value {s}' for s in range(5)})
+    db.session.execute(Item.__table__.insert(), [
+        {'id': i, 'category_id': i % category_count + 1, 'name': f'Item {i}', 'brand': 'Brand',
+         'serial_number': f'SN{i}', 'description': 'Synthetic item', 'specification_values': specs}
+        for i in range(1, item_count + 1)
+    ])
+    db.session.execute(ItemPhoto.__table__.insert(), [
+        {'item_id': i, 'file_path': f'item_{i}_{p}.jpg'} for i in range(1, item_count + 1) for p in range(3)
+    ])
+    db.session.execute(ItemUrl.__table__.insert(), [
+        {'item_id': i, 'url': f'https://example.com/{i}/{u}'} for i in range(1, item_count + 1) for u in range(2)
+    ])
+    db.session.commit()
+
+
+def orm_path():
+    query = Item.query.options(*item_list_options()).order_by(*item_sort_columns())
+    return [item.to_dict() for item in query.all()]
+
+
+def projection_path():
+    return serialize_items(Item.query.order_by(*item_sort_columns()))
+
+
+def timed(func, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def bench(item_count, runs):
+    app = create_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            seed(item_count)
+
+            orm_time, orm_result = timed(orm_path, runs)
+            projection_time, projection_result = timed(projection_path, runs)
+            assert orm_result == projection_result, 'Serialization paths disagree'
+
+            print(f"{item_count:>8} items   to_dict: {orm_time:7.3f} s   "
+                  f"projection: {projection_time:7.3f} s   speedup: {orm_time / projection_time:4.1f}x")
+            db.session.remove()
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[10000, 100000], help='Item counts to test')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per path (the median is reported)')
+    args = parser.parse_args()
+
+    for item_count in args.items:
+        bench(item_count, args.runs)
+
+
+if __name__ == '__main__':
+    main()
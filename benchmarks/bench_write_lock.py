@@ -0,0 +1,198 @@
+"""Compare how long photo uploads hold the SQLite write lock.
+
+Several threads add items with one photo each while a probe thread keeps
+making tiny writes, against a file database in WAL mode. Two upload paths
+are timed:
+
+* ``inline``: the previous route code, which flushed the item (taking the
+  write lock) and then saved the photo file before committing.
+* ``staged``: utils.photo_storage.attach_photo(), which stages the file
+  before the transaction and renames it into place after the commit.
+
+Both read the same photo bytes from a stream throttled to ``--disk-mbps``
+to stand in for slow storage, so the I/O is identical; only where it
+happens relative to the transaction differs. Reported are the time each
+upload transaction held the lock and the latency of the probe's writes,
+which queue behind it.
+
+Usage:
+    python benchmarks/bench_write_lock.py [--writers 4] [--uploads 10] [--photo-kb 4096] [--disk-mbps 50]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from PIL import Image  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from werkzeug.datastructures import FileStorage  # noqa: E402
+from config import create_app  # noqa: E402
+from models import db, Category, Item, ItemPhoto  # noqa: E402
+from utils.database import configure_sqlite_engine  # noqa: E402
+from utils.photo_storage import allowed_upload, attach_photo  # noqa: E402
+
+READ_SIZE = 64 * 1024
+
+
+class ThrottledStream(io.RawIOBase):
+    """Readable stream of data delivered at no more than mbps megabytes per second."""
+
+    def __init__(self, data, mbps):
+        self.data = memoryview(data)
+        self.position = 0
+        self.seconds_per_byte = 1 / (mbps * 1024 * 1024) if mbps else 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data[self.position:self.position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        time.sleep(len(chunk) * self.seconds_per_byte)
+        return len(chunk)
+
+
+def noise_jpeg(size_kb):
+    """A JPEG of random noise of roughly size_kb KiB, so thumbnails get made as for real photos."""
+    width = 512
+    while True:
+        buffer = io.BytesIO()
+        Image.effect_noise((width, width * 3 // 4), 64).convert('RGB').save(buffer, 'JPEG', quality=95)
+        if buffer.tell() >= size_kb * 1024 or width >= 8192:
+            return buffer.getvalue()
+        width = int(width * 1.4)
+
+
+def inline_upload(category_id, upload_folder, stream, name):
+    item = Item(category_id=category_id, name=name, brand='Bench')
+    db.session.add(item)
+    db.session.flush()
+    filename = f'item_{item.id}_{name}.jpg'
+    with open(os.path.join(upload_folder, filename), 'wb') as f:
+        while chunk := stream.read(READ_SIZE):
+            f.write(chunk)
+    item.photos.append(ItemPhoto(file_path=filename))
+    db.session.commit()
+
+
+def staged_upload(category_id, upload_folder, stream, name):
+    item = Item(category_id=category_id, name=name, brand='Bench')
+    db.session.add(item)
+    file = FileStorage(stream, filename=f'{name}.jpg')
+    if allowed_upload(file):
+        attach_photo(item, file)
+    db.session.commit()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(mode, args):
+    upload = {'inline': inline_upload, 'staged': staged_upload}[mode]
+    app = create_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app.config['UPLOAD_FOLDER'] = os.path.join(tmp, 'uploads')
+        os.makedirs(app.config['UPLOAD_FOLDER'])
+        db.init_app(app)
+        configure_sqlite_engine(app)
+
+        photo = noise_jpeg(args.photo_kb)
+        lock_times = []
+        probe_latencies = []
+        local = threading.local()
+
+        with app.app_context():
+            db.create_all()
+            category = Category(name='Bench')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+
+            # The write lock is taken by a transaction's first write and held until it ends
+            @event.listens_for(db.engine, 'before_cursor_execute')
+            def first_write(conn, cursor, statement, parameters, context, executemany):
+                if getattr(local, 'locked_at', None) is None and \
+                        statement.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+                    local.locked_at = time.perf_counter()
+
+            @event.listens_for(db.engine, 'commit')
+            def released(conn):
+                if getattr(local, 'locked_at', None) is not None:
+                    local.lock_time = time.perf_counter() - local.locked_at
+                local.locked_at = None
+
+        def writer(index):
+            with app.app_context():
+                for n in range(args.uploads):
+                    stream = io.BufferedReader(ThrottledStream(photo, args.disk_mbps))
+                    upload(category_id, app.config['UPLOAD_FOLDER'], stream, f'w{index}_{n}')
+                    lock_times.append(local.lock_time)
+                db.session.remove()
+
+        done = threading.Event()
+
+        def probe():
+            with app.app_context():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    db.session.execute(Category.__table__.update()
+                                       .where(Category.__table__.c.id == category_id)
+                                       .values(name='Bench'))
+                    db.session.commit()
+                    probe_latencies.append(time.perf_counter() - start)
+                    time.sleep(0.005)
+                db.session.remove()
+
+        probe_thread = threading.Thread(target=probe)
+        writers = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+        start = time.perf_counter()
+        probe_thread.start()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        probe_thread.join()
+
+        with app.app_context():
+            photos = ItemPhoto.query.count()
+            db.session.remove()
+            db.engine.dispose()
+
+    uploads = args.writers * args.uploads
+    assert photos == uploads, f'{photos} photos stored, expected {uploads}'
+    print(f"{mode:>7}: lock held p50 {statistics.median(lock_times) * 1000:7.1f} ms  "
+          f"max {max(lock_times) * 1000:7.1f} ms   "
+          f"probe write p50 {statistics.median(probe_latencies) * 1000:7.1f} ms  "
+          f"p95 {percentile(probe_latencies, 0.95) * 1000:7.1f} ms  "
+          f"max {max(probe_latencies) * 1000:7.1f} ms   "
+          f"{uploads / elapsed:6.1f} uploads/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4, help='Concurrent uploading threads')
+    parser.add_argument('--uploads', type=int, default=10, help='Uploads per thread')
+    parser.add_argument('--photo-kb', type=int, default=4096, help='Size of each photo in KiB')
+    parser.add_argument('--disk-mbps', type=float, default=50,
+                        help='Throughput of the simulated storage in MB/s (0: unthrottled)')
+    args = parser.parse_args()
+
+    for mode in ('inline', 'staged'):
+        bench(mode, args)
+
+
+if __name__ == '__main__':
+    main()
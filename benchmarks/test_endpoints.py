@@ -0,0 +1,75 @@
+"""Benchmarks of the key read and write paths (see conftest.py for options)."""
+import io
+import pytest
+from PIL import Image
+from models import db, Category, Item
+from utils.helpers import item_detail_options
+from utils.render_cache import render_cache
+
+
+def _get(client, url):
+    def fetch():
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        response.close()
+    return fetch
+
+
+@pytest.mark.parametrize('query', ['', 'limit=50', 'category_id=1', 'category_id=1&spec.year__gte=1990'],
+                         ids=['all', 'page', 'category', 'category_spec'])
+def test_list_items(bench, bench_client, query):
+    bench(_get(bench_client, f'/api/items?{query}'))
+
+
+def test_list_categories(bench, bench_client):
+    bench(_get(bench_client, '/api/categories'))
+
+
+@pytest.mark.parametrize('query', ['', 'search=vintage'], ids=['all', 'search'])
+@pytest.mark.parametrize('cached', [False, True], ids=['render', 'cached'])
+def test_index_page(bench, bench_client, query, cached):
+    max_bytes = render_cache.max_bytes
+    render_cache.clear()
+    if not cached:
+        render_cache.max_bytes = 0
+    try:
+        bench(_get(bench_client, f'/?{query}'), runs=None if cached else 5)
+    finally:
+        render_cache.max_bytes = max_bytes
+
+
+def test_item_to_dict(bench, bench_app):
+    with bench_app.app_context():
+        items = Item.query.options(*item_detail_options()).order_by(Item.id).limit(100).all()
+        bench(lambda: [item.to_dict() for item in items])
+        db.session.remove()
+
+
+def test_set_specifications_schema(bench, bench_app):
+    with bench_app.app_context():
+        category_id = db.session.execute(db.select(Category.id).order_by(Category.id)).scalar()
+        schema = db.session.get(Category, category_id).to_dict()['specifications']
+
+        def replace_schema():
+            category = db.session.get(Category, category_id)
+            category.set_specifications_schema(schema)
+            db.session.flush()
+            db.session.rollback()
+        bench(replace_schema)
+        db.session.remove()
+
+
+def test_photo_upload(bench, bench_client, pytestconfig):
+    # A distinct photo per run (and warm-up run), so that each one is stored and resized anew
+    photos = []
+    for n in range(pytestconfig.getoption('bench_runs') + 2):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), (n % 256, n // 256 % 256, 128)).save(buffer, 'JPEG', quality=90)
+        photos.append(buffer.getvalue())
+
+    def upload():
+        response = bench_client.post('/api/items/1/photos',
+                                     data={'photos[]': (io.BytesIO(photos.pop()), 'photo.jpg')},
+                                     content_type='multipart/form-data')
+        assert response.status_code == 201, response.status_code
+    bench(upload)
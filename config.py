@@ -1,6 +1,60 @@
 """Configuration module for the Flask application."""
 import os
 from flask import Flask
+from utils.metrics import configure_metrics
+from utils.query_stats import configure_query_stats
+from utils.static_files import configure_static_files
+from utils.uploads import configure_uploads
+
+# PRAGMAs applied to every SQLite connection (see utils.database.configure_sqlite_engine),
+# each overridable through the environment variable of the same name
+SQLITE_PRAGMA_DEFAULTS = {
+    # Wait up to this many milliseconds for a lock instead of failing with "database is locked"
+    'SQLITE_BUSY_TIMEOUT': '5000',
+    # Write-ahead logging lets readers proceed while a writer commits
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    # NORMAL is durable against application crashes in WAL mode and avoids an fsync per commit
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    # Bytes of the database file to memory-map (0 disables)
+    'SQLITE_MMAP_SIZE': str(256 * 1024 * 1024),
+    # Page cache per connection; negative values are KiB (-65536 = 64 MiB)
+    'SQLITE_CACHE_SIZE': '-65536',
+    'SQLITE_TEMP_STORE': 'MEMORY',
+    'SQLITE_FOREIGN_KEYS': 'ON',
+}
+
+_PRAGMA_CHOICES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'foreign_keys': {'ON', 'OFF'},
+}
+
+def sqlite_pragmas_from_env(environ=None):
+    """Build the ordered {pragma: value} dict for SQLite connections.
+    
+    Values come from SQLITE_* environment variables, falling back to
+    SQLITE_PRAGMA_DEFAULTS. An empty variable leaves that pragma at SQLite's
+    own default. Raises ValueError for values that are not valid for the pragma.
+    """
+    environ = os.environ if environ is None else environ
+    pragmas = {}
+    for variable, default in SQLITE_PRAGMA_DEFAULTS.items():
+        value = environ.get(variable, default).strip()
+        if not value:
+            continue
+        pragma = variable[len('SQLITE_'):].lower()
+        if pragma in _PRAGMA_CHOICES:
+            value = value.upper()
+            if value not in _PRAGMA_CHOICES[pragma]:
+                raise ValueError(f"{variable} must be one of {', '.join(sorted(_PRAGMA_CHOICES[pragma]))}")
+        else:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"{variable} must be an integer")
+        pragmas[pragma] = value
+    return pragmas
 
 def create_app():
     """Create and configure the Flask application."""
@@ -16,12 +70,41 @@ def create_app():
     
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(data_dir, 'collectibles.db')}"
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_PRAGMAS'] = sqlite_pragmas_from_env()
+    # Byte budget of the rendered index page/fragment cache per process (0 disables it)
+    app.config['RENDER_CACHE_MAX_BYTES'] = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
     app.config['UPLOAD_FOLDER'] = os.path.join(data_dir, 'uploads')
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+    # Request bodies and uploaded files over these sizes are refused with 413 (see utils.uploads)
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+    app.config['MAX_UPLOAD_FILE_SIZE'] = int(os.environ.get('MAX_UPLOAD_FILE_SIZE', 20 * 1024 * 1024))
+    # Bulk imports are streamed, so they may be far larger than other requests
+    app.config['IMPORT_MAX_CONTENT_LENGTH'] = int(os.environ.get('IMPORT_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
+    # Per-request statement counts and DB time in a Server-Timing header, and a warning
+    # when one statement shape repeats this many times in a request (see utils.query_stats)
+    app.config['QUERY_STATS'] = os.environ.get('QUERY_STATS', '1').lower() in ('1', 'true', 'yes')
+    app.config['QUERY_REPEAT_THRESHOLD'] = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 10))
+    # Prometheus metrics at /metrics, shared by worker processes through files in
+    # METRICS_DIR (see utils.metrics; gunicorn_config.py sets one per server start)
+    app.config['METRICS'] = os.environ.get('METRICS', '1').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or None
+    # Let a front proxy send uploaded files (see utils.static_files): the prefix of an
+    # internal nginx location mapped to the upload folder, or X-Sendfile for Apache/lighttpd
+    app.config['UPLOAD_ACCEL_REDIRECT'] = os.environ.get('UPLOAD_ACCEL_REDIRECT') or None
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    # Orphaned upload collection (see utils.upload_gc): background sweep interval in
+    # seconds (0 disables), minimum age of removed files, and expiry of unfinished resumable uploads
+    app.config['UPLOAD_GC_INTERVAL'] = int(os.environ.get('UPLOAD_GC_INTERVAL', 0))
+    app.config['UPLOAD_GC_GRACE_PERIOD'] = int(os.environ.get('UPLOAD_GC_GRACE_PERIOD', 60 * 60))
+    app.config['RESUMABLE_UPLOAD_MAX_AGE'] = int(os.environ.get('RESUMABLE_UPLOAD_MAX_AGE', 7 * 24 * 60 * 60))
     
     # Ensure uploads directory exists
     uploads_dir = os.path.join(data_dir, 'uploads')
     if not os.path.exists(uploads_dir):
         os.makedirs(uploads_dir)
     
+    configure_uploads(app)
+    configure_static_files(app)
+    configure_query_stats(app)
+    configure_metrics(app)
     return app
@@ -3,7 +3,15 @@ import click
 import socket
 import ipaddress
 from flask.cli import with_appcontext
-from utils.database import init_db, ensure_db_initialized
+from utils.database import init_db, ensure_db_initialized, rebuild_spec_value_index, sqlite_pragma_report
+from utils.search import rebuild_search_index
+from utils.migrations import upgrade_app_database, app_database_version, latest_version
+from utils.bulk_import import DEFAULT_CHUNK_SIZE, FORMATS as IMPORT_FORMATS, import_items
+from utils.export import FORMATS as EXPORT_FORMATS, iter_export
+from utils.thumbnails import rebuild_thumbnails
+from utils.photo_storage import migrate_flat_uploads
+from utils.upload_gc import KINDS as GC_KINDS, collect_orphan_uploads
+from utils.seed import DEFAULT_CHUNK_SIZE as SEED_CHUNK_SIZE, DEFAULT_PHOTO_POOL, seed_collection
 
 def register_commands(app):
     """Register custom Flask CLI commands."""
@@ -30,6 +38,162 @@ def register_commands(app):
         else:
             click.echo("Database already exists and is initialized.")
     
+    @app.cli.command("db-upgrade")
+    @click.option('--target', type=int, default=None, help='Stop after this migration version')
+    @with_appcontext
+    def db_upgrade_command(target):
+        """Apply pending schema migrations to the database."""
+        click.echo(f"Database is at version {app_database_version()}, latest is {latest_version()}.")
+        applied = upgrade_app_database(target)
+        for version, description in applied:
+            click.echo(f"  Applied {version}: {description}")
+        if not applied:
+            click.echo("Database is up to date.")
+    
+    @app.cli.command("db-version")
+    @with_appcontext
+    def db_version_command():
+        """Show the schema migration version of the database."""
+        click.echo(f"Database version: {app_database_version()} (latest: {latest_version()})")
+    
+    @app.cli.command("db-pragmas")
+    @with_appcontext
+    def db_pragmas_command():
+        """Show the configured and effective SQLite pragmas."""
+        configured = app.config.get('SQLITE_PRAGMAS') or {}
+        report = sqlite_pragma_report()
+        if not report:
+            click.echo("The database is not SQLite.")
+            return
+        for pragma, value in report.items():
+            wanted = configured.get(pragma, '(SQLite default)')
+            click.echo(f"{pragma:<13} {value!s:<12} configured: {wanted}")
+    
+    @app.cli.command("rebuild-search-index")
+    @with_appcontext
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from the items table."""
+        click.echo("Rebuilding the search index...")
+        count = rebuild_search_index()
+        if count is None:
+            click.echo("Full-text search is not supported by this database.")
+        else:
+            click.echo(f"Indexed {count} items.")
+    
+    @app.cli.command("rebuild-spec-index")
+    @with_appcontext
+    def rebuild_spec_index_command():
+        """Rebuild the typed specification value index used for filtering and sorting."""
+        click.echo("Rebuilding the specification value index...")
+        count = rebuild_spec_value_index()
+        click.echo(f"Indexed {count} specification values.")
+    
+    @app.cli.command("rebuild-thumbnails")
+    @click.option('--force', is_flag=True, help='Regenerate variants that are already up to date')
+    @click.option('--workers', type=click.IntRange(min=1), default=None,
+                  help='Worker processes (default: one per CPU)')
+    @with_appcontext
+    def rebuild_thumbnails_command(force, workers):
+        """Create the resized photo variants missing for existing photos."""
+        from models import db, ItemPhoto
+        filenames = db.session.execute(db.select(ItemPhoto.file_path).distinct()).scalars().all()
+        db.session.remove()
+        click.echo(f"Checking thumbnails of {len(filenames)} photos...")
+        updated = written = 0
+        for _, count in rebuild_thumbnails(app.config['UPLOAD_FOLDER'], filenames, force=force, workers=workers):
+            if count:
+                updated += 1
+                written += count
+        click.echo(f"Wrote {written} variants for {updated} photos.")
+    
+    @app.cli.command("migrate-photos")
+    @with_appcontext
+    def migrate_photos_command():
+        """Move photos stored flat in the upload folder to shared, content-addressed storage."""
+        click.echo("Migrating photos to content-addressed storage...")
+        migrated, missing = migrate_flat_uploads()
+        click.echo(f"Migrated {migrated} photo files.")
+        if missing:
+            click.echo(f"  {missing} referenced files were not found in the upload folder.")
+    
+    @app.cli.command("gc-uploads")
+    @click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+    @click.option('--grace', type=click.IntRange(min=0), default=None,
+                  help='Keep files modified in the last this many seconds (default: UPLOAD_GC_GRACE_PERIOD)')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=500, help='Paths looked up per query')
+    @with_appcontext
+    def gc_uploads_command(dry_run, grace, batch_size):
+        """Remove files of the upload folder that no photo refers to."""
+        report = collect_orphan_uploads(grace_period=grace, dry_run=dry_run, batch_size=batch_size)
+        verb = "Would remove" if dry_run else "Removed"
+        click.echo(f"Scanned {report['scanned']} files.")
+        for kind in GC_KINDS:
+            if report['removed'][kind]:
+                click.echo(f"  {verb} {report['removed'][kind]} {kind} files ({report['bytes'][kind]} bytes)")
+        click.echo(f"{verb} {sum(report['removed'].values())} files, "
+                   f"reclaiming {report['total_bytes'] / (1024 * 1024):.1f} MiB.")
+    
+    @app.cli.command("import-items")
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), default=None,
+                  help='Input format (default: from the file extension)')
+    @click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE,
+                  help='Rows per transaction')
+    @with_appcontext
+    def import_items_command(path, file_format, chunk_size):
+        """Import items from an NDJSON or CSV file."""
+        if file_format is None:
+            file_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+        with open(path, 'rb') as stream:
+            report = import_items(stream, file_format, chunk_size=chunk_size)
+        
+        click.echo(f"Imported {report['created']} of {report['rows']} rows "
+                   f"in {report['seconds']} s ({report['rows_per_second']} rows/s).")
+        for error in report['errors']:
+            click.echo(f"  line {error['line']}: {error['error']}")
+        if report['errors_truncated']:
+            click.echo(f"  ... {report['failed'] - len(report['errors'])} more errors")
+    
+    @app.cli.command("seed")
+    @click.option('--categories', type=click.IntRange(min=1), default=10, help='Categories to create')
+    @click.option('--items', type=click.IntRange(min=0), default=1000, help='Items to create')
+    @click.option('--seed', type=int, default=0, help='Random seed; equal seeds give equal collections')
+    @click.option('--photo-pool', type=click.IntRange(min=0), default=DEFAULT_PHOTO_POOL,
+                  help='Distinct placeholder photos shared by the items (0: no photos)')
+    @click.option('--chunk-size', type=click.IntRange(min=1), default=SEED_CHUNK_SIZE,
+                  help='Items per transaction')
+    @with_appcontext
+    def seed_command(categories, items, seed, photo_pool, chunk_size):
+        """Fill an empty database with a synthetic collection for load testing."""
+        def progress(done):
+            if done % 100000 < chunk_size or done == items:
+                click.echo(f"  {done} of {items} items")
+        try:
+            report = seed_collection(categories=categories, items=items, seed=seed, photo_pool=photo_pool,
+                                     chunk_size=chunk_size, progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Created {report['categories']} categories and {report['items']} items with "
+                   f"{report['urls']} URLs and {report['photos']} photos of {report['photo_files']} files "
+                   f"in {report['seconds']} s ({report['items_per_second']} items/s).")
+    
+    @app.cli.command("export")
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'file_format', type=click.Choice(EXPORT_FORMATS), default=None,
+                  help='Output format (default: from the file extension, else ndjson)')
+    @with_appcontext
+    def export_command(path, file_format):
+        """Export all categories and items (and photos, as zip) to a file."""
+        if file_format is None:
+            extension = path.rsplit('.', 1)[-1].lower()
+            file_format = extension if extension in EXPORT_FORMATS else 'ndjson'
+        written = 0
+        with open(path, 'wb') as output:
+            for chunk in iter_export(file_format):
+                output.write(chunk)
+                written += len(chunk)
+        click.echo(f"Exported {written} bytes of {file_format} to {path}.")
+    
     @app.cli.command("network-info")
     def network_info_command():
         """Show network information for accessing the app."""
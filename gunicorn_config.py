@@ -1,5 +1,13 @@
 """Gunicorn configuration for Collectify application."""
 import multiprocessing
+import os
+import tempfile
+
+# Workers share their Prometheus metrics through files in this directory
+# (see utils.metrics); it is set before the app is loaded so every worker
+# uses the same one, with or without preload_app
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='collectify-metrics-')
 
 # Gunicorn settings
 # Bind to 0.0.0.0:8000
@@ -35,3 +43,31 @@ preload_app = True
 
 # File monitoring to auto-reload on changes (disable in production)
 reload = False
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master process.
+    
+    With preload_app the app is imported before forking; a SQLite connection
+    shared between processes corrupts locking, so each worker opens its own.
+    """
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def on_starting(server):
+    """Forget the metrics of a previous run sharing METRICS_DIR."""
+    from utils.metrics import clear_metrics_dir
+    clear_metrics_dir(os.environ['METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    """Keep the counters of an exited worker and drop its in-flight gauges.
+    
+    Workers are replaced every max_requests; their counter files are folded
+    into one archive so the /metrics totals never go backwards.
+    """
+    from utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
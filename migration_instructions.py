@@ -17,6 +17,9 @@ follow these steps:
 2. Run the migration script:
    python migrate_specifications.py
 
+   Then apply the versioned schema migrations (indexes, search index, ...):
+   flask db-upgrade
+
 3. Restart the application:
    python app.py
 
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
+import math
 
 # Initialize SQLAlchemy without a specific Flask app
 # (We will initialize it later with the app)
@@ -21,8 +22,12 @@ class CategorySpecification(db.Model):
     max_value = db.Column(db.Float)  # For number type
     step_value = db.Column(db.Float, default=1)  # For number type
     
+    __table_args__ = (
+        db.Index('ix_category_specifications_category_id', 'category_id', 'display_order'),
+    )
+    
     # Relationship
-    category = db.relationship('Category', back_populates='specifications', lazy='joined')
+    category = db.relationship('Category', back_populates='specifications', lazy='select')
     
     def to_dict(self):
         result = {
@@ -66,24 +71,30 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    items = db.relationship('Item', back_populates='category', lazy='joined')
+    # Collections are never joined eagerly: joining several of them multiplies
+    # the rows fetched. List and detail queries pick their own loader options
+    # (see utils.helpers); these defaults only cover ad-hoc access.
+    items = db.relationship('Item', back_populates='category', lazy='select')
     specifications = db.relationship('CategorySpecification', 
                                     back_populates='category', 
-                                    lazy='joined',  # Change to eager loading for tests 
+                                    lazy='selectin',
                                     order_by='CategorySpecification.display_order',
                                     cascade='all, delete-orphan')
 
-    def to_dict(self):
+    def to_dict(self, specifications=None):
+        # Serialize each specification once; callers holding the serialized
+        # list already (see utils.schema_cache) can pass it in
+        if specifications is None:
+            specifications = [spec.to_dict() for spec in self.specifications]
+        
         # Convert specifications to a dictionary for backward compatibility
-        specs_dict = {}
-        for spec in self.specifications:
-            specs_dict[spec.key] = spec.to_dict()
+        specs_dict = {spec['key']: spec for spec in specifications}
             
         return {
             'id': self.id,
             'name': self.name,
             'specifications_schema': specs_dict,
-            'specifications': [spec.to_dict() for spec in self.specifications],
+            'specifications': specifications,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
@@ -146,6 +157,26 @@ class Category(db.Model):
                     new_spec.set_options(spec_data['options'])
                 
                 db.session.add(new_spec)
+        
+        # Re-type the indexed specification values of this category's items
+        if isinstance(schema_data, dict):
+            number_keys = {key for key, spec_data in schema_data.items() if spec_data.get('type') == 'number'}
+        else:
+            number_keys = {spec_data.get('key') for spec_data in schema_data if spec_data.get('type') == 'number'}
+        self._retype_spec_values(number_keys)
+    
+    def _retype_spec_values(self, number_keys):
+        """Recompute ItemSpecValue.num_value for all items after a schema change."""
+        if self.id is None:
+            return
+        
+        indexed_values = (ItemSpecValue.query
+                          .join(Item, Item.id == ItemSpecValue.item_id)
+                          .filter(Item.category_id == self.id))
+        for indexed in indexed_values:
+            num_value = ItemSpecValue.to_number(indexed.text_value) if indexed.spec_key in number_keys else None
+            if indexed.num_value != num_value:
+                indexed.num_value = num_value
     
     def get_specifications_schema(self):
         """
@@ -167,11 +198,16 @@ class Item(db.Model):
     form_factor = db.Column(db.String)
     description = db.Column(db.Text)
     specification_values = db.Column(db.Text)  # Stored as JSON string - values according to category schema
+    # Last change to the item or its photos/URLs (see utils.conditional)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     category = db.relationship('Category', back_populates='items', lazy='joined')
-    photos = db.relationship('ItemPhoto', back_populates='item', lazy='joined', cascade='all, delete-orphan')
-    urls = db.relationship('ItemUrl', back_populates='item', lazy='joined', cascade='all, delete-orphan')
+    photos = db.relationship('ItemPhoto', back_populates='item', lazy='selectin',
+                             order_by='ItemPhoto.id', cascade='all, delete-orphan')
+    urls = db.relationship('ItemUrl', back_populates='item', lazy='selectin',
+                           order_by='ItemUrl.id', cascade='all, delete-orphan')
+    spec_index = db.relationship('ItemSpecValue', lazy='select', cascade='all, delete-orphan')
 
     def to_dict(self):
         # Get specification values
@@ -227,6 +263,20 @@ class Item(db.Model):
     
     def set_specification_values(self, specs_dict):
         self.specification_values = json.dumps(specs_dict)
+        
+        # Keep the typed, indexed projection of the values in sync
+        number_keys = {spec.key for spec in self._category_specifications() if spec.type == 'number'}
+        self.spec_index = [
+            ItemSpecValue(spec_key=key, num_value=num_value, text_value=text_value)
+            for key, num_value, text_value in ItemSpecValue.project(specs_dict, number_keys)
+        ]
+    
+    def _category_specifications(self):
+        """Specifications of the item's category, following a changed category_id."""
+        if self.category_id is None:
+            return self.category.specifications if self.category else []
+        with db.session.no_autoflush:
+            return CategorySpecification.query.filter_by(category_id=self.category_id).all()
     
     def get_specification_values(self):
         return json.loads(self.specification_values) if self.specification_values else {}
@@ -237,25 +287,86 @@ class Item(db.Model):
         return self.photos[0].file_path if self.photos else None
 
 
+# Items are listed by case-insensitive name with the id as tie-breaker
+# (see utils.pagination.item_sort_columns). These indexes serve that order,
+# the second one within a category; it also covers the category_id foreign key.
+db.Index('ix_items_name_nocase', Item.name.collate('NOCASE'), Item.id)
+db.Index('ix_items_category_name_nocase', Item.category_id, Item.name.collate('NOCASE'), Item.id)
+
+
+class ItemSpecValue(db.Model):
+    """Typed projection of Item.specification_values, one row per key.
+
+    The JSON column stays the source of truth; this table exists so that
+    filtering and sorting on specification values are index lookups.
+    """
+    __tablename__ = 'item_spec_values'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), primary_key=True)
+    spec_key = db.Column(db.String, primary_key=True)
+    num_value = db.Column(db.Float)  # Parsed value, only for 'number' specifications
+    text_value = db.Column(db.String)  # Raw value as text, for every specification
+
+    __table_args__ = (
+        db.Index('ix_item_spec_values_key_num', 'spec_key', 'num_value', 'item_id'),
+        db.Index('ix_item_spec_values_key_text', 'spec_key', 'text_value', 'item_id'),
+    )
+
+    @staticmethod
+    def to_number(value):
+        """Parse a specification value as a number, or return None."""
+        if value is None or isinstance(value, bool):
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return number if math.isfinite(number) else None
+
+    @staticmethod
+    def project(specs_dict, number_keys):
+        """Yield (spec_key, num_value, text_value) rows for a dict of values."""
+        for key, value in (specs_dict or {}).items():
+            if value is None:
+                continue
+            text_value = value if isinstance(value, str) else json.dumps(value)
+            num_value = ItemSpecValue.to_number(value) if key in number_keys else None
+            yield key, num_value, text_value
+
+
 class ItemPhoto(db.Model):
     __tablename__ = 'item_photos'
 
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
-    file_path = db.Column(db.String, nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False, index=True)
+    # Relative path of the stored blob, shared by identical photos (see utils.photo_storage)
+    file_path = db.Column(db.String, nullable=False, index=True)
     filename = db.Column(db.String)  # Optional column to store original filename
     is_primary = db.Column(db.Boolean, default=False)  # Flag for primary photo
     
     # Relationship
-    item = db.relationship('Item', back_populates='photos', lazy='joined')
+    item = db.relationship('Item', back_populates='photos', lazy='select')
 
 
 class ItemUrl(db.Model):
     __tablename__ = 'item_urls'
 
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False, index=True)
     url = db.Column(db.String, nullable=False)
     
     # Relationship
-    item = db.relationship('Item', back_populates='urls', lazy='joined')
+    item = db.relationship('Item', back_populates='urls', lazy='select')
+
+
+class CollectionVersion(db.Model):
+    """Change counter of a group of tables, bumped on every write to them.
+
+    The versions are the HTTP validators of the list APIs (see
+    utils.conditional): a request can be answered with 304 Not Modified by
+    reading one row, before any item or category is queried.
+    """
+    __tablename__ = 'collection_versions'
+
+    name = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
@@ -2,15 +2,32 @@
 from flask import jsonify, request
 from models import db, Category
 from utils.auth import requires_auth
+from utils.conditional import CATEGORIES, ITEMS, collection_etag, conditional_get
+from utils.helpers import get_category_summaries
+from utils.schema_cache import category_schema_cache
 
 def register_category_routes(app):
     """Register category API routes with the Flask application."""
     
+    def _categories_etag():
+        # Item counts change with the items, not with the categories
+        if request.args.get('counts') in ('1', 'true'):
+            return collection_etag(CATEGORIES, ITEMS)
+        return collection_etag(CATEGORIES)
+    
     @app.route('/api/categories', methods=['GET'])
+    @conditional_get(_categories_etag)
     def get_categories():
-        """Publicly fetches all categories for filtering and forms."""
-        categories = [category.to_dict() for category in Category.query.order_by(Category.name).all()]
-        return jsonify(categories)
+        """Publicly fetches all categories for filtering and forms.
+
+        ``?summary=1`` returns only ids and names (add ``counts=1`` for the
+        number of items in each category) without loading specifications.
+        """
+        if request.args.get('summary') in ('1', 'true'):
+            with_counts = request.args.get('counts') in ('1', 'true')
+            return jsonify(get_category_summaries(with_counts=with_counts))
+        
+        return jsonify([schema.category_dict for schema in category_schema_cache.all()])
 
     @app.route('/api/categories', methods=['POST'])
     @requires_auth
@@ -87,13 +104,14 @@ def register_category_routes(app):
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/categories/<int:category_id>/specifications_schema', methods=['GET'])
+    @conditional_get(lambda category_id: collection_etag(CATEGORIES, scope=f'category-{category_id}'))
     def get_category_specifications_schema(category_id):
         """Get specifications schema for a specific category."""
-        category = Category.query.get(category_id)
-        if not category:
+        schema = category_schema_cache.get(category_id)
+        if not schema:
             return jsonify({'error': 'Category not found'}), 404
         
-        return jsonify(category.get_specifications_schema())
+        return jsonify(schema.specifications)
 
     @app.route('/api/categories/<int:category_id>/specifications_schema', methods=['PUT'])
     @requires_auth
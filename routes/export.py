@@ -0,0 +1,30 @@
+"""API route for exporting the whole collection in the Collectify application."""
+from flask import current_app, jsonify, request, stream_with_context
+from utils.auth import requires_auth
+from utils.conditional import CATEGORIES, ITEMS, collection_etag, conditional_get
+from utils.export import FORMATS as EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES, export_filename, iter_export
+
+def register_export_routes(app):
+    """Register the export API route with the Flask application."""
+    
+    def _export_etag():
+        return collection_etag(CATEGORIES, ITEMS, scope=f"export-{request.args.get('format', 'ndjson')}")
+    
+    @app.route('/api/export', methods=['GET'])
+    @requires_auth
+    @conditional_get(_export_etag)
+    def export_collection():
+        """Streams a backup of all categories and items (protected).
+
+        ``format`` is ``ndjson`` (default), ``csv`` (items only) or ``zip``
+        (both plus the photo files). The body is produced while it is sent,
+        see utils.export.
+        """
+        file_format = request.args.get('format', 'ndjson')
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        response = current_app.response_class(stream_with_context(iter_export(file_format)),
+                                              mimetype=EXPORT_MIMETYPES[file_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(file_format)}"'
+        return response
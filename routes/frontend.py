@@ -1,26 +1,41 @@
 """Frontend routes for the Collectify application."""
 import json
 import os
-from flask import render_template, abort, redirect, send_from_directory, request, current_app
-from models import db, Item, Category, ItemUrl, ItemPhoto
+from flask import render_template, abort, redirect, request
+from models import db, Item, ItemUrl
 from utils.auth import requires_auth
-from utils.helpers import prepare_items_for_template
+from utils.helpers import item_detail_options, get_category_summaries
+from utils.photo_storage import allowed_upload, attach_photo, is_blob_path, is_upload_path
+from utils.render_cache import cached_page, listed_item_fragments
+from utils.static_files import send_upload
+from utils.thumbnails import (THUMBNAIL_DIR, generate_thumbnails, parse_thumbnail_name, photo_srcset,
+                              thumbnail_folder, thumbnail_url)
 
 def register_frontend_routes(app):
     """Register frontend routes with the Flask application."""
     
+    app.add_template_global(photo_srcset)
+    app.add_template_global(thumbnail_url)
+    
     @app.route('/')
     def index():
-        """Serves the main public page with items and categories for server-side rendering."""
-        # Fetch categories
-        categories = [c.to_dict() for c in Category.query.order_by(Category.name).all()]
+        """Serves the main public page with items and categories for server-side rendering.
+
+        The page and each item's fragments are cached (see utils.render_cache).
+        """
         # Get category filter from request args
         category_id = request.args.get('category_id')
         # Get search term from request args
         search_term = request.args.get('search')
-        # Get items from helper function with optional category filter and search term
-        items = prepare_items_for_template(category_id=category_id, search=search_term)
-        return render_template('index.html', page_title="My Collection", categories=categories, items=items)
+        return cached_page(lambda: render_index(category_id=category_id, search=search_term))
+    
+    def render_index(category_id=None, search=None, **context):
+        """Render index.html with the categories and the (cached) fragments of the listed items."""
+        return render_template('index.html',
+                               page_title="My Collection",
+                               categories=get_category_summaries(),
+                               items=listed_item_fragments(category_id=category_id, search=search),
+                               **context)
         
     @app.route('/edit/<int:id>')
     def edit_item(id):
@@ -31,7 +46,7 @@ def register_frontend_routes(app):
     @app.route('/item/<int:id>')
     def view_item(id):
         """View item details page."""
-        item = Item.query.get(id)
+        item = Item.query.options(*item_detail_options()).get(id)
         if not item:
             abort(404)
             
@@ -61,10 +76,30 @@ def register_frontend_routes(app):
         """Serves the protected admin page for category management using Jinja2 template inheritance."""
         return render_template('admin.html', page_title="Admin Panel")
 
-    @app.route('/uploads/<filename>')
+    @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        """Serves uploaded image files."""
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        """Serves uploaded image files; content-addressed ones may be cached for good."""
+        if not is_upload_path(filename):
+            abort(404)
+        return send_upload(filename, immutable=is_blob_path(filename))
+    
+    @app.route('/uploads/thumbs/<path:name>')
+    def photo_thumbnail(name):
+        """Serves a resized variant of an uploaded photo, creating missing ones first.
+
+        Falls back to the original when no variant can be made from it. Variants
+        of content-addressed photos may be cached for good, fallbacks may not.
+        """
+        parsed = parse_thumbnail_name(name)
+        if parsed is None or not is_upload_path(parsed[0]):
+            abort(404)
+        upload_folder = app.config['UPLOAD_FOLDER']
+        folder = thumbnail_folder(upload_folder)
+        if not os.path.isfile(os.path.join(folder, name)):
+            generate_thumbnails(upload_folder, parsed[0])
+            if not os.path.isfile(os.path.join(folder, name)):
+                return send_upload(parsed[0])
+        return send_upload(f'{THUMBNAIL_DIR}/{name}', immutable=is_blob_path(parsed[0]))
         
     @app.route('/item/<int:id>/edit', methods=['POST'])
     def edit_item_form(id):
@@ -77,23 +112,11 @@ def register_frontend_routes(app):
             # Validate required fields
             if not request.form.get('name'):
                 # Handle error and return to form with error message
-                categories = [c.to_dict() for c in Category.query.order_by(Category.name).all()]
-                return render_template('index.html', 
-                                      error_message="Name is required", 
-                                      categories=categories,
-                                      items=prepare_items_for_template(search=request.args.get('search')))
+                return render_index(search=request.args.get('search'), error_message="Name is required")
             if not request.form.get('category_id'):
-                categories = [c.to_dict() for c in Category.query.order_by(Category.name).all()]
-                return render_template('index.html', 
-                                      error_message="Category is required", 
-                                      categories=categories,
-                                      items=prepare_items_for_template(search=request.args.get('search')))
+                return render_index(search=request.args.get('search'), error_message="Category is required")
             if not request.form.get('brand'):
-                categories = [c.to_dict() for c in Category.query.order_by(Category.name).all()]
-                return render_template('index.html', 
-                                      error_message="Brand is required", 
-                                      categories=categories,
-                                      items=prepare_items_for_template(search=request.args.get('search')))
+                return render_index(search=request.args.get('search'), error_message="Brand is required")
                 
             # Update basic item information
             item.category_id = request.form.get('category_id')
@@ -119,10 +142,8 @@ def register_frontend_routes(app):
             
             # Add new photos if any
             for file in request.files.getlist('photos[]'):
-                if file and file.filename and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']:
-                    filename = f"item_{id}_{file.filename}"
-                    file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                    item.photos.append(ItemPhoto(file_path=filename))
+                if allowed_upload(file):
+                    attach_photo(item, file)
             
             db.session.commit()
             
@@ -130,8 +151,5 @@ def register_frontend_routes(app):
             return redirect('/?success=Item+updated+successfully')
         except Exception as e:
             db.session.rollback()
-            categories = [c.to_dict() for c in Category.query.order_by(Category.name).all()]
-            return render_template('index.html', 
-                                  error_message=f"Error updating item: {str(e)}", 
-                                  categories=categories,
-                                  items=prepare_items_for_template(search=request.args.get('search')))
+            return render_index(search=request.args.get('search'),
+                                error_message=f"Error updating item: {str(e)}")
@@ -1,32 +1,166 @@
 """API routes for items in the Collectify application."""
-import os
 import json
+import zlib
 from flask import request, jsonify, current_app
-from models import db, Item, ItemUrl, ItemPhoto, Category
+from werkzeug.datastructures import MultiDict
+from models import db, Item, ItemUrl, Category
 from utils.auth import requires_auth
+from utils.bulk_import import DEFAULT_CHUNK_SIZE, FORMATS as IMPORT_FORMATS, import_items
+from utils.conditional import ITEMS, collection_etag, conditional_get
+from utils.photo_storage import allowed_upload, attach_photo, commit_releasing_uploads
+from utils.helpers import (SPEC_PARAM_PREFIX, item_detail_options, apply_spec_filters, apply_spec_sort,
+                           delete_items_where)
+from utils.pagination import PaginationError, item_sort_columns, paginate_items, parse_limit
+from utils.search import search_items, search_index_available
+from utils.serialization import (NDJSON_MIMETYPE, item_projection, serialize_item_rows, serialize_items,
+                                 stream_items_response)
+
+# Content types accepted by the bulk import endpoint
+IMPORT_MIMETYPES = {
+    NDJSON_MIMETYPE: 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+# Upper bound on the ids accepted by one DELETE /api/items request
+MAX_BULK_DELETE_IDS = 10000
 
 def register_item_routes(app):
     """Register item API routes with the Flask application."""
     
+    def wants_ndjson():
+        return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+    
+    def items_list_etag():
+        # The array, the cursor page and the NDJSON stream of one URL are
+        # different representations and must not share a validator
+        if wants_ndjson():
+            return collection_etag(ITEMS, scope='list-ndjson')
+        if 'limit' in request.args or 'after' in request.args:
+            page = zlib.crc32(f"{request.args.get('limit')}:{request.args.get('after')}".encode())
+            return collection_etag(ITEMS, scope=f'list-page-{page:08x}')
+        return collection_etag(ITEMS, scope='list')
+    
     @app.route('/api/items', methods=['GET'])
+    @conditional_get(items_list_etag, vary=('Accept',))
     def get_items():
-        """Fetches a list of all items, with optional category filtering."""
-        query = Item.query.join(Item.category, isouter=True)
+        """Fetches a list of all items, with optional category filtering.
+
+        Items can be filtered by specification values (``spec.<key>=``,
+        ``spec.<key>__gte=``, ``spec.<key>__lte=``) and ordered by one with
+        ``sort=spec.<key>`` (prefix with ``-`` for descending).
+
+        Passing ``limit`` (and ``after`` for the following pages) switches to
+        cursor pagination: the response becomes an object with ``items`` and
+        ``next_cursor``, and the total is reported in ``X-Total-Count``.
+
+        Items are serialized straight from a column projection (see
+        utils.serialization) rather than through ORM instances.
+
+        Full listings can be streamed from a server-side cursor: ``stream=1``
+        streams the usual JSON array, and ``Accept: application/x-ndjson``
+        streams one JSON object per line.
+        """
+        query = Item.query
         
         if request.args.get('category_id'):
             query = query.filter(Item.category_id == int(request.args.get('category_id')))
         
-        query = query.order_by(Item.name)
-        items = [item.to_dict() for item in query.all()]
+        try:
+            query = apply_spec_filters(query, request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        paginated = 'limit' in request.args or 'after' in request.args
+        ndjson = wants_ndjson()
+        stream = ndjson or request.args.get('stream') in ('1', 'true')
+        if stream and paginated:
+            return jsonify({'error': 'Streaming cannot be combined with cursor pagination'}), 400
+        
+        sort = request.args.get('sort')
+        if sort:
+            if paginated:
+                return jsonify({'error': 'sort cannot be combined with cursor pagination'}), 400
+            try:
+                query = apply_spec_sort(query, sort)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if stream:
+                return stream_items_response(query, ndjson=ndjson)
+            return jsonify(serialize_items(query))
         
-        return jsonify(items)
+        if paginated:
+            try:
+                limit = parse_limit(request.args.get('limit'))
+                page, next_cursor, total_count = paginate_items(
+                    item_projection(query), limit, request.args.get('after'))
+            except PaginationError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            response = jsonify({
+                'items': serialize_item_rows(page),
+                'next_cursor': next_cursor
+            })
+            response.headers['X-Total-Count'] = str(total_count)
+            return response
+        
+        query = query.order_by(*item_sort_columns())
+        if stream:
+            return stream_items_response(query, ndjson=ndjson)
+        
+        return jsonify(serialize_items(query))
+
+    @app.route('/api/items/search', methods=['GET'])
+    @conditional_get(lambda: collection_etag(ITEMS))
+    def search_items_api():
+        """Full-text search over items, ordered by relevance.
+
+        Matches name, brand, description, serial number, specification values
+        and URLs; every word is treated as a prefix. Each result carries a
+        ``search_rank`` (bm25, lower is better) and a highlighted ``search_snippet``.
+        """
+        search_term = request.args.get('q', '').strip()
+        if not search_term:
+            return jsonify({'error': 'Search query is required'}), 400
+        if not search_index_available():
+            return jsonify({'error': 'Full-text search is not available'}), 503
+        
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            category_id = int(request.args['category_id']) if request.args.get('category_id') else None
+        except ValueError:
+            return jsonify({'error': 'category_id must be an integer'}), 400
+        
+        hits = search_items(search_term, category_id=category_id, limit=limit)
+        items_by_id = {
+            item['id']: item
+            for item in serialize_items(Item.query.filter(Item.id.in_([hit['id'] for hit in hits])))
+        }
+        
+        results = []
+        for hit in hits:
+            d = items_by_id.get(hit['id'])
+            if d is None:
+                continue
+            d['search_rank'] = hit['rank']
+            d['search_snippet'] = str(hit['snippet'])
+            results.append(d)
+        
+        return jsonify(results)
 
     @app.route('/api/items/<int:id>', methods=['GET'])
+    @conditional_get(lambda id: collection_etag(ITEMS, scope=f'item-{id}'))
     def get_item(id):
         """Fetches full details for a single item."""
-        item = Item.query.get(id)
+        item = Item.query.options(*item_detail_options()).get(id)
         if item:
-            return jsonify(item.to_dict())
+            response = jsonify(item.to_dict())
+            response.last_modified = item.updated_at
+            return response
         return jsonify({'error': 'Item not found'}), 404
 
     @app.route('/api/items', methods=['POST'])
@@ -108,10 +242,8 @@ def register_item_routes(app):
             # Process photos
             if files:
                 for file in files.getlist('photos[]'):
-                    if file and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']:
-                        filename = f"item_{new_item.id}_{file.filename}"
-                        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                        new_item.photos.append(ItemPhoto(file_path=filename))
+                    if allowed_upload(file):
+                        attach_photo(new_item, file)
             
             # Commit all changes
             db.session.commit()
@@ -124,6 +256,30 @@ def register_item_routes(app):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/items/bulk', methods=['POST'])
+    @requires_auth
+    def bulk_import_items():
+        """Imports many items from an NDJSON or CSV request body.
+
+        The format follows the Content-Type (``application/x-ndjson`` or
+        ``text/csv``) unless ``format`` is given. The body is read as a stream
+        and inserted in chunks (``chunk_size``, default 1000); the response
+        reports per-row errors and throughput.
+        """
+        file_format = request.args.get('format') or IMPORT_MIMETYPES.get(request.mimetype)
+        if file_format not in IMPORT_FORMATS:
+            return jsonify({'error': 'Send NDJSON (application/x-ndjson) or CSV (text/csv)'}), 415
+        try:
+            chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            return jsonify({'error': 'chunk_size must be an integer'}), 400
+        if chunk_size < 1:
+            return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+        
+        request.max_content_length = current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+        report = import_items(request.stream, file_format, chunk_size=chunk_size)
+        return jsonify(report)
+
     @app.route('/api/items/<int:id>', methods=['PUT'])
     @requires_auth
     def update_item(id):
@@ -160,6 +316,9 @@ def register_item_routes(app):
                 else:
                     # Already a dict/JSON object
                     item.set_specification_values(spec_values_json)
+            elif data.get('category_id'):
+                # Re-type the indexed specification values for the new category
+                item.set_specification_values(item.get_specification_values())
             
             # Update URLs if provided
             if is_json and data.get('urls') is not None:
@@ -182,10 +341,8 @@ def register_item_routes(app):
             # Process photos if provided
             if files and files.getlist('photos[]'):
                 for file in files.getlist('photos[]'):
-                    if file and file.filename and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']:
-                        filename = f"item_{id}_{file.filename}"
-                        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                        item.photos.append(ItemPhoto(file_path=filename))
+                    if allowed_upload(file):
+                        attach_photo(item, file)
             
             db.session.commit()
             
@@ -205,16 +362,12 @@ def register_item_routes(app):
             return jsonify({'error': 'Item not found'}), 404
         
         try:
-            # Delete physical photo files
-            for photo in item.photos:
-                try:
-                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], photo.file_path))
-                except OSError as e:
-                    print(f"Error deleting file {photo.file_path}: {e}")
+            photo_files = [photo.file_path for photo in item.photos]
             
-            # Delete from database (cascade will handle related records)
+            # Delete from database (cascade will handle related records);
+            # photo files no other item shares go once the rows are gone
             db.session.delete(item)
-            db.session.commit()
+            commit_releasing_uploads(photo_files)
             
             return jsonify({'message': 'Item deleted'})
         
@@ -222,6 +375,53 @@ def register_item_routes(app):
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
             
+    @app.route('/api/items', methods=['DELETE'])
+    @requires_auth
+    def delete_items():
+        """Deletes many items in one transaction.
+
+        The JSON body holds either ``ids`` (a list of item ids) or a ``filter``
+        object with the ``category_id`` and ``spec.<key>`` parameters of
+        ``GET /api/items``. Photo files are removed in the background.
+        """
+        data = request.get_json(silent=True) or {}
+        if 'ids' in data:
+            ids = data['ids']
+            if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                return jsonify({'error': 'ids must be a list of integers'}), 400
+            if len(ids) > MAX_BULK_DELETE_IDS:
+                return jsonify({'error': f'At most {MAX_BULK_DELETE_IDS} ids can be deleted at once'}), 400
+            conditions = [Item.id.in_(set(ids))]
+        elif isinstance(data.get('filter'), dict) and data['filter']:
+            filters = MultiDict()
+            for key, value in data['filter'].items():
+                # Silently ignoring a misspelled filter would delete too much
+                if key != 'category_id' and not key.startswith(SPEC_PARAM_PREFIX):
+                    return jsonify({'error': f'Unsupported filter: {key}'}), 400
+                for single in (value if isinstance(value, list) else [value]):
+                    filters.add(key, str(single))
+            try:
+                query = apply_spec_filters(Item.query, filters)
+                if 'category_id' in filters:
+                    query = query.filter(Item.category_id == int(filters['category_id']))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            conditions = [query.whereclause]
+        else:
+            return jsonify({'error': 'Provide a list of ids or a non-empty filter'}), 400
+        
+        try:
+            deleted_ids, photo_files = delete_items_where(*conditions)
+            commit_releasing_uploads(photo_files)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        
+        result = {'deleted': len(deleted_ids), 'ids': deleted_ids}
+        if 'ids' in data:
+            result['missing'] = sorted(set(data['ids']) - set(deleted_ids))
+        return jsonify(result)
+            
     @app.route('/api/items/<int:id>/urls', methods=['POST'])
     @requires_auth
     def add_item_url(id):
@@ -277,15 +477,11 @@ def register_item_routes(app):
                 return jsonify({'error': 'No photo provided'}), 400
                 
             file = request.files['photos[]']
-            if file and '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']:
-                filename = f"item_{id}_{file.filename}"
-                file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                
-                photo = ItemPhoto(item_id=id, file_path=filename)
-                db.session.add(photo)
+            if allowed_upload(file):
+                photo = attach_photo(item, file)
                 db.session.commit()
                 
-                return jsonify({'id': photo.id, 'filename': filename}), 201
+                return jsonify({'id': photo.id, 'filename': photo.file_path}), 201
             else:
                 return jsonify({'error': 'Invalid file format'}), 400
         except Exception as e:
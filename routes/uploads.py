@@ -0,0 +1,59 @@
+"""API routes for resumable photo uploads in the Collectify application."""
+from flask import request, jsonify
+from models import db, Item
+from utils.auth import requires_auth
+from utils.resumable_uploads import (ResumableUploadError, append_chunk, cancel_upload, commit_upload,
+                                     start_upload, upload_status)
+
+def register_upload_routes(app):
+    """Register resumable upload API routes with the Flask application."""
+    
+    @app.errorhandler(ResumableUploadError)
+    def resumable_upload_error(e):
+        return jsonify({'error': str(e)}), e.status
+    
+    @app.route('/api/uploads', methods=['POST'])
+    @requires_auth
+    def start_resumable_upload():
+        """Starts a resumable upload of ``{"filename", "size"}`` (protected).
+
+        See utils.resumable_uploads for the protocol.
+        """
+        data = request.get_json(silent=True) or {}
+        return jsonify(start_upload(data.get('filename'), data.get('size'))), 201
+    
+    @app.route('/api/uploads/<upload_id>', methods=['GET'])
+    @requires_auth
+    def get_resumable_upload(upload_id):
+        """Reports how many bytes of an upload were received."""
+        return jsonify(upload_status(upload_id))
+    
+    @app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+    @requires_auth
+    def append_resumable_upload(upload_id):
+        """Appends the request body to an upload at the ``Upload-Offset`` header."""
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Upload-Offset header must be an integer'}), 400
+        return jsonify(append_chunk(upload_id, offset, request.stream))
+    
+    @app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+    @requires_auth
+    def cancel_resumable_upload(upload_id):
+        """Discards an upload."""
+        cancel_upload(upload_id)
+        return jsonify({'message': 'Upload cancelled'})
+    
+    @app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+    @requires_auth
+    def commit_resumable_upload(upload_id):
+        """Adds a complete upload to an item as a photo."""
+        data = request.get_json(silent=True) or {}
+        item = db.session.get(Item, data.get('item_id')) if isinstance(data.get('item_id'), int) else None
+        if not item:
+            return jsonify({'error': 'Item not found'}), 404
+        
+        photo = commit_upload(upload_id, item)
+        db.session.commit()
+        return jsonify({'id': photo.id, 'filename': photo.file_path}), 201
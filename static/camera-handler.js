@@ -93,7 +93,7 @@ document.addEventListener('DOMContentLoaded', function() {
       // Update the file input to include the captured image
       updateFileInput();
       
-    }, 'image/jpeg', 0.95); // JPEG format with 95% quality
+    }, 'image/jpeg', 0.85); // JPEG at 85% quality; the server makes the smaller variants
   }
   
   // Function to add image preview
@@ -178,10 +178,10 @@ document.addEventListener('DOMContentLoaded', function() {
         // Hide the modal
         batchDeleteConfirmModal.hide();
         
-        // Delete all selected items
-        Promise.all(pendingBatchDeleteIds.map(id => deleteItem(id, false)))
+        // Delete all selected items with a single request
+        deleteItems(pendingBatchDeleteIds)
           .then(() => {
-            // Refresh the page after all deletions
+            // Refresh the page after the deletion
             window.location.reload();
           })
           .catch(err => {
@@ -246,6 +246,23 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   }
   
+  // Function to delete several items in one transaction
+  function deleteItems(ids) {
+    return fetch('/api/items', {
+      method: 'DELETE',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ids: ids.map(id => parseInt(id, 10)) })
+    })
+    .then(res => {
+      if (!res.ok) {
+        return res.json().then(data => {
+          throw new Error(data.error || 'Failed to delete items');
+        });
+      }
+      return res.json();
+    });
+  }
+  
   // Function to delete an item and refresh the page
   function deleteItem(id, reload = true) {
     return fetch(`/api/items/${id}`, {
@@ -13,6 +13,8 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from app import app as flask_app
 from models import db, Category, Item, ItemUrl, ItemPhoto, CategorySpecification
 from config import create_app
+from utils.database import configure_sqlite_engine
+from utils.schema_cache import category_schema_cache
 
 @pytest.fixture
 def app():
@@ -21,6 +23,8 @@ def app():
     from routes.frontend import register_frontend_routes
     from routes.categories import register_category_routes
     from routes.items import register_item_routes
+    from routes.export import register_export_routes
+    from routes.uploads import register_upload_routes
     
     # Create test config
     test_app = create_app()
@@ -42,11 +46,17 @@ def app():
     register_frontend_routes(test_app)
     register_category_routes(test_app)
     register_item_routes(test_app)
+    register_export_routes(test_app)
+    register_upload_routes(test_app)
+    
+    # Compiled schemas of a previous test's database must not leak into this one
+    category_schema_cache.clear()
     
     # Set up application context
     with test_app.app_context():
         # Create all database tables
         db.init_app(test_app)
+        configure_sqlite_engine(test_app)
         db.create_all()
         
         # Provide the application for testing
@@ -96,6 +106,12 @@ def auth_client(client):
             headers.update(credentials)
             kwargs['headers'] = headers
             return client.delete(*args, **kwargs)
+        
+        def patch(self, *args, **kwargs):
+            headers = kwargs.get('headers', {})
+            headers.update(credentials)
+            kwargs['headers'] = headers
+            return client.patch(*args, **kwargs)
     
     return AuthClient()
 
@@ -176,3 +176,96 @@ def test_update_category_specifications(auth_client, sample_category_with_specs)
     assert updated_specs[0]['key'] == 'weight'
     assert updated_specs[0]['label'] == 'Weight (kg)'
     assert updated_specs[1]['key'] == 'size'
+
+def test_get_categories_summary(client, sample_item):
+    """Test the lightweight category listing with item counts"""
+    from utils.query_stats import track_queries
+    
+    with track_queries() as stats:
+        response = client.get('/api/categories?summary=1&counts=1')
+    
+    assert response.status_code == 200
+    categories = json.loads(response.data)
+    
+    summary = next(c for c in categories if c['id'] == sample_item.category_id)
+    assert set(summary) == {'id', 'name', 'item_count'}
+    assert summary['item_count'] == 1
+    
+    # The ETag version lookup and a single aggregate query, never a SELECT over the items themselves
+    assert stats.count == 2
+    
+    response = client.get('/api/categories?summary=1')
+    categories = json.loads(response.data)
+    assert all(set(c) == {'id', 'name'} for c in categories)
+
+def test_specifications_schema_conditional_get(client, auth_client, sample_category_with_specs):
+    """Test that the schema is revalidated with ETags and changes after a write"""
+    from utils.query_stats import track_queries
+    
+    category_id = sample_category_with_specs.id
+    url = f'/api/categories/{category_id}/specifications_schema'
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert 'no-cache' in response.headers['Cache-Control']
+    
+    # A matching If-None-Match is answered from the version row alone
+    with track_queries() as stats:
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert stats.count == 1
+    
+    auth_client.put(url, json=[{'key': 'size', 'label': 'Size', 'type': 'text'}])
+    
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [spec['key'] for spec in json.loads(response.data)] == ['size']
+
+def test_category_schema_cache_follows_writes(client, auth_client, sample_category_with_specs):
+    """Test that cached schemas are reused until a write bumps the categories version"""
+    from utils.query_stats import track_queries
+    
+    category_id = sample_category_with_specs.id
+    url = f'/api/categories/{category_id}/specifications_schema'
+    first = json.loads(client.get(url).data)
+    
+    # ETag version lookup only: the cache version was checked earlier in the
+    # test session's open transaction, and no category query runs
+    with track_queries() as stats:
+        assert json.loads(client.get(url).data) == first
+    assert stats.count == 1
+    
+    auth_client.put(f'/api/categories/{category_id}', json={
+        'name': 'Renamed',
+        'specifications_schema': [{'key': 'size', 'label': 'Size', 'type': 'select', 'options': ['S', 'M']}]
+    })
+    
+    schema = json.loads(client.get(url).data)
+    assert [(spec['key'], spec['options']) for spec in schema] == [('size', ['S', 'M'])]
+    categories = json.loads(client.get('/api/categories').data)
+    assert 'Renamed' in [category['name'] for category in categories]
+    
+    auth_client.delete(f'/api/categories/{category_id}')
+    assert client.get(url).status_code == 404
+
+
+def test_category_schema_cache_version_read_once(app, sample_category_with_specs):
+    """Test that the categories version is checked once per transaction, not per lookup"""
+    from models import db
+    from utils.query_stats import track_queries
+    from utils.schema_cache import category_schema_cache
+    
+    category_id = sample_category_with_specs.id
+    with app.app_context():
+        with track_queries() as stats:
+            for _ in range(5):
+                assert category_schema_cache.get(category_id).category_id == category_id
+            category_schema_cache.all()
+        assert sum('collection_versions' in statement for statement in stats.statements) == 1
+        
+        db.session.commit()
+        with track_queries() as stats:
+            category_schema_cache.get(category_id)
+        assert sum('collection_versions' in statement for statement in stats.statements) == 1
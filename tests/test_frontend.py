@@ -143,3 +143,122 @@ def test_uploaded_files(client, sample_item, app, sample_photo_file):
     response = client.get('/uploads/' + test_file_name)
     assert response.status_code == 200
     assert response.data == b'test file content'
+
+def test_cache_headers(client, sample_item, app, sample_photo_file):
+    """Test fingerprinted static URLs, immutable blobs, conditional and Range requests, and X-Accel-Redirect"""
+    import os
+    import re
+    from models import db, ItemPhoto
+    
+    html = client.get('/').data.decode()
+    url = re.search(r'src="(/static/app-bootstrap\.js\?v=[0-9a-f]{12})"', html).group(1)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    # Stale or missing fingerprints are revalidated
+    assert client.get('/static/app-bootstrap.js?v=000000000000').headers['Cache-Control'] == 'no-cache'
+    response = client.get('/static/app-bootstrap.js')
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/static/app-bootstrap.js',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    
+    blob = 'ab/cd/abcd' + '0' * 60 + '.jpg'
+    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'ab', 'cd'), exist_ok=True)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], blob), 'wb') as f:
+        f.write(sample_photo_file.read())
+    with app.app_context():
+        db.session.add(ItemPhoto(item_id=sample_item.id, file_path=blob))
+        db.session.commit()
+    response = client.get(f'/uploads/{blob}')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get(f'/uploads/{blob}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    response = client.get(f'/uploads/{blob}', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert len(response.data) == 10
+    assert 'immutable' in client.get(f'/uploads/thumbs/{blob}.160.webp').headers['Cache-Control']
+    
+    # Photos stored under their upload name may be replaced
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'legacy.jpg'), 'wb') as f:
+        f.write(b'test file content')
+    assert client.get('/uploads/legacy.jpg').headers['Cache-Control'] == 'no-cache'
+    
+    app.config['UPLOAD_ACCEL_REDIRECT'] = '/internal-uploads/'
+    response = client.get(f'/uploads/thumbs/{blob}.320.jpg')
+    assert response.headers['X-Accel-Redirect'] == f'/internal-uploads/thumbs/{blob}.320.jpg'
+    assert response.mimetype == 'image/jpeg'
+    assert response.data == b''
+    assert client.get('/uploads/missing.jpg').status_code == 404
+
+def test_photo_thumbnails(client, sample_item, app, sample_photo_file):
+    """Test that pages use lazy responsive variants, created on first request"""
+    import os
+    from models import db, ItemPhoto
+    
+    with app.app_context():
+        db.session.add(ItemPhoto(item_id=sample_item.id, file_path='thumb test.jpeg'))
+        db.session.commit()
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'thumb test.jpeg'), 'wb') as f:
+        f.write(sample_photo_file.read())
+    
+    html = client.get('/').data.decode()
+    assert '<source type="image/webp" srcset="/uploads/thumbs/thumb%20test.jpeg.160.webp 160w' in html
+    assert 'loading="lazy"' in html
+    
+    response = client.get('/uploads/thumbs/thumb%20test.jpeg.320.webp')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'thumbs', 'thumb test.jpeg.160.jpg'))
+    
+    # Originals that are not images are served as they are
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'plain.jpg'), 'wb') as f:
+        f.write(b'test file content')
+    assert client.get('/uploads/thumbs/plain.jpg.160.jpg').data == b'test file content'
+    assert client.get('/uploads/thumbs/plain.jpg.161.jpg').status_code == 404
+
+def test_index_render_cache(client, auth_client, app, sample_item):
+    """Test that the index page and item fragments are served from the render cache"""
+    from unittest.mock import patch
+    from utils import render_cache as cache_module
+    from utils.render_cache import render_cache, configure_render_cache
+    
+    configure_render_cache(app)
+    render_cache.clear()
+    try:
+        first = client.get('/').data
+        assert b'Test Item' in first
+        
+        # A repeated request is the cached page; nothing is rendered again
+        with patch.object(cache_module, '_render_fragments') as render_fragments:
+            assert client.get('/').data == first
+            render_fragments.assert_not_called()
+        
+        # A new item invalidates the page, but only the new item is rendered
+        auth_client.post('/api/items', json={
+            'name': 'Second Item', 'brand': 'Brand', 'category_id': sample_item.category_id
+        })
+        with patch.object(cache_module, '_render_fragments', wraps=cache_module._render_fragments) as render_fragments:
+            page = client.get('/').data
+        assert b'Second Item' in page and b'Test Item' in page
+        assert [call.args[0]['name'] for call in render_fragments.call_args_list] == ['Second Item']
+    finally:
+        render_cache.max_bytes = 0
+        render_cache.clear()
+
+
+def test_index_render_cache_after_url_edit(client, auth_client, app, sample_item):
+    """Test that removing an item's URLs renders its cached fragments again"""
+    from utils.render_cache import render_cache, configure_render_cache
+    
+    configure_render_cache(app)
+    render_cache.clear()
+    try:
+        assert b'https://example.com/test' in client.get('/').data
+        
+        # Removing every URL is a bulk delete only, no flush of URL rows
+        response = auth_client.put(f'/api/items/{sample_item.id}', json={'urls': []})
+        assert response.status_code == 200
+        
+        assert b'https://example.com/test' not in client.get('/').data
+    finally:
+        render_cache.max_bytes = 0
+        render_cache.clear()
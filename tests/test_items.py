@@ -270,6 +270,9 @@ def test_add_item_photo(auth_client, sample_item, app):
                               content_type='multipart/form-data')
     
     assert response.status_code == 201
+    # Photos are stored by content hash
+    stored_name = json.loads(response.data)['filename']
+    assert stored_name.endswith('.jpg') and stored_name.count('/') == 2
     
     # Verify photo was added
     response = auth_client.get(f'/api/items/{item_id}')
@@ -278,7 +281,7 @@ def test_add_item_photo(auth_client, sample_item, app):
     # Find the new photo
     found = False
     for photo in item['photos']:
-        if 'new_photo.jpg' in photo['filename']:
+        if photo['filename'] == stored_name:
             found = True
             
             # Verify the file exists in the upload directory
@@ -287,3 +290,468 @@ def test_add_item_photo(auth_client, sample_item, app):
             break
     
     assert found is True
+
+def test_get_items_paginated(client, app, sample_category):
+    """Test walking the item list with cursor pagination"""
+    from models import db, Item
+    
+    with app.app_context():
+        # Duplicate names make sure the id tie-breaker is part of the cursor
+        for name in ['Delta', 'Alpha', 'Charlie', 'Bravo', 'Bravo']:
+            db.session.add(Item(category_id=sample_category.id, name=name, brand='Brand'))
+        db.session.commit()
+    
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/items?limit=2' + (f'&after={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers['X-Total-Count'] == '5'
+        
+        data = json.loads(response.data)
+        assert len(data['items']) <= 2
+        seen.extend((item['name'], item['id']) for item in data['items'])
+        
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    
+    assert [name for name, _ in seen] == ['Alpha', 'Bravo', 'Bravo', 'Charlie', 'Delta']
+    assert seen == sorted(seen)
+
+def test_get_items_paginated_invalid_params(client):
+    """Test that bad pagination parameters are rejected"""
+    response = client.get('/api/items?limit=abc')
+    assert response.status_code == 400
+    
+    response = client.get('/api/items?limit=0')
+    assert response.status_code == 400
+    
+    response = client.get('/api/items?limit=10&after=not-a-cursor')
+    assert response.status_code == 400
+
+def test_get_items_does_not_fetch_cartesian_rows(client, app, sample_category_with_specs):
+    """Test that listing items fetches one row per item, without a cartesian product"""
+    from models import db, Item, ItemPhoto, ItemUrl
+    from utils.query_stats import track_queries
+    
+    with app.app_context():
+        for i in range(3):
+            item = Item(category_id=sample_category_with_specs.id, name=f'Item {i}', brand='Brand')
+            for j in range(6):
+                item.photos.append(ItemPhoto(file_path=f'item_{i}_{j}.jpg'))
+            for j in range(4):
+                item.urls.append(ItemUrl(url=f'https://example.com/{i}/{j}'))
+            db.session.add(item)
+        db.session.commit()
+        db.session.expunge_all()
+    
+    # The first request compiles the category schema into the process cache
+    client.get('/api/items')
+    with track_queries() as stats:
+        response = client.get('/api/items')
+    
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert len(data) == 3
+    assert all(len(item['photos']) == 6 and len(item['urls']) == 4 for item in data)
+    
+    # ETag version lookup + one projection row per item (photos and urls
+    # aggregated in SQL); the schema cache checked the categories version
+    # earlier in the test session's open transaction
+    assert stats.count == 2
+    assert stats.rows == 1 + 3
+
+def test_search_items(client, auth_client, sample_item):
+    """Test full-text search over item text, specifications and URLs"""
+    item_id = sample_item.id
+    
+    # Prefix match on the name, with the match highlighted in the snippet
+    response = client.get('/api/items/search?q=tes ite')
+    assert response.status_code == 200
+    results = json.loads(response.data)
+    assert [item['id'] for item in results] == [item_id]
+    assert '<mark>' in results[0]['search_snippet']
+    assert 'search_rank' in results[0]
+    
+    # Specification values, serial numbers and URLs are indexed too
+    for term in ['wood', 'ABC123', 'example.com']:
+        response = client.get(f'/api/items/search?q={term}')
+        assert [item['id'] for item in json.loads(response.data)] == [item_id]
+    
+    # Category filter
+    response = client.get(f'/api/items/search?q=red&category_id={sample_item.category_id + 1}')
+    assert json.loads(response.data) == []
+    
+    # The index follows updates and deletes
+    auth_client.put(f'/api/items/{item_id}', data={'name': 'Renamed Widget'})
+    response = client.get('/api/items/search?q=widget')
+    assert [item['id'] for item in json.loads(response.data)] == [item_id]
+    
+    auth_client.delete(f'/api/items/{item_id}')
+    response = client.get('/api/items/search?q=widget')
+    assert json.loads(response.data) == []
+
+def test_search_items_requires_query(client):
+    """Test that the search endpoint rejects an empty query and an invalid category"""
+    response = client.get('/api/items/search?q=')
+    assert response.status_code == 400
+    
+    response = client.get('/api/items/search?q=a&category_id=abc')
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'category_id must be an integer'
+
+def test_get_items_spec_filters_and_sort(client, app, sample_category_with_specs):
+    """Test filtering and sorting items by indexed specification values"""
+    from models import db, Item
+    
+    with app.app_context():
+        for name, weight, material in [('Light', '2.5', 'wood'), ('Heavy', '40', 'metal'),
+                                       ('Medium', '8', 'wood'), ('Unknown', 'n/a', 'plastic')]:
+            item = Item(category_id=sample_category_with_specs.id, name=name, brand='Brand')
+            item.set_specification_values({'weight': weight, 'material': material})
+            db.session.add(item)
+        db.session.commit()
+    
+    def names(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return [item['name'] for item in json.loads(response.data)]
+    
+    # Range filters compare numerically, not as text
+    assert names('/api/items?spec.weight__gte=8') == ['Heavy', 'Medium']
+    assert names('/api/items?spec.weight__gte=3&spec.weight__lte=10') == ['Medium']
+    assert names('/api/items?spec.material=wood') == ['Light', 'Medium']
+    assert names('/api/items?spec.weight=8.0') == ['Medium']
+    
+    # Values that are not numbers sort last
+    assert names('/api/items?sort=spec.weight') == ['Light', 'Medium', 'Heavy', 'Unknown']
+    assert names('/api/items?sort=-spec.weight') == ['Heavy', 'Medium', 'Light', 'Unknown']
+    
+    # Malformed filters are rejected
+    assert client.get('/api/items?spec.weight__gte=heavy').status_code == 400
+    assert client.get('/api/items?spec.weight__between=1').status_code == 400
+    assert client.get('/api/items?sort=name').status_code == 400
+    assert client.get('/api/items?sort=spec.weight&limit=2').status_code == 400
+
+def test_item_projection_matches_to_dict(app, sample_item):
+    """Test that the ORM-free list serialization produces exactly Item.to_dict()"""
+    from models import db, Item, ItemPhoto, ItemUrl
+    from utils.serialization import serialize_items
+    
+    with app.app_context():
+        item = Item.query.get(sample_item.id)
+        item.photos.append(ItemPhoto(file_path='second.jpg'))
+        item.urls.append(ItemUrl(url='https://example.com/second'))
+        db.session.add(Item(category_id=item.category_id, name='Bare item', brand='Brand'))
+        db.session.commit()
+        
+        expected = [it.to_dict() for it in Item.query.order_by(Item.id)]
+        assert serialize_items(Item.query.order_by(Item.id)) == expected
+
+def test_items_conditional_get(client, auth_client, sample_item):
+    """Test ETag and Last-Modified validators on the item APIs"""
+    item_id = sample_item.id
+    
+    list_etag = client.get('/api/items').headers['ETag']
+    response = client.get(f'/api/items/{item_id}')
+    item_etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert item_etag != list_etag
+    
+    assert client.get('/api/items', headers={'If-None-Match': list_etag}).status_code == 304
+    assert client.get(f'/api/items/{item_id}', headers={'If-None-Match': item_etag}).status_code == 304
+    
+    # Adding a URL is a write to the item: both validators change
+    auth_client.post(f'/api/items/{item_id}/urls', json={'url': 'https://example.com/new'})
+    
+    response = client.get('/api/items', headers={'If-None-Match': list_etag})
+    assert response.status_code == 200
+    response = client.get(f'/api/items/{item_id}', headers={'If-None-Match': item_etag})
+    assert response.status_code == 200
+    assert len(json.loads(response.data)['urls']) == 2
+
+
+def test_items_list_etag_per_representation(client, sample_item):
+    """Test that the array, a cursor page and the NDJSON stream have distinct ETags and vary on Accept"""
+    ndjson = {'Accept': 'application/x-ndjson'}
+    array = client.get('/api/items')
+    page = client.get('/api/items?limit=1')
+    stream = client.get('/api/items', headers=ndjson)
+    etags = {response.headers['ETag'] for response in (array, page, stream)}
+    assert len(etags) == 3
+    assert client.get('/api/items?limit=2').headers['ETag'] != page.headers['ETag']
+    assert all('Accept' in response.headers['Vary'] for response in (array, page, stream))
+    
+    stream.close()
+    
+    response = client.get('/api/items', headers={'If-None-Match': array.headers['ETag'], **ndjson})
+    assert response.status_code == 200
+    response.close()
+    response = client.get('/api/items', headers={'If-None-Match': stream.headers['ETag'], **ndjson})
+    assert response.status_code == 304
+    assert 'Accept' in response.headers['Vary']
+
+
+def test_item_last_modified_after_url_edit(client, auth_client, app, sample_item):
+    """Test that replacing an item's URLs, a bulk delete, moves its Last-Modified forward"""
+    from datetime import datetime
+    from models import db, Item
+    
+    item_id = sample_item.id
+    with app.app_context():
+        # Last-Modified has a resolution of seconds: start well in the past
+        db.session.get(Item, item_id).updated_at = datetime(2020, 1, 1)
+        db.session.commit()
+    last_modified = client.get(f'/api/items/{item_id}').headers['Last-Modified']
+    assert client.get(f'/api/items/{item_id}', headers={'If-Modified-Since': last_modified}).status_code == 304
+    
+    response = auth_client.put(f'/api/items/{item_id}', json={'urls': []})
+    assert response.status_code == 200
+    
+    response = client.get(f'/api/items/{item_id}', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert json.loads(response.data)['urls'] == []
+    assert response.headers['Last-Modified'] != last_modified
+
+
+def test_get_items_streaming(client, app, sample_item):
+    """Test streaming the item list as a JSON array and as NDJSON"""
+    from models import db, Item
+    
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Item(category_id=sample_item.category_id, name=f'Streamed {i}', brand='Brand'))
+        db.session.commit()
+    
+    expected = json.loads(client.get('/api/items').data)
+    
+    response = client.get('/api/items?stream=1')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert json.loads(response.data) == expected
+    
+    response = client.get('/api/items', headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == expected
+    
+    response = client.get('/api/items?stream=1&category_id=999999')
+    assert json.loads(response.data) == []
+    
+    response = client.get('/api/items?stream=1&limit=2')
+    assert response.status_code == 400
+
+def test_bulk_import_items_ndjson(client, auth_client, sample_category_with_specs):
+    """Test bulk importing items from NDJSON with a per-row error report"""
+    category_id = sample_category_with_specs.id
+    lines = [
+        json.dumps({'name': 'Bulk 1', 'brand': 'Brand', 'category_id': category_id,
+                    'specification_values': {'weight': '12'}, 'urls': ['https://example.com/b1']}),
+        json.dumps({'name': 'Bulk 2', 'brand': 'Brand', 'category': sample_category_with_specs.name,
+                    'urls': [{'url': 'https://example.com/b2'}]}),
+        json.dumps({'name': 'No brand', 'category_id': category_id}),
+        '{not json',
+        json.dumps({'name': 'Lost', 'brand': 'Brand', 'category_id': 999999}),
+    ]
+    body = '\n'.join(lines) + '\n'
+    
+    response = client.post('/api/items/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 401
+    
+    response = auth_client.post('/api/items/bulk?chunk_size=1', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert (report['rows'], report['created'], report['failed']) == (5, 2, 3)
+    assert [error['line'] for error in report['errors']] == [3, 4, 5]
+    assert report['errors'][0]['error'] == 'Brand is required'
+    
+    items = {item['name']: item for item in json.loads(client.get('/api/items').data)}
+    assert items['Bulk 1']['urls'][0]['url'] == 'https://example.com/b1'
+    assert items['Bulk 1']['specification_values'] == {'weight': '12'}
+    assert items['Bulk 2']['category_id'] == category_id
+    
+    # Imported specification values are indexed for filtering
+    filtered = json.loads(client.get('/api/items?spec.weight__gte=10').data)
+    assert [item['name'] for item in filtered] == ['Bulk 1']
+    
+    response = auth_client.post('/api/items/bulk', data=body, content_type='text/plain')
+    assert response.status_code == 415
+
+def test_bulk_import_items_invalid_utf8(client, auth_client, sample_category_with_specs):
+    """Test that rows with bytes that are not UTF-8 are reported and the other rows imported"""
+    category_id = sample_category_with_specs.id
+    body = (json.dumps({'name': 'Before', 'brand': 'Brand', 'category_id': category_id}).encode() + b'\n'
+            + b'\xff\xfe\n'
+            + json.dumps({'name': 'After', 'brand': 'Brand', 'category_id': category_id}).encode() + b'\n')
+    response = auth_client.post('/api/items/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert (report['rows'], report['created'], report['failed']) == (3, 2, 1)
+    assert report['errors'] == [{'line': 2, 'error': 'Invalid UTF-8'}]
+    
+    body = f'name,brand,category_id\nCSV \u00e9,Brand,{category_id}\n'.encode() + b'Bad \xe9,Brand,1\n'
+    response = auth_client.post('/api/items/bulk', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert (report['created'], report['failed']) == (1, 1)
+    assert report['errors'] == [{'line': 3, 'error': 'Invalid UTF-8'}]
+
+def test_delete_items_batch(client, auth_client, app, sample_category_with_specs):
+    """Test deleting several items, and their photo files, with one request"""
+    import os
+    from models import db, Item, ItemPhoto, ItemUrl
+    from utils.file_cleanup import wait_for_file_cleanup
+    
+    category_id = sample_category_with_specs.id
+    with app.app_context():
+        items = []
+        for i in range(4):
+            item = Item(category_id=category_id, name=f'Batch {i}', brand='Brand')
+            item.set_specification_values({'weight': str(i)})
+            item.urls.append(ItemUrl(url=f'https://example.com/{i}'))
+            item.photos.append(ItemPhoto(file_path=f'batch_{i}.jpg'))
+            db.session.add(item)
+            items.append(item)
+        db.session.commit()
+        ids = [item.id for item in items]
+        for i in range(4):
+            with open(os.path.join(app.config['UPLOAD_FOLDER'], f'batch_{i}.jpg'), 'wb') as f:
+                f.write(b'photo')
+    
+    response = client.delete('/api/items', json={'ids': ids[:2]})
+    assert response.status_code == 401
+    
+    response = auth_client.delete('/api/items', json={'ids': ids[:2] + [999999]})
+    assert response.status_code == 200
+    result = json.loads(response.data)
+    assert result == {'deleted': 2, 'ids': ids[:2], 'missing': [999999]}
+    
+    # Filters use the GET /api/items parameters; unknown ones are rejected
+    response = auth_client.delete('/api/items', json={'filter': {'brand': 'Brand'}})
+    assert response.status_code == 400
+    response = auth_client.delete('/api/items', json={'filter': {'spec.weight__gte': 3}})
+    assert json.loads(response.data)['ids'] == [ids[3]]
+    
+    wait_for_file_cleanup()
+    remaining = [item['id'] for item in json.loads(client.get('/api/items').data)]
+    assert remaining == [ids[2]]
+    assert [os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], f'batch_{i}.jpg')) for i in range(4)] == \
+        [False, False, True, False]
+    
+    response = auth_client.delete('/api/items', json={})
+    assert response.status_code == 400
+
+def test_export_collection(app, client, auth_client, sample_item):
+    """Test streaming the collection export as NDJSON, CSV and ZIP"""
+    import csv
+    import zipfile
+    from models import db, ItemPhoto
+    
+    with app.app_context():
+        db.session.add(ItemPhoto(item_id=sample_item.id, file_path='export_photo.jpg'))
+        db.session.commit()
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'export_photo.jpg'), 'wb') as f:
+        f.write(b'\xff\xd8photo' * 1000)
+    
+    assert client.get('/api/export').status_code == 401
+    assert auth_client.get('/api/export?format=xml').status_code == 400
+    
+    response = auth_client.get('/api/export')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [record['type'] for record in records] == ['category', 'item']
+    assert [spec['key'] for spec in records[0]['specifications']] == ['weight', 'color', 'material']
+    assert records[1]['category'] == 'Test Category with Specs'
+    assert records[1]['urls'] == ['https://example.com/test']
+    assert records[1]['photos'] == ['export_photo.jpg']
+    
+    # The NDJSON export can be imported again
+    response = auth_client.post('/api/items/bulk', data=response.data, content_type='application/x-ndjson')
+    assert json.loads(response.data)['created'] == 1
+    
+    response = auth_client.get('/api/export?format=csv')
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert [row['name'] for row in rows] == ['Test Item', 'Test Item']
+    assert rows[0]['spec.weight'] == '5'
+    
+    response = auth_client.get('/api/export?format=zip')
+    assert response.headers['Content-Disposition'] == 'attachment; filename="collection-export.zip"'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.namelist() == ['collection.ndjson', 'items.csv', 'uploads/export_photo.jpg']
+        assert archive.read('uploads/export_photo.jpg') == b'\xff\xd8photo' * 1000
+        lines = archive.read('collection.ndjson').decode().splitlines()
+        assert [json.loads(line)['type'] for line in lines] == ['category', 'item', 'item']
+
+def test_shared_photo_storage(app, client, auth_client, sample_category):
+    """Test that identical uploads share one blob that goes with its last reference"""
+    from models import db, Item, ItemPhoto
+    from utils.file_cleanup import wait_for_file_cleanup
+    from utils.photo_storage import migrate_flat_uploads
+    
+    ids = []
+    for name in ('First', 'Second'):
+        response = auth_client.post('/api/items', data={
+            'name': name, 'brand': 'Brand', 'category_id': sample_category.id,
+            'photos[]': (io.BytesIO(b'same photo'), 'photo.jpg'),
+        }, content_type='multipart/form-data')
+        ids.append(json.loads(response.data)['id'])
+    
+    with app.app_context():
+        photos = ItemPhoto.query.order_by(ItemPhoto.id).all()
+        assert photos[0].file_path == photos[1].file_path
+        assert photos[0].filename == 'photo.jpg'
+        blob = os.path.join(app.config['UPLOAD_FOLDER'], photos[0].file_path)
+    assert client.get(f'/uploads/{photos[0].file_path}').data == b'same photo'
+    
+    auth_client.delete(f'/api/items/{ids[0]}')
+    wait_for_file_cleanup()
+    assert os.path.exists(blob)
+    auth_client.delete(f'/api/items/{ids[1]}')
+    wait_for_file_cleanup()
+    assert not os.path.exists(blob)
+    
+    # Flat files from before are moved into the shared layout
+    with app.app_context():
+        item = Item(name='Legacy', brand='Brand', category_id=sample_category.id)
+        item.photos = [ItemPhoto(file_path='item_9_a.jpg'), ItemPhoto(file_path='item_9_b.jpg')]
+        db.session.add(item)
+        db.session.commit()
+        for name in ('item_9_a.jpg', 'item_9_b.jpg'):
+            with open(os.path.join(app.config['UPLOAD_FOLDER'], name), 'wb') as f:
+                f.write(b'legacy photo')
+        
+        assert migrate_flat_uploads() == (2, 0)
+        wait_for_file_cleanup()
+        paths = {photo.file_path for photo in ItemPhoto.query.all()}
+        assert len(paths) == 1
+        assert {photo.filename for photo in ItemPhoto.query.all()} == {'item_9_a.jpg', 'item_9_b.jpg'}
+        assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'item_9_a.jpg'))
+        with open(os.path.join(app.config['UPLOAD_FOLDER'], paths.pop()), 'rb') as f:
+            assert f.read() == b'legacy photo'
+
+
+def test_query_budgets(client, auth_client, sample_item):
+    """Test the statement budgets of the main endpoints and their Server-Timing header"""
+    from utils.query_stats import query_budget
+    
+    # The first requests compile the category schema into the process cache
+    client.get('/api/items')
+    client.get('/')
+    
+    with query_budget(3):
+        response = client.get('/api/items')
+    assert response.status_code == 200
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert 'desc="2 queries"' in response.headers['Server-Timing']
+    
+    with query_budget(4):
+        assert client.get(f'/api/items/{sample_item.id}').status_code == 200
+    with query_budget(8):
+        assert client.get('/').status_code == 200
+    with query_budget(20):
+        response = auth_client.put(f'/api/items/{sample_item.id}', json={'name': 'Renamed', 'urls': ['https://a.example']})
+    assert response.status_code == 200
@@ -225,3 +225,31 @@ def test_specification_ordering(app):
         assert ordered_specs[0]["key"] == "first"
         assert ordered_specs[1]["key"] == "second" 
         assert ordered_specs[2]["key"] == "third"
+
+def test_spec_values_index_follows_schema(app, sample_item):
+    """Test that indexed specification values are re-typed when the schema changes"""
+    from models import db, ItemSpecValue
+    
+    with app.app_context():
+        def indexed():
+            rows = ItemSpecValue.query.filter_by(item_id=sample_item.id).all()
+            return {row.spec_key: (row.num_value, row.text_value) for row in rows}
+        
+        # 'weight' is a number specification, the others are text/select
+        assert indexed() == {
+            'weight': (5.0, '5'),
+            'color': (None, 'Red'),
+            'material': (None, 'wood')
+        }
+        
+        # Turning 'weight' into a text specification drops its numeric value
+        category = Category.query.get(sample_item.category_id)
+        category.set_specifications_schema([{'key': 'weight', 'type': 'text'}, {'key': 'color', 'type': 'text'}])
+        db.session.commit()
+        assert indexed()['weight'] == (None, '5')
+        
+        # Replacing the values replaces the indexed rows
+        item = Item.query.get(sample_item.id)
+        item.set_specification_values({'color': 'Blue'})
+        db.session.commit()
+        assert indexed() == {'color': (None, 'Blue')}
@@ -0,0 +1,135 @@
+"""
+test_uploads.py - Tests for upload size limits and resumable uploads
+"""
+import os
+import io
+import json
+
+def _leftover_temporary_files(app):
+    return [name for name in os.listdir(app.config['UPLOAD_FOLDER']) if name.startswith('.upload-')]
+
+def test_upload_size_limits(app, auth_client, sample_item):
+    """Test that oversized requests and files are refused with 413"""
+    app.config['MAX_UPLOAD_FILE_SIZE'] = 1000
+    
+    response = auth_client.post(f'/api/items/{sample_item.id}/photos',
+                                data={'photos[]': (io.BytesIO(b'x' * 1001), 'big.jpg')},
+                                content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'error' in json.loads(response.data)
+    assert _leftover_temporary_files(app) == []
+    
+    response = auth_client.post(f'/api/items/{sample_item.id}/photos',
+                                data={'photos[]': (io.BytesIO(b'x' * 1000), 'small.jpg')},
+                                content_type='multipart/form-data')
+    assert response.status_code == 201
+    assert _leftover_temporary_files(app) == []
+    
+    app.config['MAX_CONTENT_LENGTH'] = 500
+    response = auth_client.post(f'/api/items/{sample_item.id}/photos',
+                                data={'photos[]': (io.BytesIO(b'x' * 600), 'small.jpg')},
+                                content_type='multipart/form-data')
+    assert response.status_code == 413
+
+def test_resumable_upload(app, client, auth_client, sample_item):
+    """Test uploading a photo in chunks, resuming after a wrong offset, and committing it"""
+    content = os.urandom(3000)
+    
+    assert client.post('/api/uploads', json={'filename': 'phone.jpg', 'size': len(content)}).status_code == 401
+    assert auth_client.post('/api/uploads', json={'filename': 'phone.exe', 'size': 10}).status_code == 400
+    app.config['MAX_UPLOAD_FILE_SIZE'] = 5000
+    assert auth_client.post('/api/uploads', json={'filename': 'phone.jpg', 'size': 5001}).status_code == 413
+    
+    response = auth_client.post('/api/uploads', json={'filename': 'phone.jpg', 'size': len(content)})
+    assert response.status_code == 201
+    upload = json.loads(response.data)
+    assert upload['offset'] == 0
+    url = f"/api/uploads/{upload['id']}"
+    
+    def patch(offset, data):
+        return auth_client.patch(url, data=data, headers={'Upload-Offset': str(offset)})
+    
+    assert json.loads(patch(0, content[:1000]).data)['offset'] == 1000
+    # A chunk sent again after a lost response is refused; the status tells where to go on
+    assert patch(0, content[:1000]).status_code == 409
+    assert json.loads(auth_client.get(url).data)['offset'] == 1000
+    assert auth_client.post(f'{url}/commit', json={'item_id': sample_item.id}).status_code == 409
+    assert patch(1000, content[1000:] + b'extra').status_code == 413
+    
+    offset = json.loads(auth_client.get(url).data)['offset']
+    assert json.loads(patch(offset, content[offset:]).data)['offset'] == len(content)
+    
+    assert auth_client.post(f'{url}/commit', json={'item_id': 999999}).status_code == 404
+    response = auth_client.post(f'{url}/commit', json={'item_id': sample_item.id})
+    assert response.status_code == 201
+    photo = json.loads(response.data)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], photo['filename']), 'rb') as f:
+        assert f.read() == content
+    
+    item = json.loads(client.get(f'/api/items/{sample_item.id}').data)
+    assert [p['filename'] for p in item['photos']] == [photo['filename']]
+    assert auth_client.get(url).status_code == 404
+
+def test_resumable_upload_kept_on_rollback(app, auth_client, sample_item):
+    """Test that a committed upload stays resumable until the database commit succeeds"""
+    from models import db
+    from utils.resumable_uploads import commit_upload
+    
+    content = os.urandom(2000)
+    upload = json.loads(auth_client.post('/api/uploads', json={'filename': 'a.jpg', 'size': len(content)}).data)
+    url = f"/api/uploads/{upload['id']}"
+    auth_client.patch(url, data=content, headers={'Upload-Offset': '0'})
+    
+    with app.app_context():
+        commit_upload(upload['id'], db.session.merge(sample_item))
+        db.session.rollback()
+    assert json.loads(auth_client.get(url).data)['offset'] == len(content)
+    
+    response = auth_client.post(f'{url}/commit', json={'item_id': sample_item.id})
+    assert response.status_code == 201
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], json.loads(response.data)['filename']), 'rb') as f:
+        assert f.read() == content
+    assert auth_client.get(url).status_code == 404
+    assert _leftover_temporary_files(app) == []
+
+def test_staged_photo_discarded_on_rollback(app, sample_item):
+    """Test that a photo is only moved into place when its transaction commits"""
+    from werkzeug.datastructures import FileStorage
+    from models import db
+    from utils.photo_storage import attach_photo
+    
+    with app.app_context():
+        item = db.session.merge(sample_item)
+        photo = attach_photo(item, FileStorage(io.BytesIO(b'rolled back'), filename='a.jpg'))
+        path = os.path.join(app.config['UPLOAD_FOLDER'], photo.file_path)
+        assert not os.path.exists(path)
+        assert len(_leftover_temporary_files(app)) == 1
+        db.session.rollback()
+        assert not os.path.exists(path)
+        assert _leftover_temporary_files(app) == []
+        
+        item = db.session.merge(sample_item)
+        photo = attach_photo(item, FileStorage(io.BytesIO(b'committed'), filename='b.jpg'))
+        db.session.commit()
+        assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], photo.file_path))
+        assert _leftover_temporary_files(app) == []
+        
+        # A file that cannot be placed after the commit does not stop the others
+        from unittest import mock
+        from utils import photo_storage
+        place = photo_storage._place
+        failures = [OSError('No space left on device')]
+        
+        def place_failing_once(temporary, target):
+            if failures:
+                raise failures.pop()
+            place(temporary, target)
+        
+        item = db.session.merge(sample_item)
+        lost = attach_photo(item, FileStorage(io.BytesIO(b'lost'), filename='c.jpg'))
+        kept = attach_photo(item, FileStorage(io.BytesIO(b'kept'), filename='d.jpg'))
+        with mock.patch.object(photo_storage, '_place', place_failing_once):
+            db.session.commit()
+        assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], lost.file_path))
+        assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], kept.file_path))
+        assert _leftover_temporary_files(app) == []
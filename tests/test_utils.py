@@ -1,6 +1,7 @@
 """
 test_utils.py - Tests for utility functions
 """
+import os
 import pytest
 from flask import request
 from utils.auth import requires_auth, check_auth
@@ -84,3 +85,397 @@ def test_prepare_items_for_template(app, sample_item):
                 break
         
         assert found is True
+
+def test_rebuild_search_index_command(app, sample_item):
+    """Test the rebuild-search-index CLI command"""
+    from flask_cli import register_commands
+    from utils.search import search_items
+    
+    register_commands(app)
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    
+    assert result.exit_code == 0
+    assert 'Indexed 1 items.' in result.output
+    
+    with app.app_context():
+        hits = search_items('test brand')
+        assert [hit['id'] for hit in hits] == [sample_item.id]
+
+def test_rebuild_spec_index_command(app, sample_item):
+    """Test the rebuild-spec-index CLI command"""
+    from flask_cli import register_commands
+    from models import db, ItemSpecValue
+    
+    with app.app_context():
+        db.session.query(ItemSpecValue).delete()
+        db.session.commit()
+    
+    register_commands(app)
+    result = app.test_cli_runner().invoke(args=['rebuild-spec-index'])
+    
+    assert result.exit_code == 0
+    assert 'Indexed 3 specification values.' in result.output
+    
+    with app.app_context():
+        weight = ItemSpecValue.query.filter_by(item_id=sample_item.id, spec_key='weight').one()
+        assert weight.num_value == 5.0
+
+def test_generate_thumbnails(tmp_path):
+    """Test that photo variants are upright, metadata free and never scaled up"""
+    from PIL import Image
+    from utils.thumbnails import generate_thumbnails, thumbnail_names
+    
+    image = Image.new('RGB', (800, 400), 'red')
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+    exif[0x010F] = 'Camera maker'
+    image.save(tmp_path / 'photo.jpg', exif=exif)
+    
+    assert generate_thumbnails(str(tmp_path), 'photo.jpg') == 6
+    sizes = {}
+    for name in thumbnail_names('photo.jpg'):
+        with Image.open(tmp_path / 'thumbs' / name) as variant:
+            sizes[name] = variant.size
+            assert not variant.getexif()
+    assert sizes['photo.jpg.160.webp'] == (160, 320)
+    assert sizes['photo.jpg.320.jpg'] == (320, 640)
+    assert sizes['photo.jpg.640.jpg'] == (400, 800)
+    
+    # Up to date variants are kept; files that are not images are skipped
+    assert generate_thumbnails(str(tmp_path), 'photo.jpg') == 0
+    (tmp_path / 'broken.jpg').write_bytes(b'not an image')
+    assert generate_thumbnails(str(tmp_path), 'broken.jpg') == 0
+
+def test_rebuild_thumbnails_command(app, sample_item):
+    """Test the rebuild-thumbnails CLI command"""
+    import os
+    from PIL import Image
+    from flask_cli import register_commands
+    from models import db, ItemPhoto
+    
+    with app.app_context():
+        db.session.add(ItemPhoto(item_id=sample_item.id, file_path='backfill.png'))
+        db.session.commit()
+    Image.new('RGBA', (200, 100), (0, 0, 255, 128)).save(os.path.join(app.config['UPLOAD_FOLDER'], 'backfill.png'))
+    
+    register_commands(app)
+    result = app.test_cli_runner().invoke(args=['rebuild-thumbnails', '--workers', '2'])
+    
+    assert result.exit_code == 0
+    assert 'Wrote 6 variants for 1 photos.' in result.output
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'thumbs', 'backfill.png.160.jpg'))
+
+def test_gc_uploads_command(app, sample_item):
+    """Test that gc-uploads removes old orphaned files only, and reports them on a dry run"""
+    import os
+    import time
+    from flask_cli import register_commands
+    from models import db, ItemPhoto
+    
+    with app.app_context():
+        db.session.add(ItemPhoto(item_id=sample_item.id, file_path='keep.jpg'))
+        db.session.commit()
+    folder = app.config['UPLOAD_FOLDER']
+    blob = 'ab/cd/abcd' + '1' * 60 + '.jpg'
+    files = ['keep.jpg', 'thumbs/keep.jpg.160.jpg', blob, f'thumbs/{blob}.160.webp',
+             '.upload-x1', '.trash/0123', '.partial/' + 'e' * 32, '.partial/' + 'e' * 32 + '.json']
+    for name in files + ['new.jpg']:
+        os.makedirs(os.path.dirname(os.path.join(folder, name)), exist_ok=True)
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'12345')
+    eight_days_ago = time.time() - 8 * 24 * 60 * 60
+    for name in files:
+        os.utime(os.path.join(folder, name), (eight_days_ago, eight_days_ago))
+    
+    register_commands(app)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['gc-uploads', '--dry-run'])
+    assert result.exit_code == 0
+    assert 'Would remove 5 files' in result.output
+    assert all(os.path.exists(os.path.join(folder, name)) for name in files)
+    
+    result = runner.invoke(args=['gc-uploads', '--grace', '3600', '--batch-size', '1'])
+    assert result.exit_code == 0
+    assert 'Removed 1 photos files (5 bytes)' in result.output
+    remaining = sorted(os.path.relpath(os.path.join(root, name), folder)
+                       for root, _, names in os.walk(folder) for name in names)
+    assert remaining == ['keep.jpg', 'new.jpg', 'thumbs/keep.jpg.160.jpg']
+
+def test_seed_command(app):
+    """Test that seed creates a consistent collection, the same for the same seed"""
+    import json
+    import os
+    import random
+    from flask_cli import register_commands
+    from models import db, Category, Item, ItemPhoto, ItemSpecValue
+    from utils.seed import generate_categories, generate_item
+    
+    def generated(seed):
+        rng = random.Random(seed)
+        categories = generate_categories(rng, 8)
+        return categories, [generate_item(rng, categories[n % 8], n) for n in range(20)]
+    assert generated(1) == generated(1)
+    assert generated(1) != generated(2)
+    
+    register_commands(app)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['seed', '--categories', '8', '--items', '50', '--seed', '1',
+                                 '--photo-pool', '3', '--chunk-size', '20'])
+    assert result.exit_code == 0, result.output
+    assert 'Created 8 categories and 50 items' in result.output
+    
+    with app.app_context():
+        assert Category.query.count() == 8
+        assert Item.query.count() == 50
+        assert {spec.type for category in Category.query for spec in category.specifications} == \
+            {'number', 'select', 'text'}
+        for item in Item.query:
+            specs = json.loads(item.specification_values)
+            keys = {spec.key for spec in item.category.specifications}
+            assert set(specs) <= keys
+        assert ItemSpecValue.query.filter(ItemSpecValue.num_value.isnot(None)).count() > 0
+        photo = ItemPhoto.query.first()
+        assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], photo.file_path))
+    
+    # Seeding again would clash with the categories
+    result = runner.invoke(args=['seed', '--categories', '1', '--items', '1'])
+    assert result.exit_code != 0
+    assert 'already exist' in result.output
+
+def test_query_stats_warn_on_repeated_statements(app, client, sample_item, caplog):
+    """Test that a request repeating one statement shape (N+1 lazy loads) logs a warning"""
+    import logging
+    from models import db, Item, ItemPhoto
+    from utils.query_stats import query_budget, statement_shape
+    
+    assert statement_shape('SELECT a FROM t WHERE id IN (?, ?, ?)') == statement_shape('SELECT a FROM t WHERE id IN (?)')
+    
+    with app.app_context():
+        for i in range(3):
+            item = Item(category_id=sample_item.category_id, name=f'Item {i}', brand='Brand')
+            item.photos.append(ItemPhoto(file_path=f'photo_{i}.jpg'))
+            db.session.add(item)
+        db.session.commit()
+    
+    @app.route('/photo-items')
+    def photo_items():
+        # photo.item is loaded lazily, one SELECT per photo
+        return {'items': [photo.item.name for photo in ItemPhoto.query.all()]}
+    
+    app.config['QUERY_REPEAT_THRESHOLD'] = 3
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get('/photo-items')
+    assert response.status_code == 200
+    assert 'queries"' in response.headers['Server-Timing']
+    assert any('ran the same statement' in record.getMessage() for record in caplog.records)
+    
+    with pytest.raises(AssertionError, match='budget is 2'):
+        with query_budget(2):
+            client.get('/photo-items')
+
+def test_metrics_endpoint(client, sample_item):
+    """Test that /metrics reports requests, DB time, template renders and cache lookups"""
+    assert client.get('/api/items').status_code == 200
+    assert client.get('/').status_code == 200
+    
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    lines = response.get_data(as_text=True).splitlines()
+    
+    def value(prefix):
+        return sum(float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(prefix))
+    
+    assert '# TYPE collectify_http_request_duration_seconds histogram' in lines
+    assert value('collectify_http_requests_total{endpoint="get_items",method="GET",status="200"}') >= 1
+    assert value('collectify_http_request_duration_seconds_count{endpoint="get_items",method="GET"}') >= 1
+    assert value('collectify_http_request_duration_seconds_bucket{endpoint="get_items",method="GET",le="+Inf"}') >= 1
+    assert value('collectify_db_queries_total{endpoint="get_items"}') >= 1
+    assert value('collectify_template_render_duration_seconds_count{template="index.html"}') >= 1
+    assert value('collectify_cache_requests_total{cache="category_schema"') >= 1
+    # The scrape itself is in flight; streamed responses of earlier tests
+    # left unread count under their own endpoints
+    assert value('collectify_http_requests_in_flight{endpoint="metrics"}') == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_metrics_aggregate_worker_processes(tmp_path):
+    """Test that metrics are summed over processes and survive a worker's exit, except its gauges"""
+    from flask import Flask
+    from utils.metrics import REQUESTS_IN_FLIGHT, configure_metrics, generate_latest, mark_process_dead
+    
+    def run_worker(requests):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker = Flask('worker')
+                worker.config.update(METRICS=True, METRICS_DIR=str(tmp_path))
+                configure_metrics(worker)
+                client = worker.test_client()
+                for _ in range(requests):
+                    client.get('/metrics')
+                # Killed in the middle of a request
+                REQUESTS_IN_FLIGHT.inc(endpoint='metrics')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+    
+    def value(sample):
+        lines = generate_latest(str(tmp_path)).splitlines()
+        return sum(float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(sample))
+    
+    requests = 'collectify_http_requests_total{endpoint="metrics",method="GET",status="200"}'
+    first, second = run_worker(3), run_worker(2)
+    assert value(requests) == 5
+    assert value('collectify_http_requests_in_flight{endpoint="metrics"}') == 2
+    
+    mark_process_dead(first, str(tmp_path))
+    assert value(requests) == 5
+    assert value('collectify_http_requests_in_flight{endpoint="metrics"}') == 1
+    assert not os.path.exists(tmp_path / f'counter_{first}.db')
+    
+    mark_process_dead(second, str(tmp_path))
+    assert value(requests) == 5
+    assert value('collectify_http_request_duration_seconds_count{endpoint="metrics",method="GET"}') == 5
+    assert value('collectify_http_requests_in_flight') == 0
+
+
+def test_migrations_upgrade_legacy_database(tmp_path):
+    """Test that the migration runner indexes a pre-migration database exactly once"""
+    import sqlite3
+    from utils.migrations import upgrade_database_file, latest_version
+    
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE categories (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL);
+        CREATE TABLE category_specifications (id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL,
+            key VARCHAR NOT NULL, type VARCHAR, display_order INTEGER);
+        CREATE TABLE items (id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL, name VARCHAR NOT NULL,
+            brand VARCHAR NOT NULL, serial_number VARCHAR, description TEXT, specification_values TEXT);
+        CREATE TABLE item_photos (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, file_path VARCHAR NOT NULL);
+        CREATE TABLE item_urls (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, url VARCHAR NOT NULL);
+        INSERT INTO categories VALUES (1, 'Graphics Cards');
+        INSERT INTO category_specifications VALUES (1, 1, 'memory', 'number', 0);
+        INSERT INTO items VALUES (1, 1, 'RTX 3080', 'NVIDIA', NULL, NULL, '{"memory": "10"}');
+    """)
+    conn.close()
+    
+    applied = upgrade_database_file(db_path)
+    assert [version for version, _ in applied] == list(range(1, latest_version() + 1))
+    assert upgrade_database_file(db_path) == []
+    
+    # A process that read the version before another one applied the migrations skips them
+    from unittest import mock
+    with mock.patch('utils.migrations.applied_versions', return_value=set()):
+        assert upgrade_database_file(db_path) == []
+    
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_item_photos_item_id', 'ix_item_urls_item_id', 'ix_items_name_nocase',
+            'ix_items_category_name_nocase', 'ix_category_specifications_category_id'} <= indexes
+    assert conn.execute("SELECT num_value FROM item_spec_values WHERE item_id = 1").fetchone()[0] == 10.0
+    conn.close()
+
+def test_migrations_retry_search_index_without_fts5(tmp_path):
+    """Test that the search index migration stays pending while FTS5 is unavailable"""
+    import sqlite3
+    from unittest import mock
+    from utils import search
+    from utils.migrations import upgrade_database_file, latest_version
+    
+    db_path = str(tmp_path / 'no_fts.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE categories (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL);
+        CREATE TABLE category_specifications (id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL,
+            key VARCHAR NOT NULL, type VARCHAR, display_order INTEGER);
+        CREATE TABLE items (id INTEGER PRIMARY KEY, category_id INTEGER NOT NULL, name VARCHAR NOT NULL,
+            brand VARCHAR NOT NULL, serial_number VARCHAR, description TEXT, specification_values TEXT);
+        CREATE TABLE item_photos (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, file_path VARCHAR NOT NULL);
+        CREATE TABLE item_urls (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, url VARCHAR NOT NULL);
+    """)
+    conn.close()
+    
+    # A build without FTS5 fails with "no such module: fts5"
+    with mock.patch.object(search, 'SCHEMA_STATEMENTS', ['CREATE VIRTUAL TABLE missing USING nofts5 (a)']):
+        applied = upgrade_database_file(db_path)
+    assert [version for version, _ in applied] == [v for v in range(1, latest_version() + 1) if v != 4]
+    
+    assert upgrade_database_file(db_path) == [(4, 'Create the full-text search index')]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (search.FTS_TABLE,)).fetchone()
+    conn.close()
+
+
+def test_sqlite_pragmas_from_env():
+    """Test that SQLite pragmas are read from the environment and validated"""
+    from config import sqlite_pragmas_from_env
+    
+    pragmas = sqlite_pragmas_from_env({'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_MMAP_SIZE': ''})
+    assert pragmas['journal_mode'] == 'DELETE'
+    assert pragmas['busy_timeout'] == 5000
+    assert 'mmap_size' not in pragmas
+    
+    with pytest.raises(ValueError):
+        sqlite_pragmas_from_env({'SQLITE_SYNCHRONOUS': 'sometimes'})
+    with pytest.raises(ValueError):
+        sqlite_pragmas_from_env({'SQLITE_CACHE_SIZE': 'lots'})
+
+def test_db_pragmas_command(tmp_path):
+    """Test that configured pragmas apply to new connections and are reported"""
+    from config import create_app
+    from flask_cli import register_commands
+    from models import db
+    from utils.database import configure_sqlite_engine
+    
+    file_app = create_app()
+    file_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    file_app.config['SQLITE_PRAGMAS']['busy_timeout'] = 1234
+    db.init_app(file_app)
+    configure_sqlite_engine(file_app)
+    register_commands(file_app)
+    
+    result = file_app.test_cli_runner().invoke(args=['db-pragmas'])
+    
+    assert result.exit_code == 0
+    assert 'journal_mode  wal' in result.output
+    assert 'busy_timeout  1234' in result.output
+    assert 'foreign_keys  1' in result.output
+    with file_app.app_context():
+        db.engine.dispose()
+
+def test_import_items_command(app, sample_category_with_specs, tmp_path):
+    """Test the import-items CLI command with CSV and NDJSON files"""
+    import json
+    from flask_cli import register_commands
+    from models import Item
+    
+    csv_path = tmp_path / 'items.csv'
+    csv_path.write_text(
+        'name,brand,category,urls,spec.weight\n'
+        f'CSV Item,Brand,{sample_category_with_specs.name},https://example.com/a https://example.com/b,7\n'
+        f'Missing Brand,,{sample_category_with_specs.name},,\n'
+    )
+    
+    register_commands(app)
+    result = app.test_cli_runner().invoke(args=['import-items', str(csv_path)])
+    
+    assert result.exit_code == 0
+    assert 'Imported 1 of 2 rows' in result.output
+    assert 'line 3: Brand is required' in result.output
+    
+    with app.app_context():
+        item = Item.query.filter_by(name='CSV Item').one()
+        assert [url.url for url in item.urls] == ['https://example.com/a', 'https://example.com/b']
+        assert item.get_specification_values() == {'weight': '7'}
+    
+    ndjson_path = tmp_path / 'items.ndjson'
+    ndjson_path.write_bytes(b'\xff{"name": "Broken"}\n'
+                            + json.dumps({'name': 'Decoded', 'brand': 'Brand',
+                                          'category_id': sample_category_with_specs.id}).encode() + b'\n')
+    result = app.test_cli_runner().invoke(args=['import-items', str(ndjson_path)])
+    assert result.exit_code == 0
+    assert 'Imported 1 of 2 rows' in result.output
+    assert 'line 1: Invalid UTF-8' in result.output
@@ -0,0 +1,241 @@
+"""Bulk item import from NDJSON or CSV streams.
+
+Records are read lazily from the input, validated in chunks and inserted
+with one batched INSERT per table per chunk, each chunk in its own
+transaction. A failing row never aborts the import: it is reported with
+its line number and the remaining rows go on.
+
+NDJSON: one object per line, with the fields of ``POST /api/items``
+(``name``, ``brand``, ``category_id`` or ``category`` by name,
+``serial_number``, ``form_factor``, ``description``, ``specification_values``
+and ``urls``). Lines with a ``type`` other than ``item``, such as the
+category lines of an export (see utils.export), are skipped.
+
+CSV: a header row naming the same fields. ``urls`` holds whitespace
+separated URLs and specification values go in ``spec.<key>`` columns.
+"""
+import csv
+import io
+import json
+import re
+import time
+from models import db, Item, ItemUrl, ItemSpecValue, Category, CategorySpecification
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Error reports stop listing rows after this many failures
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('ndjson', 'csv')
+
+_TEXT_FIELDS = ('serial_number', 'form_factor', 'description')
+
+# Bytes that are not valid UTF-8 are decoded to lone surrogates (the
+# surrogateescape error handler), so the row holding them can be reported
+_UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+class ImportRowError(ValueError):
+    """Raised when an imported record is invalid."""
+
+
+def read_ndjson(stream):
+    """Yield (line_number, record) from a text stream of NDJSON; record is an ImportRowError if unparsable."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        if _UNDECODABLE.search(line):
+            yield line_number, ImportRowError('Invalid UTF-8')
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, ImportRowError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield line_number, ImportRowError('Each line must be a JSON object')
+            continue
+        if record.get('type', 'item') != 'item':
+            continue
+        yield line_number, record
+
+
+def read_csv(stream):
+    """Yield (line_number, record) from a text stream of CSV with a header row; record is an ImportRowError if undecodable."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        if any(_UNDECODABLE.search(text) for text in (*row.keys(), *row.values()) if isinstance(text, str)):
+            yield reader.line_num, ImportRowError('Invalid UTF-8')
+            continue
+        record = {}
+        specs = {}
+        for column, value in row.items():
+            if column is None or value is None or value == '':
+                continue
+            if column.startswith('spec.'):
+                specs[column[len('spec.'):]] = value
+            elif column == 'urls':
+                record['urls'] = value.split()
+            else:
+                record[column] = value
+        if specs:
+            record['specification_values'] = specs
+        yield reader.line_num, record
+
+
+def read_records(stream, file_format):
+    """Yield (line_number, record) from a binary or text stream in the given format.
+
+    Rows with bytes that are not valid UTF-8 are reported like other invalid rows.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported import format: {file_format}")
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape',
+                                  newline='' if file_format == 'csv' else None)
+    return read_csv(stream) if file_format == 'csv' else read_ndjson(stream)
+
+
+class ItemImporter:
+    """Validates records and inserts them in chunked transactions.
+
+    Categories and their number specifications are loaded once when the
+    importer is created.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.category_ids = {}
+        self.category_names = {}
+        for category_id, name in db.session.query(Category.id, Category.name):
+            self.category_ids[category_id] = name
+            self.category_names[name] = category_id
+        self.number_keys = {}
+        for category_id, key in db.session.query(CategorySpecification.category_id, CategorySpecification.key).filter(
+                CategorySpecification.type == 'number'):
+            self.number_keys.setdefault(category_id, set()).add(key)
+
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def validate(self, record):
+        """Turn a record into (item_row, urls, specs) or raise ImportRowError."""
+        if not record.get('name'):
+            raise ImportRowError('Name is required')
+        if not record.get('brand'):
+            raise ImportRowError('Brand is required')
+
+        category_id = record.get('category_id')
+        if category_id not in (None, ''):
+            try:
+                category_id = int(category_id)
+            except (TypeError, ValueError):
+                raise ImportRowError('category_id must be an integer')
+            if category_id not in self.category_ids:
+                raise ImportRowError('Selected category does not exist')
+        elif record.get('category'):
+            category_id = self.category_names.get(record['category'])
+            if category_id is None:
+                raise ImportRowError(f"Unknown category: {record['category']}")
+        else:
+            raise ImportRowError('Category is required')
+
+        specs = record.get('specification_values') or {}
+        if isinstance(specs, str):
+            try:
+                specs = json.loads(specs)
+            except ValueError:
+                raise ImportRowError('specification_values must be a JSON object')
+        if not isinstance(specs, dict):
+            raise ImportRowError('specification_values must be a JSON object')
+
+        urls = record.get('urls') or []
+        if not isinstance(urls, list):
+            raise ImportRowError('urls must be a list')
+        urls = [url.get('url') if isinstance(url, dict) else url for url in urls]
+        if not all(isinstance(url, str) for url in urls):
+            raise ImportRowError('urls must contain strings or {"url": ...} objects')
+
+        item_row = {
+            'category_id': category_id,
+            'name': str(record['name']),
+            'brand': str(record['brand']),
+            'specification_values': json.dumps(specs),
+        }
+        for field in _TEXT_FIELDS:
+            value = record.get(field)
+            item_row[field] = None if value is None else str(value)
+        return item_row, [url for url in urls if url], specs
+
+    def _error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def _insert_chunk(self, chunk):
+        """Insert validated (line_number, item_row, urls, specs) tuples in one transaction."""
+        items = Item.__table__
+        try:
+            # insertmanyvalues batches the rows and hands back ids in parameter order
+            ids = db.session.execute(
+                items.insert().returning(items.c.id, sort_by_parameter_order=True),
+                [item_row for _, item_row, _, _ in chunk]
+            ).scalars().all()
+
+            url_rows = []
+            spec_rows = []
+            for item_id, (_, item_row, urls, specs) in zip(ids, chunk):
+                url_rows.extend({'item_id': item_id, 'url': url} for url in urls)
+                number_keys = self.number_keys.get(item_row['category_id'], set())
+                spec_rows.extend(
+                    {'item_id': item_id, 'spec_key': key, 'num_value': num_value, 'text_value': text_value}
+                    for key, num_value, text_value in ItemSpecValue.project(specs, number_keys)
+                )
+            if url_rows:
+                db.session.execute(ItemUrl.__table__.insert(), url_rows)
+            if spec_rows:
+                db.session.execute(ItemSpecValue.__table__.insert(), spec_rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for line_number, _, _, _ in chunk:
+                self._error(line_number, f'Chunk failed: {e}')
+            return
+        self.created += len(chunk)
+
+    def run(self, records):
+        """Import (line_number, record) pairs; returns the report (see report())."""
+        started = time.perf_counter()
+        chunk = []
+        for line_number, record in records:
+            self.rows += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                chunk.append((line_number, *self.validate(record)))
+            except ImportRowError as e:
+                self._error(line_number, str(e))
+            if len(chunk) >= self.chunk_size:
+                self._insert_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._insert_chunk(chunk)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, seconds):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows / seconds, 1) if seconds > 0 else None,
+        }
+
+
+def import_items(stream, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import items from a stream of NDJSON or CSV and return the report dict."""
+    return ItemImporter(chunk_size=chunk_size).run(read_records(stream, file_format))
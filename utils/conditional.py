@@ -0,0 +1,185 @@
+"""Conditional GET support for the item and category APIs.
+
+Every flush that writes items, photos, URLs, categories or specifications
+bumps a counter in ``collection_versions`` inside the same transaction, so
+all worker processes see the change together with the data. Read endpoints
+derive a strong ETag from these counters and, with the conditional_get
+decorator, answer a matching ``If-None-Match`` with 304 Not Modified after
+reading a single row, before any item or category query runs.
+"""
+import time
+from datetime import datetime
+from functools import wraps
+from itertools import chain
+from flask import current_app, request
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from models import db, Item, CollectionVersion
+
+ITEMS = 'items'
+CATEGORIES = 'categories'
+
+# Session.info key of the collections written in the current transaction
+_CHANGED_KEY = 'changed_collections'
+
+# Collections whose API representation changes when each table is written.
+# Item dicts embed the category name and specification labels, so category
+# writes invalidate the item collection as well.
+TABLE_COLLECTIONS = {
+    'items': (ITEMS,),
+    'item_photos': (ITEMS,),
+    'item_urls': (ITEMS,),
+    'categories': (CATEGORIES, ITEMS),
+    'category_specifications': (CATEGORIES, ITEMS),
+}
+
+
+# Photo and URL changes are changes to their item (and its updated_at)
+_ITEM_CHILD_TABLES = ('item_photos', 'item_urls')
+
+# Item ids per UPDATE when a bulk insert touches their items
+_TOUCH_BATCH_SIZE = 500
+
+
+def bump_collection_versions(connection, names):
+    """Increment the version of each named collection on a Core connection."""
+    table = CollectionVersion.__table__
+    for name in sorted(names):
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            # Start from the clock rather than 1, so the ETags of a recreated
+            # database never repeat ones that clients still hold
+            connection.execute(insert(table).values(name=name, version=time.time_ns() // 1000))
+
+
+def uncommitted_collections(session=None):
+    """Names of the collections the session has written in its open transaction.
+
+    Versions read inside such a transaction may still be rolled back, so they
+    must not be used as cache keys.
+    """
+    session = session or db.session
+    return session.info.get(_CHANGED_KEY, frozenset())
+
+
+def collection_versions(*names):
+    """Return the current version of each named collection (0 if never written)."""
+    rows = db.session.execute(
+        select(CollectionVersion.name, CollectionVersion.version).where(CollectionVersion.name.in_(names))
+    )
+    versions = dict(rows.all())
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def collection_etag(*names, scope=None):
+    """Build an ETag value from collection versions, e.g. ``item-7.items-12``."""
+    parts = [f'{name}-{version}' for name, version in zip(names, collection_versions(*names))]
+    if scope:
+        parts.insert(0, scope)
+    return '.'.join(parts)
+
+
+def conditional_get(make_etag, vary=()):
+    """Decorator answering GET requests conditionally.
+
+    ``make_etag`` receives the view's arguments and must be cheap: it runs
+    before the view, and if the client already holds that ETag the view is
+    skipped entirely. Successful responses get the ETag, plus any
+    Last-Modified the view set, and must be revalidated before reuse.
+    ``vary`` names the request headers the representation depends on; the
+    ETag must then depend on them as well.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            etag = make_etag(*args, **kwargs)
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.cache_control.no_cache = True
+                response.vary.update(vary)
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            response.vary.update(vary)
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.cache_control.no_cache = True
+                # make_conditional() would buffer a streamed body to compute
+                # its length; If-None-Match was already answered above
+                if not response.is_streamed:
+                    response = response.make_conditional(request)
+            return response
+        return decorated
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions_after_flush(session, flush_context):
+    # The new/dirty/deleted sets still describe what this flush wrote
+    changed = set()
+    touched_item_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        names = TABLE_COLLECTIONS.get(getattr(obj, '__tablename__', None))
+        if not names or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        changed.update(names)
+        if obj.__tablename__ in _ITEM_CHILD_TABLES and obj.item_id is not None:
+            touched_item_ids.add(obj.item_id)
+
+    if not changed:
+        return
+    session.info.setdefault(_CHANGED_KEY, set()).update(changed)
+    connection = session.connection()
+    if touched_item_ids:
+        # Photo and URL changes are changes to their item
+        connection.execute(
+            update(Item.__table__).where(Item.__table__.c.id.in_(touched_item_ids))
+            .values(updated_at=datetime.utcnow())
+        )
+    bump_collection_versions(connection, changed)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_versions_on_bulk_writes(orm_execute_state):
+    # Query.delete()/update() and session.execute(insert(...)) skip the flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    names = TABLE_COLLECTIONS.get(getattr(table, 'name', None))
+    if names:
+        orm_execute_state.session.info.setdefault(_CHANGED_KEY, set()).update(names)
+        connection = orm_execute_state.session.connection()
+        if table.name in _ITEM_CHILD_TABLES:
+            _touch_parent_items(connection, orm_execute_state, table)
+        bump_collection_versions(connection, names)
+
+
+def _touch_parent_items(connection, orm_execute_state, table):
+    """Stamp updated_at of the items whose photos or URLs a bulk statement writes.
+
+    Runs before the statement, while the rows a DELETE removes still exist.
+    """
+    items = Item.__table__
+    touch = update(items).values(updated_at=datetime.utcnow())
+    if orm_execute_state.is_insert:
+        parameters = orm_execute_state.parameters or ()
+        if isinstance(parameters, dict):
+            parameters = [parameters]
+        item_ids = sorted({row.get('item_id') for row in parameters if isinstance(row, dict)} - {None})
+        # Batched to stay under SQLite's limit on bound parameters
+        for start in range(0, len(item_ids), _TOUCH_BATCH_SIZE):
+            connection.execute(touch.where(items.c.id.in_(item_ids[start:start + _TOUCH_BATCH_SIZE])))
+    else:
+        item_ids = select(table.c.item_id)
+        if orm_execute_state.statement.whereclause is not None:
+            item_ids = item_ids.where(orm_execute_state.statement.whereclause)
+        connection.execute(touch.where(items.c.id.in_(item_ids)))
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed_collections(session, *args):
+    session.info.pop(_CHANGED_KEY, None)
@@ -1,6 +1,48 @@
 """Database initialization and management functions."""
 import os
-from models import db, Category
+import json
+from sqlalchemy import event
+from config import SQLITE_PRAGMA_DEFAULTS
+from models import db, Category, CategorySpecification, Item, ItemSpecValue
+# Imported for its side effect: creates the FTS index alongside the tables
+import utils.search  # noqa: F401
+from utils.migrations import upgrade_app_database
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run ``PRAGMA name = value`` for each entry of pragmas on a sqlite3 connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+def configure_sqlite_engine(app):
+    """Apply app.config['SQLITE_PRAGMAS'] to every new connection of the app's engine.
+    
+    Must be called after db.init_app(app) and before the first connection is
+    opened; connections already in the pool keep their settings.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+def sqlite_pragma_report():
+    """Return the effective value of every tunable pragma on a pooled connection."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return {}
+    report = {}
+    for variable in SQLITE_PRAGMA_DEFAULTS:
+        pragma = variable[len('SQLITE_'):].lower()
+        report[pragma] = connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+    return report
 
 def init_db(app, drop_all=False):
     """Initialize the database with SQLAlchemy models.
@@ -19,6 +61,9 @@ def init_db(app, drop_all=False):
         print("[DB] Creating all tables...")
         db.create_all()
         
+        # Bring tables that already existed up to date (indexes, columns)
+        upgrade_app_database()
+        
         # Add a default category if none exist
         if not Category.query.first():
             print("[DB] Adding default category...")
@@ -53,6 +98,9 @@ def ensure_db_initialized(app):
                 # Try to query the database to check if tables exist
                 Category.query.first()
                 print(f"[DB] Database verified at: {db_path}")
+                applied = upgrade_app_database()
+                if applied:
+                    print(f"[DB] Database upgraded to version {applied[-1][0]}.")
         except Exception as e:
             print(f"[DB] Error verifying database: {str(e)}")
             needs_init = True
@@ -65,3 +113,39 @@ def ensure_db_initialized(app):
         return True
     
     return False
+
+def rebuild_spec_value_index(batch_size=1000):
+    """Rebuild the item_spec_values table from Item.specification_values.
+
+    Needed once for databases created before the table existed; afterwards
+    the models keep it in sync. Returns the number of rows written.
+    """
+    number_keys = {}
+    for category_id, key in db.session.query(CategorySpecification.category_id, CategorySpecification.key).filter(
+            CategorySpecification.type == 'number'):
+        number_keys.setdefault(category_id, set()).add(key)
+    
+    db.session.query(ItemSpecValue).delete()
+    
+    written = 0
+    batch = []
+    items = db.session.query(Item.id, Item.category_id, Item.specification_values).yield_per(batch_size)
+    for item_id, category_id, specification_values in items:
+        try:
+            values = json.loads(specification_values) if specification_values else {}
+        except ValueError:
+            continue
+        if not isinstance(values, dict):
+            continue
+        for key, num_value, text_value in ItemSpecValue.project(values, number_keys.get(category_id, set())):
+            batch.append({'item_id': item_id, 'spec_key': key, 'num_value': num_value, 'text_value': text_value})
+        if len(batch) >= batch_size:
+            db.session.execute(ItemSpecValue.__table__.insert(), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(ItemSpecValue.__table__.insert(), batch)
+        written += len(batch)
+    
+    db.session.commit()
+    return written
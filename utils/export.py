@@ -0,0 +1,198 @@
+"""Streaming export of the whole collection.
+
+Every format is produced as a generator of byte chunks; rows come from
+server-side cursors in batches and photo files are read in fixed-size
+blocks, so memory use does not depend on the size of the collection.
+
+* ``ndjson``: one ``{"type": "category", ...}`` line per category (with its
+  specifications), then one ``{"type": "item", ...}`` line per item. Item
+  lines use the fields of the bulk import (see utils.bulk_import), which
+  skips the category lines, so an export can be imported again.
+* ``csv``: the items in the bulk import CSV layout, specification values in
+  ``spec.<key>`` columns and URLs and photos separated by whitespace.
+* ``zip``: ``collection.ndjson`` and ``items.csv`` as above plus the photo
+  files under ``uploads/``. Entries are written with data descriptors, so
+  the archive is streamed without seeking back; photos are stored as they
+  are since JPEG and PNG data does not compress.
+
+All reads of one export happen in a single transaction and see one snapshot.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select
+from models import db, Item, ItemPhoto, ItemSpecValue
+from utils.pagination import item_sort_columns
+from utils.photo_storage import is_upload_path
+from utils.schema_cache import category_schema_cache
+from utils.serialization import NDJSON_MIMETYPE, STREAM_BATCH_SIZE, iter_serialized_items
+
+FORMATS = ('ndjson', 'csv', 'zip')
+
+MIMETYPES = {
+    'ndjson': NDJSON_MIMETYPE,
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+}
+
+# Bytes read from a photo file at a time
+FILE_CHUNK_SIZE = 64 * 1024
+
+CSV_FIELDS = ('id', 'name', 'brand', 'category', 'serial_number', 'form_factor', 'description', 'urls', 'photos')
+
+
+def export_filename(file_format):
+    return f'collection-export.{file_format}'
+
+
+def _item_record(item):
+    return {
+        'type': 'item',
+        'id': item['id'],
+        'category': item['category_name'],
+        'name': item['name'],
+        'brand': item['brand'],
+        'serial_number': item['serial_number'],
+        'form_factor': item['form_factor'],
+        'description': item['description'],
+        'specification_values': item['specification_values'],
+        'urls': [url['url'] for url in item['urls']],
+        'photos': [photo['filename'] for photo in item['photos']],
+    }
+
+
+def _exported_items():
+    return iter_serialized_items(Item.query.order_by(*item_sort_columns()))
+
+
+def iter_ndjson():
+    """Yield the NDJSON export in chunks of bytes."""
+    dumps = current_app.json.dumps
+    for schema in category_schema_cache.all():
+        record = {'type': 'category', 'id': schema.category_id, 'name': schema.name,
+                  'specifications': schema.specifications}
+        yield (dumps(record) + '\n').encode('utf-8')
+
+    lines = []
+    for item in _exported_items():
+        lines.append(dumps(_item_record(item)))
+        if len(lines) >= STREAM_BATCH_SIZE:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _csv_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return current_app.json.dumps(value)
+
+
+def iter_csv():
+    """Yield the CSV export of the items in chunks of bytes."""
+    spec_keys = db.session.execute(
+        select(ItemSpecValue.spec_key).distinct().order_by(ItemSpecValue.spec_key)
+    ).scalars().all()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS + tuple(f'spec.{key}' for key in spec_keys))
+
+    for count, item in enumerate(_exported_items(), start=1):
+        record = _item_record(item)
+        record['urls'] = ' '.join(record['urls'])
+        record['photos'] = ' '.join(record['photos'])
+        specs = record['specification_values']
+        writer.writerow([record[field] for field in CSV_FIELDS] +
+                        [_csv_value(specs.get(key)) for key in spec_keys])
+        if count % STREAM_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_photo_files():
+    """Yield (filename, path) of each distinct photo file present in the upload folder."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filenames = db.session.execute(
+        select(ItemPhoto.file_path).distinct().order_by(ItemPhoto.file_path)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    ).scalars()
+    for filename in filenames:
+        if not is_upload_path(filename):
+            continue
+        path = os.path.join(upload_folder, filename)
+        if os.path.isfile(path):
+            yield filename, path
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file collecting what ZipFile writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_entry(name, compress_type, size=None, mtime=None):
+    date_time = datetime.fromtimestamp(mtime).timetuple()[:6] if mtime else datetime.now().timetuple()[:6]
+    info = zipfile.ZipInfo(name, date_time=max(date_time, (1980, 1, 1, 0, 0, 0)))
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    if size is not None:
+        info.file_size = size
+    return info
+
+
+def iter_zip():
+    """Yield a ZIP archive of the NDJSON and CSV exports and the photo files in chunks of bytes."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for name, chunks in (('collection.ndjson', iter_ndjson()), ('items.csv', iter_csv())):
+            # Sizes are unknown until written, so always leave room for ZIP64
+            with archive.open(_zip_entry(name, zipfile.ZIP_DEFLATED), 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield sink.drain()
+
+        for filename, path in iter_photo_files():
+            try:
+                source = open(path, 'rb')
+            except OSError:
+                continue  # Removed since it was listed
+            with source:
+                stat = os.fstat(source.fileno())
+                info = _zip_entry(f'uploads/{filename}', zipfile.ZIP_STORED, stat.st_size, stat.st_mtime)
+                with archive.open(info, 'w') as entry:
+                    while True:
+                        block = source.read(FILE_CHUNK_SIZE)
+                        if not block:
+                            break
+                        entry.write(block)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_export(file_format):
+    """Yield the export in the given format (see FORMATS) as chunks of bytes."""
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    generate = {'ndjson': iter_ndjson, 'csv': iter_csv, 'zip': iter_zip}[file_format]
+    # Skip the empty drains between ZIP writes that did not reach the sink
+    return (chunk for chunk in generate() if chunk)
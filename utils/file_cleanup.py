@@ -0,0 +1,39 @@
+"""Background removal of uploaded files that are no longer referenced.
+
+Deleting photo files inline makes every delete request wait on the disk,
+and removing them before the transaction commits loses files if it rolls
+back. Routes instead commit first and hand the paths to a single
+background thread (see utils.photo_storage.commit_releasing_uploads). Files
+that get left behind anyway (e.g. the process exits first) are orphans that
+``flask gc-uploads`` collects (see utils.upload_gc).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-cleanup')
+
+
+def _remove_files(paths):
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error deleting file {path}: {e}")
+    return removed
+
+
+def remove_files_later(paths):
+    """Schedule the removal of files by absolute path; returns a Future of the count removed.
+
+    Call only after the transaction that dropped their references committed.
+    """
+    return _executor.submit(_remove_files, list(paths))
+
+
+def wait_for_file_cleanup():
+    """Block until every removal scheduled so far has run (the worker is FIFO)."""
+    _executor.submit(lambda: None).result()
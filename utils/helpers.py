@@ -1,12 +1,161 @@
 """Helper functions for routes."""
 from flask import request, has_request_context
-from models import Item
-from sqlalchemy import or_
+from models import db, Item, Category, ItemSpecValue, ItemPhoto, ItemUrl
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from utils.pagination import item_sort_columns
+from utils.search import search_index_available, search_items
+from utils.serialization import serialize_items
 
-def prepare_items_for_template(category_id=None, search=None):
-    """Helper function to prepare items for template rendering."""
+def item_list_options():
+    """Loader options for queries that serialize many items with to_dict().
+
+    The many-to-one category is joined, while collections are fetched with one
+    batched IN query each, so the result set never becomes a cartesian product.
+    """
+    return (
+        joinedload(Item.category).selectinload(Category.specifications),
+        selectinload(Item.photos),
+        selectinload(Item.urls),
+    )
+
+def item_detail_options():
+    """Loader options for fetching a single item with all its related data.
+
+    A single item can absorb one collection join without multiplying rows;
+    the second collection is fetched separately to avoid photos x urls.
+    """
+    return (
+        joinedload(Item.category).selectinload(Category.specifications),
+        joinedload(Item.photos),
+        selectinload(Item.urls),
+    )
+
+SPEC_PARAM_PREFIX = 'spec.'
+
+def apply_spec_filters(query, args):
+    """Filter an item query by its indexed specification values.
+
+    Supported query parameters (``args`` is a MultiDict such as request.args):
+        spec.<key>=<value>   value equals (numerically for number specs)
+        spec.<key>__gte=<n>  numeric value >= n
+        spec.<key>__lte=<n>  numeric value <= n
+
+    Each filter becomes an ``items.id IN (...)`` subquery answered by the
+    (spec_key, num_value) or (spec_key, text_value) index.
+
+    Raises:
+        ValueError: If a filter is malformed
+    """
+    for param, value in args.items(multi=True):
+        if not param.startswith(SPEC_PARAM_PREFIX):
+            continue
+        key, _, operator = param[len(SPEC_PARAM_PREFIX):].partition('__')
+        if not key:
+            raise ValueError(f'Invalid specification filter: {param}')
+        
+        if operator == '':
+            number = ItemSpecValue.to_number(value)
+            condition = ItemSpecValue.text_value == value
+            if number is not None:
+                condition = or_(ItemSpecValue.num_value == number, condition)
+        elif operator in ('gte', 'lte'):
+            number = ItemSpecValue.to_number(value)
+            if number is None:
+                raise ValueError(f'{param} must be a number')
+            if operator == 'gte':
+                condition = ItemSpecValue.num_value >= number
+            else:
+                condition = ItemSpecValue.num_value <= number
+        else:
+            raise ValueError(f'Unsupported specification filter operator: {operator}')
+        
+        matching = select(ItemSpecValue.item_id).where(ItemSpecValue.spec_key == key, condition)
+        query = query.filter(Item.id.in_(matching))
+    return query
+
+def apply_spec_sort(query, sort):
+    """Order an item query by a specification value: ``spec.<key>`` or ``-spec.<key>``.
+
+    Numeric values sort before text ones; items without the key come last.
+
+    Raises:
+        ValueError: If the sort parameter is not a specification sort
+    """
+    descending = sort.startswith('-')
+    field = sort[1:] if descending else sort
+    if not field.startswith(SPEC_PARAM_PREFIX) or len(field) == len(SPEC_PARAM_PREFIX):
+        raise ValueError(f'Unsupported sort: {sort}')
+    key = field[len(SPEC_PARAM_PREFIX):]
+    
+    sort_value = aliased(ItemSpecValue)
+    query = query.outerjoin(sort_value, (sort_value.item_id == Item.id) & (sort_value.spec_key == key))
+    if descending:
+        ordering = (sort_value.num_value.desc().nulls_last(), sort_value.text_value.desc().nulls_last())
+    else:
+        ordering = (sort_value.num_value.asc().nulls_last(), sort_value.text_value.asc().nulls_last())
+    return query.order_by(*ordering, *item_sort_columns())
+
+def delete_items_where(*conditions, batch_size=500):
+    """Delete the items matching conditions, with their photos, URLs and spec values.
+
+    The matching ids are resolved first (the conditions may refer to the
+    spec values being deleted), then each batch of ids is removed with one
+    set-based DELETE per table, children first. Runs in the current
+    transaction and does not commit. Photo files are left on disk.
+
+    Returns:
+        Tuple of (deleted item ids, file paths of their photos)
+    """
+    deleted_ids = db.session.execute(select(Item.id).where(*conditions).order_by(Item.id)).scalars().all()
+    photo_files = []
+    for start in range(0, len(deleted_ids), batch_size):
+        batch = deleted_ids[start:start + batch_size]
+        photo_files.extend(db.session.execute(
+            select(ItemPhoto.file_path).where(ItemPhoto.item_id.in_(batch))
+        ).scalars())
+        for model in (ItemPhoto, ItemUrl, ItemSpecValue):
+            db.session.execute(delete(model).where(model.item_id.in_(batch)),
+                               execution_options={'synchronize_session': False})
+        db.session.execute(delete(Item).where(Item.id.in_(batch)),
+                           execution_options={'synchronize_session': False})
+    # Drop instances of the deleted rows from the identity map
+    db.session.expire_all()
+    return deleted_ids, photo_files
+
+def get_category_summaries(with_counts=False):
+    """List categories as plain ``{id, name}`` dicts ordered by name.
+
+    Only the two columns are selected, so neither items nor specifications
+    are loaded. With ``with_counts`` each dict also gets an ``item_count``,
+    computed by a single GROUP BY over items joined to the category list.
+    """
+    query = db.session.query(Category.id, Category.name)
+    if with_counts:
+        counts = (db.session.query(Item.category_id, func.count(Item.id).label('item_count'))
+                  .group_by(Item.category_id)
+                  .subquery())
+        query = (query.add_columns(func.coalesce(counts.c.item_count, 0))
+                 .outerjoin(counts, counts.c.category_id == Category.id))
+    
+    summaries = []
+    for row in query.order_by(Category.name):
+        summary = {'id': row[0], 'name': row[1]}
+        if with_counts:
+            summary['item_count'] = row[2]
+        summaries.append(summary)
+    return summaries
+
+def listed_items_query(category_id=None, search=None):
+    """Build the query of the items listed on the index page.
+
+    Returns:
+        Tuple of (query, hits). ``hits`` is the ranked full-text search result
+        when the FTS index was used (the items must then be shown in its
+        order), otherwise None.
+    """
     # Query items, optionally filtered by category
-    query = Item.query.order_by(Item.name)
+    query = Item.query.order_by(*item_sort_columns())
     if category_id:
         query = query.filter(Item.category_id == category_id)
         
@@ -15,7 +164,12 @@ def prepare_items_for_template(category_id=None, search=None):
     if search_term is None and has_request_context():
         search_term = request.args.get('search')
         
-    if search_term:
+    hits = None
+    if search_term and search_index_available():
+        # Full-text search: keep only matching items, ranked by relevance
+        hits = search_items(search_term, category_id=category_id)
+        query = query.filter(Item.id.in_([hit['id'] for hit in hits]))
+    elif search_term:
         # Filter by name, brand, or description containing search term
         query = query.filter(
             or_(
@@ -24,17 +178,28 @@ def prepare_items_for_template(category_id=None, search=None):
                 Item.description.ilike(f'%{search_term}%')
             )
         )
+    return query, hits
+
+def template_item_dicts(query, hits=None):
+    """Serialize the items of a listed_items_query() result for the templates."""
+    results = serialize_items(query)
+    snippets = {}
+    if hits is not None:
+        positions = {hit['id']: position for position, hit in enumerate(hits)}
+        snippets = {hit['id']: hit['snippet'] for hit in hits}
+        results.sort(key=lambda d: positions.get(d['id'], len(positions)))
     
-    items = []
-    for it in query.all():
-        d = it.to_dict()
+    for d in results:
         # Add computed fields
-        d['primary_photo_url'] = f"/uploads/{it.primary_photo}" if it.primary_photo else "https://placehold.co/600x400/eee/ccc?text=No+Image"
-        d['category_name'] = it.category.name if it.category else ''
-        d['specification_values'] = it.get_specification_values() if hasattr(it, 'get_specification_values') else {}
+        d['primary_photo_url'] = f"/uploads/{d['primary_photo']}" if d['primary_photo'] else "https://placehold.co/600x400/eee/ccc?text=No+Image"
+        d['category_name'] = d['category_name'] or ''
         # Format URLs correctly for template use
-        d['urls'] = []
-        for u in it.urls:
-            d['urls'].append(u.url)
-        items.append(d)
-    return items
+        d['urls'] = [u['url'] for u in d['urls']]
+        if d['id'] in snippets:
+            d['search_snippet'] = snippets[d['id']]
+    return results
+
+def prepare_items_for_template(category_id=None, search=None):
+    """Helper function to prepare items for template rendering."""
+    query, hits = listed_items_query(category_id=category_id, search=search)
+    return template_item_dicts(query, hits)
@@ -0,0 +1,413 @@
+"""Prometheus metrics of the application, aggregated across worker processes.
+
+``GET /metrics`` answers in the Prometheus text format with:
+
+* ``collectify_http_requests_total`` by endpoint, method and status, and
+  ``collectify_http_request_duration_seconds``, a latency histogram by
+  endpoint and method
+* ``collectify_http_requests_in_flight``: requests being handled
+* ``collectify_db_queries_total`` and ``collectify_db_seconds_total``: SQL
+  statements and the time spent in them by endpoint (needs ``QUERY_STATS``,
+  see utils.query_stats)
+* ``collectify_upload_bytes_total``: bytes of uploaded files received
+* ``collectify_template_render_duration_seconds``: render time by template
+* ``collectify_cache_requests_total``: lookups of the process-local caches
+  by result, from which hit ratios follow
+
+Each process adds its values to memory-mapped files of its own in
+``METRICS_DIR`` and a scrape sums the files of every process, so whichever
+gunicorn worker answers it reports the whole server. When a worker exits,
+the ``child_exit`` hook of gunicorn_config.py folds its counters into an
+archive file and drops its gauges (see mark_process_dead). Like the query
+statistics, request latency is measured until the response headers are
+sent.
+"""
+import atexit
+import bisect
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import Response, before_render_template, g, request, template_rendered
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are kept rather than archived
+    fcntl = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Counters of exited workers, summed by mark_process_dead
+_ARCHIVE_FILE = 'counter_archive.db'
+# Shared while scraping, exclusive while a file is folded into the archive
+_LOCK_FILE = '.lock'
+
+# Value file layout: a header holding the number of bytes in use, then
+# entries of a key length, the UTF-8 key padded to 8 bytes and a double
+_HEADER = struct.Struct('<I4x')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+_metrics = []
+_store = None
+_local = threading.local()
+
+
+def _entries(buffer, used):
+    """Yield (key, value, position of the value) of the entries of a value file."""
+    position = _HEADER.size
+    while position < used:
+        length, = _KEY_LENGTH.unpack_from(buffer, position)
+        key = bytes(buffer[position + _KEY_LENGTH.size:position + _KEY_LENGTH.size + length]).decode()
+        value_position = (position + _KEY_LENGTH.size + length + 7) & ~7
+        yield key, _VALUE.unpack_from(buffer, value_position)[0], value_position
+        position = value_position + _VALUE.size
+
+
+def _read_values(path):
+    """Return [(key, value)] of a value file written by any process."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return []
+    used, = _HEADER.unpack_from(data)
+    return [(key, value) for key, value, _ in _entries(data, min(used, len(data)))]
+
+
+class _ValueFile:
+    """Memory-mapped file of (key, float) entries, written by a single process.
+
+    An entry is written in full before the header counts it, so readers in
+    other processes never see a partial one. Not thread-safe.
+    """
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self._fd).st_size
+        if size < _INITIAL_SIZE:
+            os.ftruncate(self._fd, _INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        self._used = _HEADER.unpack_from(self._map)[0] or _HEADER.size
+        self._positions = {key: position for key, _, position in _entries(self._map, self._used)}
+
+    def _append(self, key):
+        encoded = key.encode()
+        position = (self._used + _KEY_LENGTH.size + len(encoded) + 7) & ~7
+        end = position + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+        _KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + _KEY_LENGTH.size:self._used + _KEY_LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, position, 0.0)
+        _HEADER.pack_into(self._map, 0, end)
+        self._used = end
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class _Store:
+    """Value files of the current process in a metrics directory.
+
+    Counters and histograms go to ``counter_<pid>.db``, gauges to
+    ``gauge_<pid>.db``. A forked child opens files of its own on first use.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._files = {}
+
+    def add(self, kind, key, amount):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._files = {}
+            values = self._files.get(kind)
+            if values is None:
+                values = self._files[kind] = _ValueFile(os.path.join(self.directory, f'{kind}_{self._pid}.db'))
+            values.add(key, amount)
+
+
+@contextmanager
+def _directory_lock(directory, operation):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, _LOCK_FILE), 'a') as f:
+        fcntl.flock(f.fileno(), operation)
+        yield
+
+
+@lru_cache(maxsize=4096)
+def _key(sample, values):
+    return json.dumps([sample, values], separators=(',', ':'))
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _series(sample, labelnames, values, value):
+    labels = ','.join(f'{name}="{_escape(str(label))}"' for name, label in zip(labelnames, values))
+    return f'{sample}{{{labels}}} {_format(value)}' if labels else f'{sample} {_format(value)}'
+
+
+class _Metric:
+    """A metric family; samples are added with labels passed by keyword."""
+
+    type = None
+    kind = 'counter'  # value file the samples go to
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics.append(self)
+
+    def _add(self, sample, amount, labels, extra=()):
+        if _store is not None:
+            values = tuple(str(labels[name]) for name in self.labelnames) + extra
+            _store.add(self.kind, _key(sample, values), amount)
+
+    def render(self, samples):
+        """Return the exposition lines of this metric given {sample: [(label values, value)]}."""
+        return [_series(self.name, self.labelnames, values, value)
+                for values, value in sorted(samples.get(self.name, ()))]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._add(self.name, amount, labels)
+
+
+class Gauge(_Metric):
+    """Gauge summed over the live processes; an exited worker's values are dropped."""
+
+    type = 'gauge'
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._add(self.name, amount, labels)
+
+    def dec(self, amount=1, **labels):
+        self._add(self.name, -amount, labels)
+
+
+class Histogram(_Metric):
+    """Histogram; each observation adds to a single bucket, made cumulative when rendered."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        bound = self.buckets[bisect.bisect_left(self.buckets, value)]
+        self._add(f'{self.name}_bucket', 1, labels, (_format(bound),))
+        self._add(f'{self.name}_sum', value, labels)
+
+    def render(self, samples):
+        counts = {}
+        for values, count in samples.get(f'{self.name}_bucket', ()):
+            counts.setdefault(tuple(values[:-1]), {})[values[-1]] = count
+        sums = {tuple(values): value for values, value in samples.get(f'{self.name}_sum', ())}
+        labelnames = self.labelnames + ('le',)
+        lines = []
+        for values in sorted(counts):
+            total = 0
+            for bound in self.buckets:
+                total += counts[values].get(_format(bound), 0)
+                lines.append(_series(f'{self.name}_bucket', labelnames, values + (_format(bound),), total))
+            lines.append(_series(f'{self.name}_sum', self.labelnames, values, sums.get(values, 0)))
+            lines.append(_series(f'{self.name}_count', self.labelnames, values, total))
+        return lines
+
+
+REQUESTS = Counter('collectify_http_requests_total', 'HTTP requests answered.',
+                   ('endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('collectify_http_request_duration_seconds',
+                             'Time until the response headers were ready.', ('endpoint', 'method'))
+REQUESTS_IN_FLIGHT = Gauge('collectify_http_requests_in_flight', 'HTTP requests being handled.', ('endpoint',))
+DB_QUERIES = Counter('collectify_db_queries_total', 'SQL statements executed by requests.', ('endpoint',))
+DB_SECONDS = Counter('collectify_db_seconds_total', 'Time requests spent executing SQL statements.', ('endpoint',))
+UPLOAD_BYTES = Counter('collectify_upload_bytes_total', 'Bytes of uploaded files received.', ('kind',))
+TEMPLATE_RENDER_DURATION = Histogram('collectify_template_render_duration_seconds',
+                                     'Time spent rendering templates.', ('template',))
+CACHE_REQUESTS = Counter('collectify_cache_requests_total', 'Cache lookups by result (hit or miss).',
+                         ('cache', 'result'))
+
+
+def generate_latest(directory=None):
+    """Return the metrics of every process writing to directory in the Prometheus text format."""
+    directory = directory or (_store.directory if _store is not None else None)
+    samples = {}
+    if directory:
+        totals = {}
+        with _directory_lock(directory, fcntl.LOCK_SH if fcntl else None):
+            for name in os.listdir(directory):
+                if not name.endswith('.db'):
+                    continue
+                try:
+                    values = _read_values(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue  # gauges of a worker that just exited
+                for key, value in values:
+                    totals[key] = totals.get(key, 0) + value
+        for key, value in totals.items():
+            sample, values = json.loads(key)
+            samples.setdefault(sample, []).append((tuple(values), value))
+
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render(samples))
+    return '\n'.join(lines) + '\n'
+
+
+def mark_process_dead(pid, directory=None):
+    """Drop the gauges of an exited process and fold its counters into the archive file.
+
+    Called by the gunicorn ``child_exit`` hook, in the master process, so
+    the files of workers restarted by ``max_requests`` do not pile up.
+    """
+    directory = directory or os.environ.get('METRICS_DIR')
+    if not directory:
+        return
+    try:
+        os.remove(os.path.join(directory, f'gauge_{pid}.db'))
+    except FileNotFoundError:
+        pass
+    path = os.path.join(directory, f'counter_{pid}.db')
+    if fcntl is None or not os.path.exists(path):
+        return
+    # Under the exclusive lock a scrape sees the values either in the
+    # worker's file or in the archive, never in both or neither
+    with _directory_lock(directory, fcntl.LOCK_EX):
+        archive = _ValueFile(os.path.join(directory, _ARCHIVE_FILE))
+        try:
+            for key, value in _read_values(path):
+                archive.add(key, value)
+        finally:
+            archive.close()
+        os.remove(path)
+
+
+def clear_metrics_dir(directory):
+    """Remove the value files of a previous server run."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.db'):
+            os.remove(os.path.join(directory, name))
+
+
+@lru_cache(maxsize=None)
+def _default_directory():
+    # Shared with processes forked from this one; removed when it exits
+    directory = tempfile.mkdtemp(prefix='collectify-metrics-')
+    owner = os.getpid()
+    atexit.register(lambda: os.getpid() == owner and shutil.rmtree(directory, ignore_errors=True))
+    return directory
+
+
+def _template_started(sender, template, context, **extra):
+    stack = getattr(_local, 'render_started', None)
+    if stack is None:
+        stack = _local.render_started = []
+    stack.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    stack = getattr(_local, 'render_started', None)
+    if stack:
+        TEMPLATE_RENDER_DURATION.observe(time.perf_counter() - stack.pop(), template=template.name or '<string>')
+
+
+def configure_metrics(app):
+    """Record the metrics of every request and serve them at /metrics if app.config['METRICS'] is set.
+
+    Processes share their values through app.config['METRICS_DIR']; without
+    one, a temporary directory shared with forked children is used.
+    """
+    global _store
+    if not app.config.get('METRICS'):
+        return
+    directory = app.config.get('METRICS_DIR') or _default_directory()
+    os.makedirs(directory, exist_ok=True)
+    if _store is None or _store.directory != directory:
+        _store = _Store(directory)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_in_flight = request.endpoint or 'unmatched'
+        REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_in_flight)
+
+    # Registered after configure_query_stats, so this runs before its
+    # after_request hook takes g.query_stats away
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = request.endpoint or 'unmatched'
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        started = g.get('metrics_started')
+        if started is not None:
+            REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        stats = g.get('query_stats')
+        if stats is not None:
+            DB_QUERIES.inc(stats.count, endpoint=endpoint)
+            DB_SECONDS.inc(stats.seconds, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        # after_request is skipped when the view raised
+        endpoint = g.pop('metrics_in_flight', None)
+        if endpoint is not None:
+            REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+
+    def metrics():
+        response = Response(generate_latest(directory), content_type=CONTENT_TYPE)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
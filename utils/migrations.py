@@ -0,0 +1,236 @@
+"""Versioned schema migrations for existing SQLite databases.
+
+``db.create_all()`` only creates missing tables: it never adds indexes or
+columns to tables that already exist. Like migrate_specifications.py, the
+migrations below work directly on a sqlite3 connection, but each one runs in
+its own transaction and the applied versions are recorded in the
+``schema_migrations`` table, so a database is upgraded exactly once.
+
+Migrations must be safe to run on a database freshly created by
+``create_all()`` (which already has the latest schema): init_db runs them
+right after creating the tables. A migration that returns False could not
+be applied with this SQLite build; it is left unrecorded and tried again by
+the next upgrade.
+
+Usage:
+    flask db-upgrade
+    python -m utils.migrations data/collectibles.db
+"""
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from models import db, ItemSpecValue
+from utils import search
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a function taking a sqlite3 connection as a migration."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+@migration(1, 'Index foreign keys of photos, URLs and specifications')
+def _index_foreign_keys(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_photos_item_id ON item_photos (item_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_urls_item_id ON item_urls (item_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_category_specifications_category_id "
+                 "ON category_specifications (category_id, display_order)")
+
+
+@migration(2, 'Index items by category and case-insensitive name')
+def _index_item_names(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_items_name_nocase ON items (name COLLATE NOCASE, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_items_category_name_nocase "
+                 "ON items (category_id, name COLLATE NOCASE, id)")
+
+
+@migration(3, 'Create the typed specification value index')
+def _create_spec_value_index(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_spec_values (
+            item_id INTEGER NOT NULL,
+            spec_key VARCHAR NOT NULL,
+            num_value FLOAT,
+            text_value VARCHAR,
+            PRIMARY KEY (item_id, spec_key),
+            FOREIGN KEY(item_id) REFERENCES items (id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_spec_values_key_num "
+                 "ON item_spec_values (spec_key, num_value, item_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_spec_values_key_text "
+                 "ON item_spec_values (spec_key, text_value, item_id)")
+
+    number_keys = {}
+    for category_id, key in conn.execute(
+            "SELECT category_id, key FROM category_specifications WHERE type = 'number'"):
+        number_keys.setdefault(category_id, set()).add(key)
+
+    conn.execute("DELETE FROM item_spec_values")
+    for item_id, category_id, specification_values in conn.execute(
+            "SELECT id, category_id, specification_values FROM items").fetchall():
+        try:
+            values = json.loads(specification_values) if specification_values else {}
+        except ValueError:
+            continue
+        if not isinstance(values, dict):
+            continue
+        conn.executemany(
+            "INSERT INTO item_spec_values (item_id, spec_key, num_value, text_value) VALUES (?, ?, ?, ?)",
+            [(item_id, key, num_value, text_value)
+             for key, num_value, text_value in ItemSpecValue.project(values, number_keys.get(category_id, set()))]
+        )
+
+
+@migration(4, 'Create the full-text search index')
+def _create_search_index(conn):
+    try:
+        for statement in search.SCHEMA_STATEMENTS:
+            conn.execute(statement)
+    except sqlite3.OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        print(f"[DB] FTS5 is not available, skipping the search index: {e}")
+        # Unrecorded, so the index is created once a build with FTS5 runs
+        return False
+    for statement in search.POPULATE_STATEMENTS:
+        conn.execute(statement)
+
+
+@migration(5, 'Track item modification times and collection versions')
+def _add_change_tracking(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(items)")}
+    if 'updated_at' not in columns:
+        conn.execute("ALTER TABLE items ADD COLUMN updated_at DATETIME")
+    conn.execute("UPDATE items SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE updated_at IS NULL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS collection_versions (
+            name VARCHAR NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+
+
+@migration(6, 'Index photos by file path for shared photo storage')
+def _index_photo_paths(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_photos_file_path ON item_photos (file_path)")
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def current_version(conn):
+    """Return the highest migration version applied to the database (0 if none)."""
+    _ensure_version_table(conn)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def applied_versions(conn):
+    """Return the set of migration versions applied to the database."""
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def latest_version():
+    """Return the version a fully upgraded database is at."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def upgrade(conn, target=None):
+    """Apply pending migrations to a sqlite3 connection, each in its own transaction.
+
+    Args:
+        conn: sqlite3 connection in autocommit mode (isolation_level=None)
+        target: Stop after this version (default: apply all)
+
+    Returns:
+        List of (version, description) tuples that were applied
+    """
+    applied = []
+    # Every unrecorded version is pending, including one skipped before
+    # (see the module docstring) with later versions applied since
+    done = applied_versions(conn)
+    for migration_version, description, func in MIGRATIONS:
+        if migration_version in done or (target is not None and migration_version > target):
+            continue
+
+        # BEGIN IMMEDIATE takes the write lock up front, so a concurrent
+        # writer cannot interleave with a half-applied migration. Another
+        # process may have applied this migration since the version was
+        # read, so it is read again under the lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_migrations WHERE version = ?",
+                            (migration_version,)).fetchone():
+                conn.execute("COMMIT")
+                continue
+            if func(conn) is False:
+                conn.execute("COMMIT")
+                continue
+            conn.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                (migration_version, description, datetime.utcnow().isoformat())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[DB] Applied migration {migration_version}: {description}")
+        applied.append((migration_version, description))
+    return applied
+
+
+def upgrade_database_file(db_path, target=None):
+    """Upgrade the SQLite database file at db_path."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        return upgrade(conn, target)
+    finally:
+        conn.close()
+
+
+def _with_app_connection(func):
+    """Run func with the raw sqlite3 connection behind the app's engine."""
+    db.session.commit()
+    raw = db.engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        previous_isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        try:
+            return func(conn)
+        finally:
+            conn.isolation_level = previous_isolation_level
+    finally:
+        raw.close()
+
+
+def upgrade_app_database(target=None):
+    """Apply pending migrations to the database of the current Flask app."""
+    return _with_app_connection(lambda conn: upgrade(conn, target))
+
+
+def app_database_version():
+    """Return the migration version of the current Flask app's database."""
+    return _with_app_connection(current_version)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.migrations <path to database>")
+        sys.exit(1)
+    applied = upgrade_database_file(sys.argv[1])
+    print(f"Applied {len(applied)} migration(s).")
@@ -0,0 +1,86 @@
+"""Keyset (cursor) pagination helpers for item listings."""
+import base64
+import binascii
+import json
+from sqlalchemy import func, tuple_
+from models import Item
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Raised when the pagination parameters of a request are invalid."""
+
+
+def item_sort_columns():
+    """Return the columns items are ordered by; the cursor is keyed on them.
+
+    Names compare case-insensitively, matching the ix_items_name_nocase index.
+    """
+    return (Item.name.collate('NOCASE'), Item.id)
+
+
+def encode_cursor(name, item_id):
+    """Encode the sort key of the last item of a page into an opaque cursor."""
+    raw = json.dumps([name, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into a (name, id) tuple."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(name, str) or not isinstance(item_id, int):
+        raise PaginationError('Invalid cursor')
+    return name, item_id
+
+
+def parse_limit(value):
+    """Validate the ``limit`` query parameter and clamp it to MAX_PAGE_SIZE."""
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_items(query, limit, after=None):
+    """Fetch one page of items using keyset pagination on (name, id).
+
+    Args:
+        query: Item query with all filters applied (ordering is replaced); it may
+            select Item instances or any columns that include Item.name and Item.id
+        limit: Maximum number of items to return
+        after: Cursor of the last item of the previous page, if any
+
+    Returns:
+        Tuple of (items, next_cursor, total_count); next_cursor is None on the last page
+    """
+    total_count = query.order_by(None).with_entities(func.count(Item.id)).scalar()
+
+    sort_columns = item_sort_columns()
+    page_query = query.order_by(*sort_columns)
+    if after:
+        name, item_id = decode_cursor(after)
+        # The redundant bound on the name alone lets SQLite seek the index
+        # instead of scanning it for the row-value comparison
+        page_query = page_query.filter(sort_columns[0] >= name,
+                                       tuple_(*sort_columns) > (name, item_id))
+
+    # Fetch one extra row to know whether another page follows
+    rows = page_query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.name, last.id)
+
+    return items, next_cursor, total_count
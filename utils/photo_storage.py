@@ -0,0 +1,313 @@
+"""Content-addressed storage of uploaded photos.
+
+Uploads are hashed while they are streamed to disk (see utils.uploads) and
+stored once per content, as ``ab/cd/<sha256>.<ext>`` in the upload folder:
+re-uploading a file never overwrites another one, identical photos of
+several items share one blob, and no directory grows beyond a few hundred
+entries. ``ItemPhoto.file_path`` holds that relative path and
+``ItemPhoto.filename`` the name the file was uploaded with.
+
+Uploads are written in two phases, so that no file is written while the
+transaction holds SQLite's write lock: files are staged in temporary files
+before any row is written, and renamed into place once the rows committed
+(or removed if the transaction rolls back).
+
+A blob is referenced by every ItemPhoto row with its path and is removed
+with the last of them (see commit_releasing_uploads), which happens while
+the deleting transaction holds the write lock. An upload of the same
+content either commits its reference first, so the blob is kept, or puts
+the blob back in place after its commit.
+
+Photos uploaded before this layout are stored flat as
+``item_<id>_<name>``; ``flask migrate-photos`` moves them into it.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, false, select, update
+from sqlalchemy.orm import Session
+from models import db, CollectionVersion, Item, ItemPhoto
+from utils.file_cleanup import remove_files_later
+from utils.thumbnails import generate_thumbnails, thumbnail_folder, thumbnail_names
+from utils.uploads import HashingUploadFile, readable_permissions
+
+# Bytes hashed and written at a time
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Folder of the upload folder holding released blobs until they are deleted
+TRASH_DIR = '.trash'
+
+# Paths looked up per query, below SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+# Session.info key of the uploads staged in the current transaction:
+# [(temporary path, upload folder, blob path, sidecar path or None)]
+_STAGED_KEY = 'staged_uploads'
+
+_BLOB_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[0-9a-z]+$')
+
+
+def blob_path(digest, ext):
+    """Relative path of the blob with the given SHA-256 hex digest."""
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+
+def is_blob_path(filename):
+    """Whether filename is a content-addressed blob path, whose content never changes."""
+    return bool(_BLOB_PATTERN.match(filename))
+
+
+def is_upload_path(filename):
+    """Whether filename is a relative path to a stored photo (not a hidden or temporary file)."""
+    if not filename or filename.startswith('/') or '\\' in filename:
+        return False
+    return all(part and not part.startswith('.') for part in filename.split('/'))
+
+
+def allowed_upload(file):
+    """Whether an uploaded FileStorage has one of the ALLOWED_EXTENSIONS."""
+    return bool(file and file.filename and '.' in file.filename and
+                file.filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS'])
+
+
+def _hash_to_temporary(stream, upload_folder):
+    """Copy a binary stream to a temporary file in upload_folder; returns (hex digest, temporary path)."""
+    hasher = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=upload_folder, prefix='.upload-', delete=False) as temporary:
+        try:
+            while True:
+                chunk = stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                temporary.write(chunk)
+        except BaseException:
+            temporary.close()
+            os.remove(temporary.name)
+            raise
+    readable_permissions(temporary.name)
+    return hasher.hexdigest(), temporary.name
+
+
+def _place(temporary, path):
+    """Move a temporary file to path unless a blob is stored there already."""
+    try:
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+
+
+def _attach(item, temporary, digest, original_name, sidecar=None):
+    """Add the photo staged in a temporary file of the upload folder to an item (see attach_file for sidecar)."""
+    filename = blob_path(digest, _extension(original_name))
+    photo = ItemPhoto(file_path=filename, filename=original_name)
+    db.session.info.setdefault(_STAGED_KEY, []).append(
+        (temporary, current_app.config['UPLOAD_FOLDER'], filename, sidecar))
+    item.photos.append(photo)
+    return photo
+
+
+@event.listens_for(Session, 'after_commit')
+def _place_staged_uploads(session):
+    # The rows are committed and the write lock released: move the files in.
+    # Raising here would fail a committed request, so each file's error is
+    # only reported and the remaining files are still placed
+    for temporary, upload_folder, filename, sidecar in session.info.pop(_STAGED_KEY, ()):
+        try:
+            _place(temporary, os.path.join(upload_folder, filename))
+        except OSError as e:
+            print(f"Error storing uploaded photo {filename}: {e}")
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+        else:
+            generate_thumbnails(upload_folder, filename)
+        if sidecar is not None:
+            try:
+                os.remove(sidecar)
+            except FileNotFoundError:
+                pass
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_staged_uploads(session, transaction):
+    # Still staged at the end of the outermost transaction: it rolled back
+    if transaction.parent is None:
+        for temporary, _, _, sidecar in session.info.pop(_STAGED_KEY, ()):
+            if sidecar is not None:
+                continue  # kept, so the caller can try again
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+
+
+def attach_photo(item, file):
+    """Store an uploaded FileStorage and add it to the item's photos; returns the ItemPhoto.
+
+    The file is staged and moved into place when the session commits.
+    Files streamed by utils.uploads.UploadRequest are staged and hashed
+    already; others are copied to a temporary file first.
+    """
+    if isinstance(file.stream, HashingUploadFile) and not file.stream.closed:
+        digest = file.stream.digest
+        temporary = file.stream.claim()
+    else:
+        digest, temporary = _hash_to_temporary(file.stream, current_app.config['UPLOAD_FOLDER'])
+    return _attach(item, temporary, digest, file.filename)
+
+
+def attach_file(item, path, original_name, sidecar=None):
+    """Add a complete file in the upload folder to the item's photos; returns the ItemPhoto.
+
+    The file is moved into place when the session commits. Like
+    attach_photo(), for files that were assembled on disk (see utils.resumable_uploads).
+    A sidecar file is removed once the file is stored; if the session rolls
+    back, both are kept rather than deleted.
+    """
+    return _attach(item, path, _hash_file(path), original_name, sidecar)
+
+
+def referenced_uploads(filenames):
+    """Return the subset of filenames that some ItemPhoto still refers to."""
+    filenames = list(set(filenames))
+    referenced = set()
+    for start in range(0, len(filenames), LOOKUP_BATCH_SIZE):
+        referenced.update(db.session.execute(
+            select(ItemPhoto.file_path).where(ItemPhoto.file_path.in_(filenames[start:start + LOOKUP_BATCH_SIZE]))
+        ).scalars())
+    return referenced
+
+
+def _commit_releasing(filenames):
+    """Commit, deleting the given uploads left unreferenced; returns (released filenames, Future)."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    db.session.flush()
+    unreferenced = set(filename for filename in filenames if filename) - referenced_uploads(filenames)
+
+    trashed = []  # (filename, path, trash path)
+    if unreferenced:
+        trash = os.path.join(upload_folder, TRASH_DIR)
+        os.makedirs(trash, exist_ok=True)
+        for filename in sorted(unreferenced):
+            path = os.path.join(upload_folder, filename)
+            trash_path = os.path.join(trash, uuid.uuid4().hex)
+            try:
+                os.replace(path, trash_path)
+            except FileNotFoundError:
+                continue
+            trashed.append((filename, path, trash_path))
+
+    try:
+        db.session.commit()
+    except BaseException:
+        for _, path, trash_path in trashed:
+            os.replace(trash_path, path)
+        raise
+
+    thumbnails = [os.path.join(thumbnail_folder(upload_folder), name)
+                  for filename in unreferenced for name in thumbnail_names(filename)]
+    future = remove_files_later([trash_path for _, _, trash_path in trashed] + thumbnails)
+    return [filename for filename, _, _ in trashed], future
+
+
+def commit_releasing_uploads(filenames):
+    """Commit the session, then delete the given uploads that it left unreferenced.
+
+    Pass the file paths of the photos the transaction deleted. Unreferenced
+    blobs are moved to the trash folder before the commit, and deleted
+    together with their thumbnails in the background after it; if the
+    commit fails they are moved back.
+    """
+    return _commit_releasing(filenames)[1]
+
+
+def release_unreferenced_uploads(filenames):
+    """Delete those of the given uploads that no ItemPhoto refers to; returns their filenames.
+
+    For files found on disk rather than dropped by a transaction (see
+    utils.upload_gc). The write lock is taken before the references are
+    looked up, as when photos are deleted.
+    """
+    # A write that changes nothing still makes SQLite take the write lock
+    db.session.execute(update(CollectionVersion).where(false()).values(version=CollectionVersion.version))
+    return _commit_releasing(filenames)[0]
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _link_or_copy(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def migrate_flat_uploads(batch_size=LOOKUP_BATCH_SIZE):
+    """Move photos stored flat in the upload folder to content-addressed blobs.
+
+    Each batch of files is linked (or copied) to its blob path and the photo
+    rows are repointed in one transaction; the old files and their
+    thumbnails are only removed after it committed, so an interrupted
+    migration can simply be run again.
+
+    Returns:
+        Tuple of (files migrated, files missing from the upload folder)
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    legacy = db.session.execute(
+        select(ItemPhoto.file_path).where(~ItemPhoto.file_path.contains('/')).distinct().order_by(ItemPhoto.file_path)
+    ).scalars().all()
+
+    migrated = missing = 0
+    for start in range(0, len(legacy), batch_size):
+        moved = []
+        for filename in legacy[start:start + batch_size]:
+            path = os.path.join(upload_folder, filename)
+            if not os.path.isfile(path):
+                missing += 1
+                continue
+            target = blob_path(_hash_file(path), _extension(filename))
+            _link_or_copy(path, os.path.join(upload_folder, target))
+            # The items change too: their rendered fragments embed the photo paths
+            db.session.execute(
+                update(Item).where(Item.id.in_(select(ItemPhoto.item_id).where(ItemPhoto.file_path == filename)))
+                .values(updated_at=datetime.utcnow()),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.execute(
+                update(ItemPhoto).where(ItemPhoto.file_path == filename)
+                .values(file_path=target, filename=db.func.coalesce(ItemPhoto.filename, filename)),
+                execution_options={'synchronize_session': False}
+            )
+            moved.append(filename)
+        db.session.commit()
+
+        migrated += len(moved)
+        remove_files_later([os.path.join(upload_folder, filename) for filename in moved] +
+                           [os.path.join(thumbnail_folder(upload_folder), name)
+                            for filename in moved for name in thumbnail_names(filename)])
+    return migrated, missing
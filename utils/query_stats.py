@@ -0,0 +1,163 @@
+"""Statement counting and timing, per block of code and per request.
+
+track_queries() records the statements a block of code issues, and
+query_budget() fails a test whose block issues more than a given number.
+
+configure_query_stats() tracks every request: the number of statements
+and the time spent in them go out in a ``Server-Timing`` header (shown by
+browser dev tools) and a debug log line, and a warning is logged when one
+statement shape runs ``QUERY_REPEAT_THRESHOLD`` times or more in a
+request, the usual sign of an N+1 pattern of lazy loads. Statements that
+run after the response headers were sent, such as those of streamed
+responses, are not counted.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Trackers are per thread, so concurrent requests are counted apart
+_local = threading.local()
+
+# Expanded IN lists differ in length only; they count as one shape
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_NAMED_PARAMETER = re.compile(r'[:@$]\w+|%\(\w+\)s|%s')
+
+
+def _active_stats():
+    stack = getattr(_local, 'stats', None)
+    if stack is None:
+        stack = _local.stats = []
+    return stack
+
+
+def statement_shape(statement):
+    """Normalize a statement so that executions differing only in parameters compare equal."""
+    shape = _NAMED_PARAMETER.sub('?', statement)
+    return ' '.join(_IN_LIST.sub('(?)', shape).split())
+
+
+class QueryStats:
+    """Statements executed, time spent in them and result rows fetched while tracking was active.
+
+    Rows are only counted with count_rows, which buffers every ORM result.
+    """
+
+    def __init__(self, count_rows=True):
+        self.statements = []
+        self.seconds = 0.0
+        self.rows = 0
+        self.count_rows = count_rows
+
+    @property
+    def count(self):
+        """Number of statements executed."""
+        return len(self.statements)
+
+    def repeated(self, threshold):
+        """Return {shape: executions} of the statement shapes executed threshold times or more."""
+        counts = Counter(statement_shape(statement) for statement in self.statements)
+        return {shape: count for shape, count in counts.most_common() if count >= threshold}
+
+
+@contextmanager
+def track_queries(count_rows=True):
+    """Record every statement and ORM result row produced inside the block.
+
+    Rows are counted before the ORM de-duplicates them, so a joined eager load
+    of two collections shows up as the cartesian product it really fetches.
+    """
+    stats = QueryStats(count_rows=count_rows)
+    _active_stats().append(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats().remove(stats)
+
+
+@contextmanager
+def query_budget(limit):
+    """Fail with AssertionError if the block issues more than limit statements."""
+    with track_queries(count_rows=False) as stats:
+        yield stats
+    if stats.count > limit:
+        listing = '\n'.join(f'  {statement}' for statement in stats.statements)
+        raise AssertionError(f'{stats.count} statements issued, budget is {limit}:\n{listing}')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    active = _active_stats()
+    if not active:
+        return
+    for stats in active:
+        stats.statements.append(statement)
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_duration(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    for stats in _active_stats():
+        stats.seconds += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _forget_failed_statement(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_rows(orm_execute_state):
+    counting = [stats for stats in _active_stats() if stats.count_rows]
+    if not counting or not orm_execute_state.is_select:
+        return None
+
+    # Buffer the raw result so its rows can be counted, then hand back a
+    # replayable copy in place of the original
+    frozen = orm_execute_state.invoke_statement().freeze()
+    for stats in counting:
+        stats.rows += len(frozen.data)
+    return frozen()
+
+
+def configure_query_stats(app):
+    """Count the statements of every request (see the module docstring) if app.config['QUERY_STATS'] is set."""
+    if not app.config.get('QUERY_STATS'):
+        return
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats(count_rows=False)
+        _active_stats().append(g.query_stats)
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        _active_stats().remove(stats)
+        milliseconds = stats.seconds * 1000
+        response.headers.add('Server-Timing', f'db;dur={milliseconds:.1f};desc="{stats.count} queries"')
+        app.logger.debug('%s %s: %d queries in %.1f ms', request.method, request.path, stats.count, milliseconds)
+        for shape, count in stats.repeated(app.config.get('QUERY_REPEAT_THRESHOLD', 10)).items():
+            app.logger.warning('%s %s ran the same statement %d times (N+1?): %s',
+                               request.method, request.path, count, shape)
+        return response
+
+    @app.teardown_request
+    def discard_query_stats(exc):
+        # after_request is skipped when the view raised
+        stats = g.pop('query_stats', None)
+        if stats is not None and stats in _active_stats():
+            _active_stats().remove(stats)
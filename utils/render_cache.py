@@ -0,0 +1,166 @@
+"""Cache of rendered HTML for the index page.
+
+Two kinds of entries share one LRU cache with a byte budget:
+
+* item fragments: the gallery card, table row and mobile list entry of one
+  item, keyed by the item id, its ``updated_at`` stamp, the categories
+  version (cards show the category name) and the search snippet. An item
+  is only rendered again after it changed.
+* whole pages, keyed by the items collection version (bumped by every item
+  and category write, see utils.conditional) and the query string.
+
+Keys embed database versions, so the entries of each gunicorn worker never
+go stale; they only age out of the LRU.
+"""
+import threading
+from collections import OrderedDict
+from flask import get_template_attribute, request
+from markupsafe import Markup
+from models import Item
+from utils.conditional import CATEGORIES, ITEMS, collection_versions, uncommitted_collections
+from utils.helpers import listed_items_query, template_item_dicts
+from utils.metrics import CACHE_REQUESTS
+
+FRAGMENTS_TEMPLATE = 'partials/item_fragments.html'
+
+# Items serialized and rendered per query when filling the cache
+RENDER_BATCH_SIZE = 500
+
+
+class RenderCache:
+    """Thread-safe LRU mapping of keys to rendered strings, bounded in bytes.
+
+    A max_bytes of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        CACHE_REQUESTS.inc(cache='render', result='miss' if entry is None else 'hit')
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, size):
+        """Store value, whose rendered size is size bytes, evicting the least recently used entries."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+render_cache = RenderCache(0)
+
+
+def configure_render_cache(app):
+    """Size the process-wide render cache from app.config['RENDER_CACHE_MAX_BYTES']."""
+    render_cache.max_bytes = app.config.get('RENDER_CACHE_MAX_BYTES', 0)
+
+
+def _cacheable():
+    # Versions read in a transaction that wrote may still be rolled back
+    return render_cache.max_bytes > 0 and not uncommitted_collections()
+
+
+class ItemFragments:
+    """Rendered fragments of one item, as used by index.html."""
+
+    __slots__ = ('id', 'card', 'table_row', 'list_entry')
+
+    def __init__(self, item_id, card, table_row, list_entry):
+        self.id = item_id
+        self.card = card
+        self.table_row = table_row
+        self.list_entry = list_entry
+
+    @property
+    def size(self):
+        return sum(len(html.encode('utf-8')) for html in (self.card, self.table_row, self.list_entry))
+
+
+def _render_fragments(item):
+    macros = [get_template_attribute(FRAGMENTS_TEMPLATE, name) for name in ('card', 'table_row', 'list_entry')]
+    return ItemFragments(item['id'], *(Markup(macro(item)) for macro in macros))
+
+
+def listed_item_fragments(category_id=None, search=None):
+    """Return the ItemFragments of the items listed on the index page, in order.
+
+    Only the ids and change stamps of the listed items are queried; items
+    missing from the cache are serialized and rendered in one batch.
+    """
+    query, hits = listed_items_query(category_id=category_id, search=search)
+    entries = query.with_entities(Item.id, Item.updated_at).all()
+    snippets = {}
+    if hits is not None:
+        positions = {hit['id']: position for position, hit in enumerate(hits)}
+        snippets = {hit['id']: str(hit['snippet']) for hit in hits}
+        entries.sort(key=lambda entry: positions[entry.id])
+
+    cacheable = _cacheable()
+    categories_version, = collection_versions(CATEGORIES)
+    keys = {entry.id: ('item', entry.id, entry.updated_at, categories_version, snippets.get(entry.id))
+            for entry in entries}
+
+    fragments = {}
+    if cacheable:
+        for item_id, key in keys.items():
+            cached = render_cache.get(key)
+            if cached is not None:
+                fragments[item_id] = cached
+
+    missing = [entry.id for entry in entries if entry.id not in fragments]
+    # Batches keep the IN lists below SQLite's bound parameter limit
+    for start in range(0, len(missing), RENDER_BATCH_SIZE):
+        batch = missing[start:start + RENDER_BATCH_SIZE]
+        for item in template_item_dicts(Item.query.filter(Item.id.in_(batch)), hits):
+            rendered = _render_fragments(item)
+            fragments[item['id']] = rendered
+            if cacheable:
+                render_cache.set(keys[item['id']], rendered, rendered.size)
+
+    return [fragments[entry.id] for entry in entries if entry.id in fragments]
+
+
+def cached_page(render):
+    """Return the page for the current request from the cache, or render and store it.
+
+    ``render`` is called without arguments and returns the page HTML.
+    """
+    if not _cacheable():
+        return render()
+    version, = collection_versions(ITEMS)
+    key = ('page', request.path, version, tuple(sorted(request.args.items(multi=True))))
+    html = render_cache.get(key)
+    if html is None:
+        html = render()
+        render_cache.set(key, html, len(html.encode('utf-8')))
+    return html
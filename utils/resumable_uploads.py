@@ -0,0 +1,160 @@
+"""Resumable photo uploads for clients on unreliable connections.
+
+A photo is sent in chunks, and after a failure only the missing part is
+sent again:
+
+1. ``POST /api/uploads`` with ``{"filename": ..., "size": ...}`` starts an
+   upload and returns its ``id``.
+2. ``PATCH /api/uploads/<id>`` appends the request body, which must start at
+   the ``Upload-Offset`` header, i.e. at the number of bytes received so far.
+   ``GET /api/uploads/<id>`` reports that offset after an interruption.
+3. ``POST /api/uploads/<id>/commit`` with ``{"item_id": ...}`` adds the
+   complete file to the item as an ItemPhoto (see utils.photo_storage).
+
+Uploads are kept as ``.partial/<id>`` files with a JSON sidecar in the upload
+folder, so every worker process can take any chunk. Chunks are streamed
+to disk; no upload is held in memory.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from flask import current_app
+from utils.metrics import UPLOAD_BYTES
+from utils.photo_storage import HASH_CHUNK_SIZE, attach_file
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent chunks for one upload are not detected
+    fcntl = None
+
+PARTIAL_DIR = '.partial'
+
+# Chunk size suggested to clients
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ResumableUploadError(Exception):
+    """Raised for invalid upload requests; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _partial_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], PARTIAL_DIR)
+
+
+def _paths(upload_id):
+    if not _ID_PATTERN.match(upload_id or ''):
+        raise ResumableUploadError('Upload not found', 404)
+    data_path = os.path.join(_partial_folder(), upload_id)
+    return data_path, data_path + '.json'
+
+
+def _load(upload_id):
+    data_path, meta_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        offset = os.path.getsize(data_path)
+    except FileNotFoundError:
+        raise ResumableUploadError('Upload not found', 404)
+    return dict(meta, id=upload_id, offset=offset)
+
+
+def _public(state):
+    return {key: state[key] for key in ('id', 'filename', 'size', 'offset')}
+
+
+def start_upload(filename, size):
+    """Create an upload of size bytes for a file named filename; returns its state."""
+    if not filename or '.' not in filename or \
+            filename.rsplit('.', 1)[1].lower() not in current_app.config['ALLOWED_EXTENSIONS']:
+        raise ResumableUploadError('Invalid file format')
+    if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+        raise ResumableUploadError('size must be a positive integer')
+    max_size = current_app.config.get('MAX_UPLOAD_FILE_SIZE')
+    if max_size is not None and size > max_size:
+        raise ResumableUploadError(f'Files may not be larger than {max_size} bytes', 413)
+
+    os.makedirs(_partial_folder(), exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    data_path, meta_path = _paths(upload_id)
+    open(data_path, 'xb').close()
+    with open(meta_path, 'w') as f:
+        json.dump({'filename': filename, 'size': size, 'created': time.time()}, f)
+    state = _public(_load(upload_id))
+    state['chunk_size'] = min(DEFAULT_CHUNK_SIZE, current_app.config.get('MAX_CONTENT_LENGTH') or DEFAULT_CHUNK_SIZE)
+    return state
+
+
+def upload_status(upload_id):
+    """Return the state of an upload, including the offset to continue from."""
+    return _public(_load(upload_id))
+
+
+def _lock(f):
+    if fcntl is None:
+        return
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise ResumableUploadError('Another request is writing to this upload', 409)
+
+
+def append_chunk(upload_id, offset, stream):
+    """Append a binary stream to an upload at offset; returns the new state.
+
+    Data past the declared size is refused; whatever was written before an
+    interruption is kept, and the reported offset includes it.
+    """
+    state = _load(upload_id)
+    data_path, _ = _paths(upload_id)
+    with open(data_path, 'r+b') as f:
+        _lock(f)
+        current = f.seek(0, os.SEEK_END)
+        if offset != current:
+            raise ResumableUploadError(f'Upload-Offset must be {current}', 409)
+        remaining = state['size'] - current
+        try:
+            while True:
+                chunk = stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    raise ResumableUploadError('Chunk goes past the declared upload size', 413)
+                f.write(chunk)
+                remaining -= len(chunk)
+        finally:
+            UPLOAD_BYTES.inc(state['size'] - current - remaining, kind='resumable')
+    return upload_status(upload_id)
+
+
+def commit_upload(upload_id, item):
+    """Add a complete upload to the item's photos and forget the upload; returns the ItemPhoto.
+
+    The caller commits the session. The upload is only forgotten once the
+    commit succeeds; after a rollback it can be committed again.
+    """
+    state = _load(upload_id)
+    if state['offset'] != state['size']:
+        raise ResumableUploadError(f"Upload is incomplete: {state['offset']} of {state['size']} bytes", 409)
+    data_path, meta_path = _paths(upload_id)
+    with open(data_path, 'rb') as f:
+        _lock(f)
+        return attach_file(item, data_path, state['filename'], sidecar=meta_path)
+
+
+def cancel_upload(upload_id):
+    """Discard an upload and what was received of it."""
+    _load(upload_id)
+    for path in _paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
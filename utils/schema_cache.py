@@ -0,0 +1,125 @@
+"""Process-local cache of compiled category schemas.
+
+Category schemas are read on nearly every request but change rarely.
+Compiling one means loading the category with its specifications and
+running CategorySpecification.to_dict() (which parses the select options)
+for each spec. The result is kept per process and keyed by the
+``categories`` collection version (see utils.conditional). Every write to
+categories or specifications bumps that version in the database, so each
+gunicorn worker drops its stale entries the next time it reads the cache;
+checking costs a single-row primary key lookup, made once per transaction
+(so once per request) however many lookups the request makes.
+"""
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+from models import db, Category
+from utils.conditional import CATEGORIES, collection_versions, uncommitted_collections
+from utils.metrics import CACHE_REQUESTS
+
+# Session.info key of the categories version read in the current transaction
+_VERSION_KEY = 'categories_version'
+
+
+class CompiledSchema:
+    """Read-only, precomputed representation of one category and its specifications."""
+
+    __slots__ = ('category_id', 'name', 'specifications', 'ordered_keys', 'category_dict')
+
+    def __init__(self, category):
+        self.category_id = category.id
+        self.name = category.name
+        # Same as Category.get_specifications_schema()
+        self.specifications = [spec.to_dict() for spec in category.specifications]
+        # (key, label, display_order) in display order, as Item.to_dict() lists them
+        self.ordered_keys = tuple((spec['key'], spec['label'], spec['display_order'])
+                                  for spec in self.specifications)
+        # Same as Category.to_dict()
+        self.category_dict = category.to_dict(specifications=self.specifications)
+
+
+class CategorySchemaCache:
+    """Compiled schemas by category id, valid for one categories version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._schemas = {}
+        self._all_ids = None  # Ids of every category ordered by name, once listed
+
+    def _current(self):
+        """Return (version, schemas, all_ids) valid for the database's current version.
+
+        Inside a transaction that wrote categories the version may still be
+        rolled back, so nothing is cached and a throwaway state is returned.
+        """
+        if CATEGORIES in uncommitted_collections():
+            return None, {}, None
+        version = db.session.info.get(_VERSION_KEY)
+        if version is None:
+            version, = collection_versions(CATEGORIES)
+            db.session.info[_VERSION_KEY] = version
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._schemas = {}
+                self._all_ids = None
+            return version, self._schemas, self._all_ids
+
+    def _compile(self, query):
+        return {category.id: CompiledSchema(category)
+                for category in query.options(selectinload(Category.specifications))}
+
+    def get_many(self, category_ids):
+        """Return {category_id: CompiledSchema} for the ids that exist."""
+        version, schemas, _ = self._current()
+        missing = [category_id for category_id in category_ids if category_id not in schemas]
+        CACHE_REQUESTS.inc(len(category_ids) - len(missing), cache='category_schema', result='hit')
+        CACHE_REQUESTS.inc(len(missing), cache='category_schema', result='miss')
+        if missing:
+            compiled = self._compile(Category.query.filter(Category.id.in_(missing)))
+            self._store(version, compiled)
+            schemas = {**schemas, **compiled}
+        return {category_id: schemas[category_id] for category_id in category_ids if category_id in schemas}
+
+    def get(self, category_id):
+        """Return the CompiledSchema of a category, or None if it does not exist."""
+        return self.get_many([category_id]).get(category_id)
+
+    def all(self):
+        """Return the CompiledSchema of every category, ordered by name."""
+        version, schemas, all_ids = self._current()
+        CACHE_REQUESTS.inc(cache='category_schema', result='miss' if all_ids is None else 'hit')
+        if all_ids is None:
+            compiled = self._compile(Category.query.order_by(Category.name))
+            all_ids = list(compiled)
+            self._store(version, compiled, all_ids)
+            schemas = compiled
+        return [schemas[category_id] for category_id in all_ids]
+
+    def _store(self, version, compiled, all_ids=None):
+        if version is None:
+            return
+        with self._lock:
+            if version != self._version:
+                return  # Another thread already moved on to a newer version
+            self._schemas = {**self._schemas, **compiled}
+            if all_ids is not None:
+                self._all_ids = all_ids
+
+    def clear(self):
+        """Drop every compiled schema of this process."""
+        with self._lock:
+            self._version = None
+            self._schemas = {}
+            self._all_ids = None
+
+
+category_schema_cache = CategorySchemaCache()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_categories_version(session, transaction):
+    # A later transaction may see a newer version
+    if transaction.parent is None:
+        session.info.pop(_VERSION_KEY, None)
@@ -0,0 +1,194 @@
+"""SQLite FTS5 full-text search index over items.
+
+The ``items_fts`` virtual table holds one row per item (rowid = items.id)
+covering the item's text columns, its specification values and its URLs.
+It is kept in sync by triggers on ``items`` and ``item_urls``, so every
+write path (ORM, bulk Core statements, manual SQL) updates the index.
+"""
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+from models import db
+
+FTS_TABLE = 'items_fts'
+
+# Column weights for bm25(), in the order the columns are declared below
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 3.0, 2.0, 1.0)
+
+# Private-use markers wrapped around matches by snippet(); replaced by <mark>
+# only after the snippet text has been HTML-escaped
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+# Expressions computing the indexed document of the item row ``{row}``
+_SPECS_EXPR = ("(SELECT group_concat(value, ' ') FROM json_each("
+               "CASE WHEN json_valid({row}.specification_values) "
+               "THEN {row}.specification_values ELSE '{{}}' END))")
+_URLS_EXPR = "(SELECT group_concat(url, ' ') FROM item_urls WHERE item_id = {row}.id)"
+
+
+def _insert_document_sql(row):
+    return (
+        f"INSERT INTO {FTS_TABLE}(rowid, name, brand, description, serial_number, specifications, urls) "
+        f"VALUES ({row}.id, {row}.name, {row}.brand, {row}.description, {row}.serial_number, "
+        f"{_SPECS_EXPR.format(row=row)}, {_URLS_EXPR.format(row=row)});"
+    )
+
+
+def _refresh_urls_sql(row):
+    return (
+        f"UPDATE {FTS_TABLE} SET urls = (SELECT group_concat(url, ' ') FROM item_urls "
+        f"WHERE item_id = {row}.item_id) WHERE rowid = {row}.item_id;"
+    )
+
+
+SCHEMA_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, brand, description, serial_number, specifications, urls,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+        {_insert_document_sql('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS items_fts_au
+        AFTER UPDATE OF name, brand, description, serial_number, specification_values ON items BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        {_insert_document_sql('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS item_urls_fts_ai AFTER INSERT ON item_urls BEGIN
+        {_refresh_urls_sql('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS item_urls_fts_au AFTER UPDATE ON item_urls BEGIN
+        {_refresh_urls_sql('old')}
+        {_refresh_urls_sql('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS item_urls_fts_ad AFTER DELETE ON item_urls BEGIN
+        {_refresh_urls_sql('old')}
+    END""",
+]
+
+
+def create_search_index(connection):
+    """Create the FTS table and its sync triggers if they do not exist yet.
+
+    Returns False when the database is not SQLite or lacks the FTS5 module,
+    in which case searches fall back to LIKE filtering.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        for statement in SCHEMA_STATEMENTS:
+            connection.exec_driver_sql(statement)
+    except Exception as e:
+        if 'fts5' not in str(e):
+            raise
+        print(f"[DB] FTS5 is not available, full-text search disabled: {e}")
+        return False
+    return True
+
+
+POPULATE_STATEMENTS = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, name, brand, description, serial_number, specifications, urls) "
+    f"SELECT items.id, items.name, items.brand, items.description, items.serial_number, "
+    f"{_SPECS_EXPR.format(row='items')}, {_URLS_EXPR.format(row='items')} FROM items",
+]
+
+
+def populate_search_index(connection):
+    """Re-index every item from scratch."""
+    for statement in POPULATE_STATEMENTS:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index():
+    """Create (if needed) and repopulate the search index. Returns the number of items indexed."""
+    connection = db.session.connection()
+    if not create_search_index(connection):
+        return None
+    populate_search_index(connection)
+    count = connection.exec_driver_sql(f"SELECT count(*) FROM {FTS_TABLE}").scalar()
+    db.session.commit()
+    return count
+
+
+def search_index_available():
+    """Whether the current database has the FTS index."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first() is not None
+
+
+def build_match_query(search):
+    """Turn free text typed by a user into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term and all of them must match, so
+    "gefo 30" finds "GeForce RTX 3080". Returns None if there is nothing to search.
+    """
+    terms = re.findall(r'\w+', search or '', re.UNICODE)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def highlight_snippet(snippet):
+    """Escape a snippet produced by search_items and mark the matched terms."""
+    if not snippet:
+        return Markup('')
+    escaped = str(escape(snippet))
+    return Markup(escaped.replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>'))
+
+
+def search_items(search, category_id=None, limit=None):
+    """Search the index and return hits ordered by relevance.
+
+    Args:
+        search: Free text as typed by the user
+        category_id: Optional category filter
+        limit: Maximum number of hits to return
+
+    Returns:
+        List of dicts with ``id``, ``rank`` (bm25, lower is better) and an
+        HTML-safe ``snippet`` with matches wrapped in <mark>
+    """
+    match = build_match_query(search)
+    if match is None:
+        return []
+
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    sql = (f"SELECT {FTS_TABLE}.rowid AS id, bm25({FTS_TABLE}, {weights}) AS rank, "
+           f"snippet({FTS_TABLE}, -1, :start, :end, '…', 12) AS snippet "
+           f"FROM {FTS_TABLE}")
+    params = {'match': match, 'start': _MATCH_START, 'end': _MATCH_END}
+    if category_id:
+        sql += f" JOIN items ON items.id = {FTS_TABLE}.rowid"
+    sql += f" WHERE {FTS_TABLE} MATCH :match"
+    if category_id:
+        sql += " AND items.category_id = :category_id"
+        params['category_id'] = int(category_id)
+    sql += " ORDER BY rank"
+    if limit:
+        sql += " LIMIT :limit"
+        params['limit'] = int(limit)
+
+    rows = db.session.execute(text(sql), params)
+    return [{'id': row.id, 'rank': row.rank, 'snippet': highlight_snippet(row.snippet)}
+            for row in rows]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index_after_tables(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index_before_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
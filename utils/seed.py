@@ -0,0 +1,268 @@
+"""Synthetic collections for load and scale testing.
+
+``flask seed`` fills the database with categories modelled on real
+collections (each with number, select and text specifications) and items
+with matching specification values, URLs and placeholder photos. Rows are
+inserted with one batched INSERT per table per chunk, like bulk imports
+(see utils.bulk_import), so a million items take minutes.
+
+Everything is drawn from a random.Random seeded with the given value, and
+timestamps count from a fixed date: seeding an empty database twice with
+the same arguments produces identical rows and photo files, which keeps
+benchmark runs comparable.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from PIL import Image, ImageDraw
+from models import db, Category, CategorySpecification, Item, ItemPhoto, ItemSpecValue, ItemUrl
+from utils.photo_storage import blob_path
+from utils.thumbnails import generate_thumbnails
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Distinct placeholder images shared by the seeded photos
+DEFAULT_PHOTO_POOL = 32
+
+# updated_at of the first seeded item; each further item is a minute later
+SEED_EPOCH = datetime(2024, 1, 1)
+
+# Templates of categories: (name, brands, models, specifications)
+# Specifications: (key, label, type, number (min, max, step) or select options or text choices)
+CATEGORY_TEMPLATES = (
+    ('Resistors', ('Vishay', 'Yageo', 'Bourns', 'Panasonic', 'KOA Speer'), ('CRCW', 'RC', 'CR', 'ERJ', 'RK73'), (
+        ('resistance', 'Resistance (Ω)', 'number', (1, 1000000, 1)),
+        ('tolerance', 'Tolerance (%)', 'number', (0.1, 10, 0.1)),
+        ('power', 'Power (W)', 'number', (0.0625, 2, 0.0625)),
+        ('package', 'Package', 'select', ('0402', '0603', '0805', '1206', 'THT')),
+        ('series', 'Series', 'text', ('Thick film', 'Thin film', 'Metal film', 'Carbon film')),
+    )),
+    ('Capacitors', ('Murata', 'Kemet', 'TDK', 'Nichicon', 'Samsung'), ('GRM', 'C0G', 'UVR', 'CL', 'T491'), (
+        ('capacitance', 'Capacitance (µF)', 'number', (0.00001, 10000, 0.00001)),
+        ('voltage', 'Rated voltage (V)', 'number', (4, 630, 1)),
+        ('dielectric', 'Dielectric', 'select', ('C0G', 'X7R', 'X5R', 'Y5V', 'Electrolytic', 'Tantalum')),
+        ('package', 'Package', 'select', ('0402', '0603', '0805', '1206', 'Radial', 'Axial')),
+        ('notes', 'Notes', 'text', ('Low ESR', 'Automotive grade', 'General purpose', 'High ripple current')),
+    )),
+    ('Microcontrollers', ('Microchip', 'STMicroelectronics', 'Espressif', 'Nordic', 'Raspberry Pi'),
+     ('ATmega', 'STM32', 'ESP32', 'nRF52', 'RP2040'), (
+        ('clock', 'Clock (MHz)', 'number', (8, 480, 1)),
+        ('flash', 'Flash (KiB)', 'number', (16, 4096, 16)),
+        ('ram', 'RAM (KiB)', 'number', (2, 1024, 2)),
+        ('core', 'Core', 'select', ('AVR', 'Cortex-M0+', 'Cortex-M4', 'Cortex-M7', 'Xtensa', 'RISC-V')),
+        ('package', 'Package', 'select', ('DIP', 'QFN', 'LQFP', 'BGA', 'Module')),
+        ('board', 'Board', 'text', ('Bare chip', 'Breakout', 'Dev kit', 'Arduino shield')),
+    )),
+    ('Vinyl Records', ('Blue Note', 'Columbia', 'Motown', 'Atlantic', 'Island'),
+     ('LP', 'EP', 'Single', 'Reissue', 'Box'), (
+        ('year', 'Year', 'number', (1950, 2024, 1)),
+        ('rpm', 'Speed (RPM)', 'select', ('33⅓', '45', '78')),
+        ('condition', 'Condition', 'select', ('Mint', 'Near mint', 'Very good', 'Good', 'Fair')),
+        ('genre', 'Genre', 'text', ('Jazz', 'Soul', 'Rock', 'Folk', 'Classical', 'Blues')),
+    )),
+    ('Cameras', ('Leica', 'Nikon', 'Canon', 'Olympus', 'Pentax'), ('M', 'F', 'AE', 'OM', 'K'), (
+        ('year', 'Year', 'number', (1925, 2020, 1)),
+        ('megapixels', 'Resolution (MP)', 'number', (0, 60, 0.1)),
+        ('format', 'Format', 'select', ('35mm', 'Medium format', 'APS-C', 'Full frame', 'Micro Four Thirds')),
+        ('mount', 'Lens mount', 'text', ('M39', 'F mount', 'FD', 'K mount', 'OM')),
+    )),
+    ('Coins', ('Royal Mint', 'US Mint', 'Monnaie de Paris', 'Perth Mint', 'Zecca di Roma'),
+     ('Crown', 'Dollar', 'Franc', 'Lira', 'Sovereign'), (
+        ('year', 'Year', 'number', (1800, 2024, 1)),
+        ('weight', 'Weight (g)', 'number', (1, 62.2, 0.1)),
+        ('metal', 'Metal', 'select', ('Gold', 'Silver', 'Copper', 'Nickel', 'Bronze')),
+        ('grade', 'Grade', 'select', ('MS-70', 'MS-65', 'AU-58', 'XF-45', 'VF-20', 'F-12')),
+        ('country', 'Country', 'text', ('United Kingdom', 'United States', 'France', 'Australia', 'Italy')),
+    )),
+)
+
+_NAME_WORDS = ('Classic', 'Vintage', 'Pro', 'Mini', 'Standard', 'Limited', 'Studio', 'Reference', 'Special')
+_FORM_FACTORS = ('Loose', 'Boxed', 'Reel', 'Tray', 'Sealed', 'Framed')
+_DESCRIPTION_WORDS = ('acquired', 'tested', 'original', 'spare', 'complete', 'sample', 'lot', 'working',
+                      'documented', 'restored', 'from', 'estate', 'bundle', 'unused', 'labelled')
+_PHOTO_COLORS = ((52, 101, 164), (204, 0, 0), (78, 154, 6), (196, 160, 0), (117, 80, 123), (206, 92, 0),
+                 (46, 52, 54), (143, 89, 2))
+
+
+def _number_value(rng, bounds):
+    low, high, step = bounds
+    return round(round(rng.uniform(low, high) / step) * step, 6)
+
+
+def generate_categories(rng, count):
+    """Return count category dicts (name and specifications) cycling through CATEGORY_TEMPLATES."""
+    categories = []
+    for index in range(count):
+        name, brands, models, specs = CATEGORY_TEMPLATES[index % len(CATEGORY_TEMPLATES)]
+        cycle = index // len(CATEGORY_TEMPLATES)
+        # Later copies of a template use a shuffled subset of its specifications
+        if cycle:
+            name = f'{name} {cycle + 1}'
+            specs = rng.sample(specs, rng.randint(max(1, len(specs) - 2), len(specs)))
+        categories.append({'name': name, 'brands': brands, 'models': models, 'specifications': list(specs)})
+    return categories
+
+
+def generate_item(rng, category, number):
+    """Return (item row, urls, specification values, photo count) of the number-th item of a category."""
+    brand = rng.choice(category['brands'])
+    model = f"{rng.choice(category['models'])}{rng.randint(1, 9999):04d}"
+    specs = {}
+    for key, _, spec_type, choices in category['specifications']:
+        if rng.random() < 0.1:
+            continue  # some values are left blank, as in real collections
+        if spec_type == 'number':
+            specs[key] = _number_value(rng, choices)
+        else:
+            specs[key] = rng.choice(choices)
+    item_row = {
+        'name': f'{rng.choice(_NAME_WORDS)} {model}',
+        'brand': brand,
+        'serial_number': f'{brand[:3].upper()}-{rng.getrandbits(32):08X}' if rng.random() < 0.7 else None,
+        'form_factor': rng.choice(_FORM_FACTORS),
+        'description': ' '.join(rng.choices(_DESCRIPTION_WORDS, k=rng.randint(4, 24))).capitalize() + '.',
+        'specification_values': json.dumps(specs),
+    }
+    slug = category['name'].lower().replace(' ', '-')
+    urls = [f'https://example.com/{slug}/{number}/{n}' for n in range(rng.choice((0, 0, 1, 1, 1, 2, 3)))]
+    photo_count = rng.choice((0, 1, 1, 1, 2, 3))
+    return item_row, urls, specs, photo_count
+
+
+def placeholder_photo(index):
+    """JPEG bytes of the index-th placeholder photo."""
+    color = _PHOTO_COLORS[index % len(_PHOTO_COLORS)]
+    image = Image.new('RGB', (800, 600), color)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100 + index % 7 * 40, 100, 700, 500 - index % 5 * 40), fill=tuple(255 - c for c in color))
+    draw.text((120, 120), f'#{index + 1}', fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def write_placeholder_photos(count):
+    """Store count placeholder photos as blobs with their thumbnails; returns their file paths."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filenames = []
+    for index in range(count):
+        data = placeholder_photo(index)
+        filename = blob_path(hashlib.sha256(data).hexdigest(), 'jpg')
+        path = os.path.join(upload_folder, filename)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        generate_thumbnails(upload_folder, filename)
+        filenames.append(filename)
+    return filenames
+
+
+def _insert_categories(categories):
+    existing = set(db.session.execute(
+        db.select(Category.name).where(Category.name.in_([category['name'] for category in categories]))
+    ).scalars())
+    if existing:
+        raise ValueError(f"Categories already exist: {', '.join(sorted(existing))}; seed an empty database")
+    for index, category in enumerate(categories):
+        row = Category(name=category['name'], created_at=SEED_EPOCH + timedelta(days=index))
+        for order, (key, label, spec_type, choices) in enumerate(category['specifications']):
+            spec = CategorySpecification(key=key, label=label, type=spec_type, display_order=order)
+            if spec_type == 'number':
+                spec.min_value, spec.max_value, spec.step_value = choices
+            elif spec_type == 'select':
+                spec.set_options(list(choices))
+            else:
+                spec.placeholder = f'e.g. {choices[0]}'
+            row.specifications.append(spec)
+        db.session.add(row)
+        db.session.flush()
+        category['id'] = row.id
+        category['number_keys'] = {key for key, _, spec_type, _ in category['specifications'] if spec_type == 'number'}
+    db.session.commit()
+
+
+def _insert_items(chunk, photo_files, rng):
+    """Insert (category, item_row, urls, specs, photo_count) tuples in one transaction."""
+    # Ids are assigned here: a plain executemany is several times faster than
+    # inserting with RETURNING, which SQLite runs row by row to keep the order
+    first_id = (db.session.execute(db.select(db.func.max(Item.id))).scalar() or 0) + 1
+    ids = range(first_id, first_id + len(chunk))
+
+    item_rows = []
+    url_rows = []
+    spec_rows = []
+    photo_rows = []
+    for item_id, (category, item_row, urls, specs, photo_count) in zip(ids, chunk):
+        item_rows.append(dict(item_row, id=item_id, category_id=category['id']))
+        url_rows.extend({'item_id': item_id, 'url': url} for url in urls)
+        spec_rows.extend(
+            {'item_id': item_id, 'spec_key': key, 'num_value': num_value, 'text_value': text_value}
+            for key, num_value, text_value in ItemSpecValue.project(specs, category['number_keys'])
+        )
+        if photo_files:
+            photo_rows.extend(
+                {'item_id': item_id, 'file_path': file_path, 'filename': f'photo_{n + 1}.jpg', 'is_primary': n == 0}
+                for n, file_path in enumerate(rng.sample(photo_files, min(photo_count, len(photo_files))))
+            )
+
+    # URLs go in before their items, so that the search index trigger of each
+    # item indexes them at once instead of being updated again per URL; the
+    # foreign keys are checked at commit
+    if db.session.connection().dialect.name == 'sqlite':
+        db.session.execute(db.text('PRAGMA defer_foreign_keys = ON'))
+    for table, rows in ((ItemUrl.__table__, url_rows), (Item.__table__, item_rows),
+                        (ItemSpecValue.__table__, spec_rows), (ItemPhoto.__table__, photo_rows)):
+        if rows:
+            db.session.execute(table.insert(), rows)
+    db.session.commit()
+    return len(url_rows), len(photo_rows)
+
+
+def seed_collection(categories=10, items=1000, seed=0, photo_pool=DEFAULT_PHOTO_POOL,
+                    chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Generate a synthetic collection; returns a report dict.
+
+    Items are spread over the categories at random. progress, if given, is
+    called with the number of items inserted after every chunk. Raises
+    ValueError if a category to be created exists already.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    generated = generate_categories(rng, categories)
+    _insert_categories(generated)
+    photo_files = write_placeholder_photos(photo_pool)
+
+    urls = photos = created = 0
+    chunk = []
+    per_category = {}
+    for index in range(items):
+        category = rng.choice(generated)
+        per_category[category['name']] = number = per_category.get(category['name'], 0) + 1
+        item_row, item_urls, specs, photo_count = generate_item(rng, category, number)
+        item_row['updated_at'] = SEED_EPOCH + timedelta(minutes=index)
+        chunk.append((category, item_row, item_urls, specs, photo_count))
+        if len(chunk) >= chunk_size or index == items - 1:
+            chunk_urls, chunk_photos = _insert_items(chunk, photo_files, rng)
+            urls += chunk_urls
+            photos += chunk_photos
+            created += len(chunk)
+            chunk = []
+            if progress:
+                progress(created)
+
+    seconds = time.perf_counter() - started
+    return {
+        'categories': len(generated),
+        'items': created,
+        'urls': urls,
+        'photos': photos,
+        'photo_files': len(photo_files),
+        'seconds': round(seconds, 3),
+        'items_per_second': round(created / seconds, 1) if seconds > 0 else None,
+    }
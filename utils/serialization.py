@@ -0,0 +1,136 @@
+"""ORM-free serialization of item lists.
+
+Item.to_dict() needs fully hydrated instances: every item, its category, the
+category's specifications, photos and URLs become identity-mapped objects
+before a single dict is built. For lists this module selects only the
+columns the dict needs, aggregates photos and URLs into JSON arrays in SQL
+(``json_group_array``) and builds the dicts directly from the rows, taking
+category schemas from utils.schema_cache. The output is identical to
+``[item.to_dict() for item in items]``.
+"""
+import json
+from itertools import islice
+from flask import current_app, stream_with_context
+from sqlalchemy import func, select
+from models import Item, ItemPhoto, ItemUrl, Category
+from utils.schema_cache import category_schema_cache
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Rows fetched from the cursor and serialized at a time when streaming
+STREAM_BATCH_SIZE = 500
+
+
+def _json_array_of(columns, item_column, order_column):
+    """Correlated scalar subquery: JSON array of objects for one item's rows."""
+    rows = (select(*columns)
+            .where(item_column == Item.id)
+            .order_by(order_column)
+            .correlate(Item)
+            .subquery())
+    pairs = []
+    for source, column in zip(columns, rows.c):
+        pairs.extend((source.key, column))
+    return (select(func.json_group_array(func.json_object(*pairs)))
+            .select_from(rows)
+            .correlate(Item)
+            .scalar_subquery())
+
+
+def item_projection(query):
+    """Turn an Item query (filters and ordering applied) into a column projection.
+
+    The returned query yields rows with the item columns, ``category_name``
+    and the ``photos_json``/``urls_json`` aggregates; pass them to
+    serialize_item_rows(). The query must not carry loader options.
+    """
+    photos = _json_array_of((ItemPhoto.id, ItemPhoto.file_path.label('filename')),
+                            ItemPhoto.item_id, ItemPhoto.id)
+    urls = _json_array_of((ItemUrl.id, ItemUrl.url), ItemUrl.item_id, ItemUrl.id)
+    return (query
+            .outerjoin(Category, Category.id == Item.category_id)
+            .with_entities(
+                Item.id, Item.category_id, Category.name.label('category_name'),
+                Item.name, Item.brand, Item.serial_number, Item.form_factor,
+                Item.description, Item.specification_values,
+                photos.label('photos_json'), urls.label('urls_json'),
+            ))
+
+
+def _category_specifications(category_ids):
+    """Map category id -> [(key, label, display_order)] ordered like Category.specifications."""
+    schemas = category_schema_cache.get_many(sorted(category_ids))
+    return {category_id: schema.ordered_keys for category_id, schema in schemas.items()}
+
+
+def serialize_item_rows(rows):
+    """Build Item.to_dict()-shaped dicts from rows produced by item_projection()."""
+    specs_by_category = _category_specifications({row.category_id for row in rows})
+
+    items = []
+    for row in rows:
+        spec_values = json.loads(row.specification_values) if row.specification_values else {}
+        ordered_specs = [
+            {'key': key, 'label': label or key, 'value': spec_values.get(key, ''), 'display_order': display_order}
+            for key, label, display_order in specs_by_category.get(row.category_id, ())
+            if key in spec_values
+        ]
+        photos = json.loads(row.photos_json)
+        items.append({
+            'id': row.id,
+            'category_id': row.category_id,
+            'category_name': row.category_name,
+            'name': row.name,
+            'brand': row.brand,
+            'serial_number': row.serial_number,
+            'form_factor': row.form_factor,
+            'description': row.description,
+            'specification_values': spec_values,
+            'ordered_specifications': ordered_specs,
+            'photos': photos,
+            'urls': json.loads(row.urls_json),
+            'primary_photo': photos[0]['filename'] if photos else None
+        })
+    return items
+
+
+def serialize_items(query):
+    """Serialize every item matched by an Item query without loading ORM instances."""
+    return serialize_item_rows(item_projection(query).all())
+
+
+def iter_serialized_items(query, batch_size=STREAM_BATCH_SIZE):
+    """Yield the dicts of every item matched by an Item query, batch_size rows at a time.
+
+    The rows come from a server-side cursor, so memory use does not grow
+    with the number of items.
+    """
+    rows = iter(item_projection(query).yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield from serialize_item_rows(batch)
+
+
+def stream_items_response(query, ndjson=False):
+    """Stream the items matched by an Item query as a JSON array or as NDJSON.
+
+    The body has the same content as ``jsonify(serialize_items(query))`` but is
+    produced incrementally, so the first bytes go out before the last rows are read.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        if ndjson:
+            for item in iter_serialized_items(query):
+                yield dumps(item) + '\n'
+            return
+        separator = '['
+        for item in iter_serialized_items(query):
+            yield separator + dumps(item)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    mimetype = NDJSON_MIMETYPE if ndjson else current_app.json.mimetype
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
@@ -0,0 +1,114 @@
+"""Cache-friendly serving of static assets and uploaded photos.
+
+Templates link static assets with static_url(), as
+``/static/<file>?v=<fingerprint>`` where the fingerprint is a hash of the
+file's content: a changed file gets a new URL, so a response to the current
+fingerprinted URL may be cached for a year without revalidation.
+Content-addressed photo blobs and their variants (see utils.photo_storage)
+never change either. Everything else is sent with ``Cache-Control:
+no-cache`` and an ETag and Last-Modified, so browsers revalidate it with a
+conditional request answered by 304. Range requests are answered with 206.
+
+Bytes of uploads can be left to a front proxy: with ``UPLOAD_ACCEL_REDIRECT``
+set to an internal nginx location mapped to the upload folder, responses
+only carry an ``X-Accel-Redirect`` header and nginx sends the file,
+handling conditional and Range requests itself. ``USE_X_SENDFILE`` does the
+same for Apache and lighttpd through Flask's own ``X-Sendfile`` support.
+"""
+import hashlib
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# One year, the longest lifetime browsers honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Hex digits of the content hash used in fingerprinted URLs
+FINGERPRINT_LENGTH = 12
+
+# path -> (mtime_ns, size, fingerprint); rehashed only when a file changes
+_fingerprints = {}
+
+
+def asset_fingerprint(path):
+    """Short content hash of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            hasher.update(chunk)
+    fingerprint = hasher.hexdigest()[:FINGERPRINT_LENGTH]
+    _fingerprints[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+    return fingerprint
+
+
+def _static_path(filename):
+    return safe_join(current_app.static_folder, filename)
+
+
+def static_url(filename):
+    """URL of a static asset carrying the fingerprint of its current content."""
+    path = _static_path(filename)
+    fingerprint = asset_fingerprint(path) if path else None
+    if fingerprint is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=fingerprint)
+
+
+def cache_forever(response):
+    """Let browsers and proxies reuse a response for a year without revalidating it."""
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    response.cache_control.no_cache = None
+    return response
+
+
+def revalidate(response):
+    """Let browsers store a response but check it with a conditional request before reuse."""
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = None
+    return response
+
+
+def send_upload(filename, immutable=False):
+    """Send a file below the upload folder, by X-Accel-Redirect when configured.
+
+    Pass immutable for files whose content never changes under their name.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    if accel_prefix:
+        path = safe_join(upload_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+        response = current_app.response_class()
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{quote(filename)}"
+        response.content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    else:
+        response = send_from_directory(upload_folder, filename)
+    return cache_forever(response) if immutable else revalidate(response)
+
+
+def configure_static_files(app):
+    """Provide static_url() to templates and set the caching headers of static assets."""
+    app.add_template_global(static_url)
+
+    @app.after_request
+    def cache_static_assets(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+            return response
+        version = request.args.get('v')
+        path = _static_path(request.view_args.get('filename', ''))
+        if version and path and version == asset_fingerprint(path):
+            return cache_forever(response)
+        return revalidate(response)
@@ -0,0 +1,145 @@
+"""Resized variants of uploaded photos.
+
+Every photo gets a JPEG and a WebP variant at each width in
+THUMBNAIL_WIDTHS, stored as ``thumbs/<photo>.<width>.<ext>`` in the upload
+folder. Variants are upright (the EXIF orientation is applied) and carry no
+EXIF or other metadata, only the colour profile. Photos narrower than a
+width are not scaled up.
+
+Variants are written when a photo is uploaded. Photos from before that, or
+whose variants are missing for any other reason, get them generated the
+first time one is requested (see routes.frontend) or in bulk with
+``flask rebuild-thumbnails``.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import quote
+from PIL import Image, ImageOps
+
+THUMBNAIL_DIR = 'thumbs'
+
+# Covers the 80px list cells and the 160px cards at 1x to 4x pixel density
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+# Extension -> (Pillow format, save options)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def thumbnail_name(filename, width, ext):
+    return f'{filename}.{width}.{ext}'
+
+
+def parse_thumbnail_name(name):
+    """Return (photo filename, width, ext) for a variant name, or None if it is not one."""
+    parts = name.rsplit('.', 2)
+    if len(parts) != 3 or parts[2] not in THUMBNAIL_FORMATS or not parts[1].isdigit():
+        return None
+    filename, width, ext = parts[0], int(parts[1]), parts[2]
+    if width not in THUMBNAIL_WIDTHS or filename in ('', '.', '..'):
+        return None
+    return filename, width, ext
+
+
+def thumbnail_names(filename):
+    """Names of every variant of a photo, relative to the thumbnail folder."""
+    return [thumbnail_name(filename, width, ext) for width in THUMBNAIL_WIDTHS for ext in THUMBNAIL_FORMATS]
+
+
+def thumbnail_folder(upload_folder):
+    return os.path.join(upload_folder, THUMBNAIL_DIR)
+
+
+def thumbnail_url(filename, width, ext):
+    return f'/uploads/{THUMBNAIL_DIR}/{quote(thumbnail_name(filename, width, ext))}'
+
+
+def photo_srcset(filename, ext):
+    """``srcset`` attribute value listing the variants of a photo in one format."""
+    return ', '.join(f'{thumbnail_url(filename, width, ext)} {width}w' for width in THUMBNAIL_WIDTHS)
+
+
+def _save(image, path, ext):
+    pillow_format, options = THUMBNAIL_FORMATS[ext]
+    icc_profile = image.info.get('icc_profile')
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        flattened = Image.new('RGB', image.size, 'white')
+        flattened.paste(image, mask=image.getchannel('A') if image.mode == 'RGBA' else None)
+        image = flattened
+    # Written aside and renamed, so readers never see a partial file; the name
+    # is per thread, as concurrent uploads of one photo may generate it twice
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        image.save(temporary, pillow_format, icc_profile=icc_profile, **options)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def generate_thumbnails(upload_folder, filename, force=False):
+    """Write the variants of one uploaded photo; returns the number written.
+
+    Existing variants newer than the photo are kept unless force is set.
+    Files that are missing or not images are skipped, returning 0.
+    """
+    source = os.path.join(upload_folder, filename)
+    folder = thumbnail_folder(upload_folder)
+    try:
+        source_mtime = os.path.getmtime(source)
+    except OSError:
+        return 0
+    wanted = [(width, ext) for width in sorted(THUMBNAIL_WIDTHS, reverse=True) for ext in THUMBNAIL_FORMATS
+              if force or not _is_fresh(os.path.join(folder, thumbnail_name(filename, width, ext)), source_mtime)]
+    if not wanted:
+        return 0
+
+    os.makedirs(os.path.dirname(os.path.join(folder, filename)), exist_ok=True)
+    written = 0
+    try:
+        with Image.open(source) as original:
+            # JPEGs are decoded at the smallest DCT scale still covering the largest width
+            original.draft('RGB', (max(THUMBNAIL_WIDTHS), max(THUMBNAIL_WIDTHS)))
+            image = ImageOps.exif_transpose(original)
+            icc_profile = original.info.get('icc_profile')
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        # Scale down step by step from the largest width, which is cheaper than from the original
+        scaled = image
+        for width in sorted(THUMBNAIL_WIDTHS, reverse=True):
+            if scaled.width > width:
+                scaled = scaled.resize((width, max(1, round(scaled.height * width / scaled.width))),
+                                       Image.Resampling.LANCZOS, reducing_gap=3.0)
+            scaled.info = {'icc_profile': icc_profile} if icc_profile else {}
+            for ext in THUMBNAIL_FORMATS:
+                if (width, ext) in wanted:
+                    _save(scaled, os.path.join(folder, thumbnail_name(filename, width, ext)), ext)
+                    written += 1
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Error creating thumbnails for {filename}: {e}")
+    return written
+
+
+def _is_fresh(path, source_mtime):
+    try:
+        return os.path.getmtime(path) >= source_mtime
+    except OSError:
+        return False
+
+
+def rebuild_thumbnails(upload_folder, filenames, force=False, workers=None):
+    """Generate the variants of many photos on a process pool.
+
+    Yields (filename, variants written) as photos complete, in input order.
+    Resizing is CPU bound, so processes rather than threads run it in parallel.
+    """
+    filenames = list(filenames)
+    work = partial(generate_thumbnails, upload_folder, force=force)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(filenames, pool.map(work, filenames, chunksize=8))
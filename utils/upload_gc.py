@@ -0,0 +1,246 @@
+"""Collection of orphaned files in the upload folder.
+
+Files can be left behind with no ItemPhoto referring to them: blobs whose
+background removal never ran (the process exited first), thumbnails of
+such photos, temporary files of uploads interrupted by a crash, the trash
+of an interrupted delete and resumable uploads that were never finished.
+collect_orphan_uploads() finds and removes them, by ``flask gc-uploads`` or
+every ``UPLOAD_GC_INTERVAL`` seconds in the background.
+
+The folder is walked with os.scandir and compared against
+``item_photos.file_path`` one batch of paths at a time, so memory use does
+not grow with the number of files. Files younger than the grace period are
+never touched, which leaves uploads and deletes in progress alone. Photo
+blobs are released while holding the database write lock, like deleted
+photos (see utils.photo_storage), so an upload sharing one is never broken.
+"""
+import os
+import threading
+import time
+from itertools import islice
+from flask import current_app
+from utils.file_cleanup import wait_for_file_cleanup
+from utils.photo_storage import LOOKUP_BATCH_SIZE, TRASH_DIR, referenced_uploads, release_unreferenced_uploads
+from utils.resumable_uploads import PARTIAL_DIR
+from utils.thumbnails import THUMBNAIL_DIR, parse_thumbnail_name, thumbnail_folder
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker process sweeps on its own schedule
+    fcntl = None
+
+# Kinds of files reported by collect_orphan_uploads
+KINDS = ('photos', 'thumbnails', 'temporary', 'partial')
+
+# Records the time of the last background sweep, shared by all worker processes
+_STAMP_FILE = '.gc-stamp'
+
+
+def _walk(root, skip=()):
+    """Yield (path relative to root, DirEntry) of the files below root, except hidden ones and skip."""
+    pending = ['']
+    while pending:
+        prefix = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(root, prefix))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                relative = prefix + entry.name
+                if entry.name.startswith('.') or relative in skip:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(relative + '/')
+                elif entry.is_file(follow_symlinks=False):
+                    yield relative, entry
+
+
+def _older(entries, cutoff):
+    """Keep the (relative path, DirEntry) pairs last modified before cutoff, as (path, size)."""
+    for relative, entry in entries:
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime < cutoff:
+            yield relative, stat.st_size
+
+
+def _stale(entries, cutoff):
+    """Yield (size, path) of the DirEntry files last modified before cutoff."""
+    files = [(entry.path, entry) for entry in entries if entry.is_file(follow_symlinks=False)]
+    for path, size in _older(files, cutoff):
+        yield size, path
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _remove(path, dry_run):
+    if dry_run:
+        return True
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"Error deleting file {path}: {e}")
+        return False
+
+
+def collect_orphan_uploads(grace_period=None, partial_max_age=None, dry_run=False,
+                           batch_size=LOOKUP_BATCH_SIZE):
+    """Remove the files of the upload folder that nothing refers to.
+
+    Args:
+        grace_period: Seconds a file must be unmodified before it can go
+            (default: app.config['UPLOAD_GC_GRACE_PERIOD'])
+        partial_max_age: Seconds after its last chunk an unfinished resumable
+            upload is given up (default: app.config['RESUMABLE_UPLOAD_MAX_AGE'])
+        dry_run: Only report what would be removed
+        batch_size: Paths looked up per query
+
+    Returns:
+        Dict with the number of files 'scanned', the files 'removed' and
+        'bytes' reclaimed per kind (see KINDS), and the 'total_bytes'
+    """
+    config = current_app.config
+    upload_folder = config['UPLOAD_FOLDER']
+    now = time.time()
+    cutoff = now - (config['UPLOAD_GC_GRACE_PERIOD'] if grace_period is None else grace_period)
+    partial_cutoff = now - (config['RESUMABLE_UPLOAD_MAX_AGE'] if partial_max_age is None else partial_max_age)
+    report = {'scanned': 0, 'removed': dict.fromkeys(KINDS, 0), 'bytes': dict.fromkeys(KINDS, 0)}
+
+    def removed(kind, size):
+        report['removed'][kind] += 1
+        report['bytes'][kind] += size
+
+    def counted(entries):
+        for pair in entries:
+            report['scanned'] += 1
+            yield pair
+
+    # Thumbnails first, so those of orphaned photos are counted here
+    folder = thumbnail_folder(upload_folder)
+    for batch in _batches(_older(counted(_walk(folder)), cutoff), batch_size):
+        photos = {name: parse_thumbnail_name(name) for name, _ in batch}
+        referenced = referenced_uploads(parsed[0] for parsed in photos.values() if parsed)
+        for name, size in batch:
+            # Unparseable names are temporary files of an interrupted resize
+            if photos[name] is None or photos[name][0] not in referenced:
+                if _remove(os.path.join(folder, name), dry_run):
+                    removed('thumbnails', size)
+
+    photos = _older(counted(_walk(upload_folder, skip={THUMBNAIL_DIR})), cutoff)
+    for batch in _batches(photos, batch_size):
+        sizes = dict(batch)
+        orphans = set(sizes) - referenced_uploads(sizes)
+        if orphans and not dry_run:
+            # Checked again under the write lock before anything is removed
+            orphans = release_unreferenced_uploads(orphans)
+        for filename in orphans:
+            removed('photos', sizes[filename])
+
+    leftovers = []
+    with os.scandir(upload_folder) as entries:
+        leftovers.extend(entry for entry in entries if entry.name.startswith('.upload-'))
+    trash = os.path.join(upload_folder, TRASH_DIR)
+    if os.path.isdir(trash):
+        with os.scandir(trash) as entries:
+            leftovers.extend(entries)
+    report['scanned'] += len(leftovers)
+    for size, path in _stale(leftovers, cutoff):
+        if _remove(path, dry_run):
+            removed('temporary', size)
+
+    partial = os.path.join(upload_folder, PARTIAL_DIR)
+    if os.path.isdir(partial):
+        with os.scandir(partial) as entries:
+            uploads = [entry for entry in entries if not entry.name.endswith('.json')]
+        report['scanned'] += len(uploads)
+        # An upload is kept for as long as chunks keep arriving
+        for size, path in _stale(uploads, partial_cutoff):
+            if _remove(path, dry_run):
+                removed('partial', size)
+                _remove(path + '.json', dry_run)
+
+    if not dry_run:
+        wait_for_file_cleanup()
+    report['total_bytes'] = sum(report['bytes'].values())
+    return report
+
+
+class _SweepClaim:
+    """Exclusive claim on the next background sweep, shared by all processes through a stamp file."""
+
+    def __init__(self, upload_folder, interval):
+        self.path = os.path.join(upload_folder, _STAMP_FILE)
+        self.interval = interval
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # another process is sweeping
+        self.file.seek(0)
+        try:
+            last = float(self.file.read() or 0)
+        except ValueError:
+            last = 0
+        if time.time() - last < self.interval:
+            return False
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(time.time()))
+        self.file.flush()
+        return True
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+def _sweep_periodically(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                with _SweepClaim(app.config['UPLOAD_FOLDER'], interval) as claimed:
+                    if claimed:
+                        report = collect_orphan_uploads()
+                        if any(report['removed'].values()):
+                            print(f"[GC] Removed {sum(report['removed'].values())} orphaned uploads "
+                                  f"({report['total_bytes']} bytes)")
+        except Exception as e:
+            print(f"Error collecting orphaned uploads: {e}")
+
+
+def configure_upload_gc(app):
+    """Sweep the upload folder every app.config['UPLOAD_GC_INTERVAL'] seconds (0 disables).
+
+    The sweeping thread is started by the first request of each process, so
+    that it runs in gunicorn workers forked from a preloaded app; the stamp
+    file makes one of them sweep per interval.
+    """
+    interval = app.config.get('UPLOAD_GC_INTERVAL', 0)
+    if not interval:
+        return
+    started = {'pid': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_upload_gc():
+        if started['pid'] == os.getpid():
+            return
+        with lock:
+            if started['pid'] != os.getpid():
+                threading.Thread(target=_sweep_periodically, args=(app, interval),
+                                 name='upload-gc', daemon=True).start()
+                started['pid'] = os.getpid()
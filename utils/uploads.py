@@ -0,0 +1,102 @@
+"""Request size limits and streaming of uploaded files.
+
+``MAX_CONTENT_LENGTH`` bounds every request body: Werkzeug answers 413
+before reading a body whose declared length is over it, and stops reading
+one that turns out longer. ``MAX_UPLOAD_FILE_SIZE`` bounds each file in a
+multipart form.
+
+Werkzeug normally spools uploaded files to anonymous temporary files, which
+the upload code then copies. UploadRequest instead streams each file part
+straight into a temporary file in the upload folder, hashing it on the way
+and giving up with 413 as soon as the file is over the limit; storing the
+photo is then a rename (see utils.photo_storage.attach_photo).
+"""
+import hashlib
+import io
+import os
+import tempfile
+from flask import Request, current_app, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.metrics import UPLOAD_BYTES
+
+
+def readable_permissions(path):
+    """Give a file created by mkstemp (0600) the permissions of a normally created file."""
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(path, 0o666 & ~umask)
+
+
+class HashingUploadFile(io.FileIO):
+    """Temporary file in the upload folder hashing its content as it is written.
+
+    Raises RequestEntityTooLarge once more than max_size bytes are written.
+    The file is deleted on close unless claim() took it over.
+    """
+
+    def __init__(self, folder, max_size=None):
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+        super().__init__(fd, 'r+')
+        self.max_size = max_size
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._claimed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(f'Files may not be larger than {self.max_size} bytes')
+        self._hasher.update(data)
+        view = memoryview(data)
+        while view:
+            view = view[super().write(view):]
+        return len(data)
+
+    @property
+    def digest(self):
+        """SHA-256 hex digest of everything written so far."""
+        return self._hasher.hexdigest()
+
+    def claim(self):
+        """Close the file and hand its path over to the caller, who must move or remove it."""
+        self._claimed = True
+        self.close()
+        readable_permissions(self.path)
+        return self.path
+
+    def close(self):
+        if not self.closed:
+            UPLOAD_BYTES.inc(self.size, kind='multipart')
+        super().close()
+        if not self._claimed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadRequest(Request):
+    """Request streaming uploaded files into the upload folder (see HashingUploadFile)."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return HashingUploadFile(config['UPLOAD_FOLDER'], config.get('MAX_UPLOAD_FILE_SIZE'))
+
+
+def configure_uploads(app):
+    """Install UploadRequest and answer API requests over the size limits with a JSON 413."""
+    app.request_class = UploadRequest
+
+    @app.before_request
+    def parse_multipart_early():
+        # Reading the form here lets size errors surface as 413 before any
+        # view code (which may catch exceptions broadly) runs
+        if request.mimetype == 'multipart/form-data':
+            request.files
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        if request.path.startswith('/api/'):
+            return jsonify({'error': e.description}), 413
+        return e